@@ -0,0 +1,139 @@
+"""Benchmark gclicker-cli cold start, i.e. the hotkey-to-toggle path.
+
+Measures, each in a fresh interpreter:
+
+- import: `import gclicker.cli`
+- status-standalone: `gclicker-cli --status` with no GUI or daemon running
+- toggle-daemon: `gclicker-cli --toggle` against a resident daemon (null
+  backend) on a private dbus-daemon
+
+Results are printed as JSON. With --max-import-ms / --max-toggle-ms the
+script exits non-zero when a median exceeds its budget, so CI can track
+cold-start regressions.
+
+Usage:
+
+    python benchmarks/bench_cli_startup.py
+    python benchmarks/bench_cli_startup.py --runs 50 --max-toggle-ms 150 -o startup.json
+"""
+
+import argparse
+import json
+import os
+import platform
+import shutil
+import subprocess
+import sys
+import tempfile
+import time
+
+from bench_click_path import ROOT, start_private_bus, wait_for_name
+
+
+def time_command(args, env, runs):
+    """Run a command repeatedly and return its wall-clock times in milliseconds."""
+    times = []
+    for _ in range(runs):
+        started = time.perf_counter()
+        subprocess.run(args, env=env, cwd=ROOT, stdout=subprocess.DEVNULL, check=True)
+        times.append((time.perf_counter() - started) * 1000)
+    return times
+
+
+def summarize(name, times):
+    """Summarize a list of timings in milliseconds."""
+    times = sorted(times)
+    return {
+        'case': name,
+        'runs': len(times),
+        'min_ms': times[0],
+        'median_ms': times[len(times) // 2],
+        'p95_ms': times[min(len(times) - 1, int(len(times) * 0.95))],
+        'max_ms': times[-1],
+    }
+
+
+def main():
+    parser = argparse.ArgumentParser(description='Benchmark gclicker-cli cold start')
+    parser.add_argument(
+        '--runs',
+        type=int,
+        default=20,
+        help='Fresh interpreters per case (default: 20)'
+    )
+    parser.add_argument(
+        '--max-import-ms',
+        type=float,
+        help='Fail if the median import time exceeds this many milliseconds'
+    )
+    parser.add_argument(
+        '--max-toggle-ms',
+        type=float,
+        help='Fail if the median --toggle time against the daemon exceeds this'
+    )
+    parser.add_argument(
+        '-o', '--output',
+        help='Write JSON results to this file instead of stdout'
+    )
+    args = parser.parse_args()
+
+    cli = [sys.executable, '-m', 'gclicker.cli']
+    tmpdir = tempfile.mkdtemp(prefix='gclicker-bench-')
+    bus = daemon = None
+    results = []
+    try:
+        bus, address = start_private_bus(tmpdir)
+
+        env = os.environ.copy()
+        env['DBUS_SESSION_BUS_ADDRESS'] = address
+        env['XDG_RUNTIME_DIR'] = tmpdir
+        env['XDG_CONFIG_HOME'] = os.path.join(tmpdir, 'config')
+        env['XDG_CACHE_HOME'] = os.path.join(tmpdir, 'cache')
+
+        results.append(summarize('import', time_command(
+            [sys.executable, '-c', 'import gclicker.cli'], env, args.runs)))
+        results.append(summarize('status-standalone', time_command(
+            cli + ['--status'], env, args.runs)))
+
+        daemon = subprocess.Popen(cli + ['--daemon', '--backend', 'null'], env=env, cwd=ROOT,
+                                  stdout=subprocess.DEVNULL)
+        os.environ['DBUS_SESSION_BUS_ADDRESS'] = address
+        from gi.repository import Gio
+        connection = Gio.bus_get_sync(Gio.BusType.SESSION, None)
+        wait_for_name(connection, 'org.gclicker.Service')
+
+        # Each run flips the state, so an even number of runs leaves it stopped
+        results.append(summarize('toggle-daemon', time_command(
+            cli + ['--toggle'], env, args.runs + args.runs % 2)))
+    finally:
+        for proc in (daemon, bus):
+            if proc:
+                proc.terminate()
+                proc.wait()
+        shutil.rmtree(tmpdir, ignore_errors=True)
+
+    report = {
+        'benchmark': 'cli_startup',
+        'python': platform.python_version(),
+        'platform': platform.platform(),
+        'results': results,
+    }
+    output = json.dumps(report, indent=2)
+    if args.output:
+        with open(args.output, 'w') as f:
+            f.write(output + '\n')
+    else:
+        print(output)
+
+    medians = {result['case']: result['median_ms'] for result in results}
+    failed = False
+    for case, budget in (('import', args.max_import_ms), ('toggle-daemon', args.max_toggle_ms)):
+        if budget is not None and medians[case] > budget:
+            print(f"{case}: median {medians[case]:.1f} ms exceeds budget of {budget:.1f} ms",
+                  file=sys.stderr)
+            failed = True
+    sys.exit(1 if failed else 0)
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,250 @@
+"""Benchmark the click path against a stand-in RemoteDesktop portal.
+
+Starts a private dbus-daemon and benchmarks/fake_portal.py, then drives the
+portal backend at a range of intervals and dispatch modes. Achieved rate and
+jitter are measured from the timestamps the fake portal records; CPU time and
+memory are measured in this process. Results are printed as JSON.
+
+Usage:
+
+    python benchmarks/bench_click_path.py
+    python benchmarks/bench_click_path.py --intervals 0.01,0.001 --duration 10 -o bench.json
+"""
+
+import argparse
+import json
+import math
+import os
+import platform
+import resource
+import shutil
+import subprocess
+import sys
+import tempfile
+import time
+
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+sys.path.insert(0, ROOT)
+
+
+BUS_CONFIG = '''<!DOCTYPE busconfig PUBLIC "-//freedesktop//DTD D-Bus Bus Configuration 1.0//EN"
+ "http://www.freedesktop.org/standards/dbus/1.0/busconfig.dtd">
+<busconfig>
+  <type>session</type>
+  <listen>unix:dir={tmpdir}</listen>
+  <policy context="default">
+    <allow send_destination="*" eavesdrop="true"/>
+    <allow eavesdrop="true"/>
+    <allow own="*"/>
+  </policy>
+</busconfig>
+'''
+
+# Configuration name -> (backend, backend options)
+CONFIGURATIONS = {
+    'null': ('null', {}),
+    'portal-sync': ('portal', {'dispatch': 'sync'}),
+    'portal-async': ('portal', {'dispatch': 'async'}),
+    'portal-eis': ('portal', {'use_eis': True}),
+    'null-glib': ('null', {'event_loop': 'glib'}),
+    'portal-async-glib': ('portal', {'dispatch': 'async', 'event_loop': 'glib'}),
+}
+
+
+def start_private_bus(tmpdir):
+    """Start a private dbus-daemon and return (process, address)."""
+    config = os.path.join(tmpdir, 'bus.conf')
+    with open(config, 'w') as f:
+        f.write(BUS_CONFIG.format(tmpdir=tmpdir))
+
+    proc = subprocess.Popen(
+        ['dbus-daemon', '--config-file', config, '--nofork', '--print-address=1'],
+        stdout=subprocess.PIPE,
+        text=True
+    )
+    address = proc.stdout.readline().strip()
+    if not address:
+        proc.kill()
+        raise RuntimeError("dbus-daemon did not report an address")
+    return proc, address
+
+
+def wait_for_name(connection, name, timeout=10.0):
+    """Wait until a bus name has an owner."""
+    from gi.repository import Gio, GLib
+
+    deadline = time.monotonic() + timeout
+    while time.monotonic() < deadline:
+        result = connection.call_sync(
+            'org.freedesktop.DBus', '/org/freedesktop/DBus', 'org.freedesktop.DBus',
+            'NameHasOwner', GLib.Variant('(s)', (name,)), GLib.VariantType('(b)'),
+            Gio.DBusCallFlags.NONE, -1, None
+        )
+        if result[0]:
+            return
+        time.sleep(0.05)
+    raise RuntimeError(f"Timeout waiting for {name}")
+
+
+def take_events(connection):
+    """Fetch and clear the button events recorded by the fake portal."""
+    from gi.repository import Gio, GLib
+
+    result = connection.call_sync(
+        'org.freedesktop.portal.Desktop', '/org/gclicker/Bench', 'org.gclicker.Bench',
+        'TakeEvents', None, GLib.VariantType('(a(diu))'), Gio.DBusCallFlags.NONE, -1, None
+    )
+    return result[0]
+
+
+def rss_kb():
+    """Get the current resident set size in KiB."""
+    with open('/proc/self/statm') as f:
+        pages = int(f.read().split()[1])
+    return pages * os.sysconf('SC_PAGE_SIZE') // 1024
+
+
+def summarize_presses(timestamps):
+    """Compute achieved rate and inter-click jitter from press timestamps."""
+    result = {'received': len(timestamps), 'achieved_rate': 0.0, 'jitter_ms': 0.0,
+              'max_gap_ms': 0.0}
+    if len(timestamps) < 2:
+        return result
+
+    gaps = [b - a for a, b in zip(timestamps, timestamps[1:])]
+    result['achieved_rate'] = len(gaps) / (timestamps[-1] - timestamps[0])
+    mean = sum(gaps) / len(gaps)
+    result['jitter_ms'] = math.sqrt(sum((g - mean) ** 2 for g in gaps) / len(gaps)) * 1000
+    result['max_gap_ms'] = max(gaps) * 1000
+    return result
+
+
+def run_one(name, interval, duration, connection):
+    """Run one configuration at one interval and return its measurements."""
+    from gclicker.engine import create_clicker
+
+    backend, options = CONFIGURATIONS[name]
+    clicker = create_clicker(interval, backend, **options)
+    if not clicker.start():
+        clicker.cleanup()
+        return {'config': name, 'interval': interval, 'error': 'start failed'}
+
+    if connection is not None:
+        take_events(connection)  # Drop anything recorded during setup
+
+    rss_before = rss_kb()
+    usage_before = resource.getrusage(resource.RUSAGE_SELF)
+    started = time.monotonic()
+    time.sleep(duration)
+    clicker.stop()
+    elapsed = time.monotonic() - started
+    usage_after = resource.getrusage(resource.RUSAGE_SELF)
+    rss_after = rss_kb()
+
+    if connection is not None:
+        presses = [t for t, _button, state in take_events(connection) if state == 1]
+    else:
+        presses = [t for t, _button, state in clicker.backend.events if state == 1]
+
+    stats = clicker.get_stats()
+    clicker.cleanup()
+
+    cpu = ((usage_after.ru_utime - usage_before.ru_utime) +
+           (usage_after.ru_stime - usage_before.ru_stime))
+
+    result = {
+        'config': name,
+        'interval': interval,
+        'requested_rate': 1.0 / interval,
+        'duration': elapsed,
+        'clicks_sent': stats['clicks'],
+        'errors': stats['errors'],
+        'missed_deadlines': stats['missed'],
+        'latency_p50_ms': stats['latency_p50'] * 1000,
+        'latency_p99_ms': stats['latency_p99'] * 1000,
+        'cpu_seconds': cpu,
+        'cpu_percent': 100.0 * cpu / elapsed,
+        'rss_kb': rss_after,
+        'rss_delta_kb': rss_after - rss_before,
+    }
+    result.update(summarize_presses(presses))
+    return result
+
+
+def main():
+    parser = argparse.ArgumentParser(description='Benchmark the gclicker click path')
+    parser.add_argument(
+        '--intervals',
+        default='0.1,0.01,0.005,0.002,0.001',
+        help='Comma-separated click intervals in seconds'
+    )
+    parser.add_argument(
+        '--configs',
+        default=','.join(CONFIGURATIONS),
+        help=f"Comma-separated configurations (default: {','.join(CONFIGURATIONS)})"
+    )
+    parser.add_argument(
+        '--duration',
+        type=float,
+        default=5.0,
+        help='Seconds to click for each run (default: 5)'
+    )
+    parser.add_argument(
+        '-o', '--output',
+        help='Write JSON results to this file instead of stdout'
+    )
+    args = parser.parse_args()
+
+    intervals = [float(i) for i in args.intervals.split(',')]
+    configs = args.configs.split(',')
+    for name in configs:
+        if name not in CONFIGURATIONS:
+            parser.error(f"Unknown configuration: {name}")
+
+    tmpdir = tempfile.mkdtemp(prefix='gclicker-bench-')
+    bus = portal = None
+    try:
+        bus, address = start_private_bus(tmpdir)
+
+        # Must be set before GLib connects to the session bus
+        os.environ['DBUS_SESSION_BUS_ADDRESS'] = address
+        os.environ['XDG_CACHE_HOME'] = os.path.join(tmpdir, 'cache')
+
+        from gi.repository import Gio
+
+        portal = subprocess.Popen([sys.executable, os.path.join(ROOT, 'benchmarks', 'fake_portal.py')])
+        connection = Gio.bus_get_sync(Gio.BusType.SESSION, None)
+        wait_for_name(connection, 'org.freedesktop.portal.Desktop')
+
+        results = []
+        for name in configs:
+            for interval in intervals:
+                uses_portal = CONFIGURATIONS[name][0] == 'portal'
+                result = run_one(name, interval, args.duration, connection if uses_portal else None)
+                print(f"{name:>14} {interval * 1000:8.3f} ms: "
+                      f"{result.get('achieved_rate', 0.0):9.1f}/s", file=sys.stderr)
+                results.append(result)
+    finally:
+        for proc in (portal, bus):
+            if proc:
+                proc.terminate()
+                proc.wait()
+        shutil.rmtree(tmpdir, ignore_errors=True)
+
+    report = {
+        'benchmark': 'click_path',
+        'python': platform.python_version(),
+        'platform': platform.platform(),
+        'duration': args.duration,
+        'results': results,
+    }
+    output = json.dumps(report, indent=2)
+    if args.output:
+        with open(args.output, 'w') as f:
+            f.write(output + '\n')
+    else:
+        print(output)
+
+
+if __name__ == '__main__':
+    main()
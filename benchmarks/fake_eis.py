@@ -0,0 +1,112 @@
+"""Stand-in EIS implementation for benchmarks and tests.
+
+Speaks just enough of the ei protocol to hand one sender client a resumed
+button device, and records every button event it receives. Does not need
+GLib, so the tests can drive it over a socketpair.
+"""
+
+import os
+import struct
+import sys
+import threading
+import time
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from gclicker import eis
+
+
+class EventLog:
+    """Thread-safe list of (timestamp, button, state) events."""
+
+    def __init__(self):
+        self._lock = threading.Lock()
+        self._events = []
+
+    def add(self, button, state):
+        timestamp = time.monotonic()
+        with self._lock:
+            self._events.append((timestamp, button, state))
+
+    def take(self):
+        with self._lock:
+            events, self._events = self._events, []
+        return events
+
+
+class FakeEisServer:
+    """Stand-in EIS implementation that logs button events from one client."""
+
+    SEAT_ID = 0xff00000000000001
+    CONNECTION_ID = 0xff00000000000002
+    DEVICE_ID = 0xff00000000000003
+    BUTTON_ID = 0xff00000000000004
+    BUTTON_MASK = 0x4
+
+    def __init__(self, sock, log):
+        self._sock = sock
+        self._log = log
+        self._serial = 0
+        self._send_lock = threading.Lock()
+        self.requests = []  # (object id, opcode, payload) of every request received
+
+    def _send(self, object_id, opcode, payload=b''):
+        with self._send_lock:
+            self._sock.sendall(eis.HEADER.pack(object_id, eis.HEADER.size + len(payload), opcode) +
+                               payload)
+
+    def _next_serial(self):
+        self._serial += 1
+        return self._serial
+
+    def pause(self):
+        """Pause the button device, as a compositor does e.g. while the screen is locked."""
+        self._send(self.DEVICE_ID, eis.DEVICE_EV_PAUSED, struct.pack('=I', self._next_serial()))
+
+    def resume(self):
+        """Resume the button device after pause()."""
+        self._send(self.DEVICE_ID, eis.DEVICE_EV_RESUMED, struct.pack('=I', self._next_serial()))
+
+    def serve(self):
+        """Serve the client until it disconnects."""
+        self._send(0, eis.HANDSHAKE_EV_HANDSHAKE_VERSION, struct.pack('=I', 1))
+        buffer = b''
+        try:
+            while True:
+                data = self._sock.recv(65536)
+                if not data:
+                    break
+                buffer += data
+                while len(buffer) >= eis.HEADER.size:
+                    object_id, length, opcode = eis.HEADER.unpack_from(buffer)
+                    if len(buffer) < length:
+                        break
+                    self._handle(object_id, opcode, buffer[eis.HEADER.size:length])
+                    buffer = buffer[length:]
+        except OSError:
+            pass
+        finally:
+            self._sock.close()
+
+    def _handle(self, object_id, opcode, payload):
+        self.requests.append((object_id, opcode, payload))
+
+        if object_id == 0 and opcode == eis.HANDSHAKE_REQ_FINISH:
+            self._send(0, eis.HANDSHAKE_EV_CONNECTION,
+                       struct.pack('=IQI', self._next_serial(), self.CONNECTION_ID, 1))
+            self._send(self.CONNECTION_ID, eis.CONNECTION_EV_SEAT, struct.pack('=QI', self.SEAT_ID, 1))
+            self._send(self.SEAT_ID, eis.SEAT_EV_CAPABILITY,
+                       struct.pack('=Q', self.BUTTON_MASK) + eis._pack_string('ei_button'))
+            self._send(self.SEAT_ID, eis.SEAT_EV_DONE)
+
+        elif object_id == self.SEAT_ID and opcode == eis.SEAT_REQ_BIND:
+            self._send(self.SEAT_ID, eis.SEAT_EV_DEVICE, struct.pack('=QI', self.DEVICE_ID, 1))
+            self._send(self.DEVICE_ID, eis.DEVICE_EV_INTERFACE,
+                       struct.pack('=Q', self.BUTTON_ID) + eis._pack_string('ei_button') +
+                       struct.pack('=I', 1))
+            self._send(self.DEVICE_ID, eis.DEVICE_EV_DONE)
+            self.resume()
+
+        elif object_id == self.BUTTON_ID and opcode == eis.BUTTON_REQ_BUTTON:
+            button, state = struct.unpack_from('=II', payload)
+            self._log.add(button, state)
@@ -0,0 +1,210 @@
+"""Stand-in org.freedesktop.portal.Desktop for benchmarking the click path.
+
+Implements the RemoteDesktop calls gclicker uses (CreateSession,
+SelectDevices, Start, NotifyPointerButton and optionally ConnectToEIS) and
+timestamps every button event it receives. Recorded events are fetched and
+cleared with org.gclicker.Bench.TakeEvents.
+
+Run it on a private bus (see bench_click_path.py):
+
+    DBUS_SESSION_BUS_ADDRESS=... python benchmarks/fake_portal.py
+"""
+
+import argparse
+import os
+import socket
+import sys
+import threading
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from gi.repository import Gio, GLib
+
+from fake_eis import EventLog, FakeEisServer
+
+
+BUS_NAME = 'org.freedesktop.portal.Desktop'
+PORTAL_PATH = '/org/freedesktop/portal/desktop'
+BENCH_PATH = '/org/gclicker/Bench'
+
+PORTAL_XML = '''
+<node>
+  <interface name='org.freedesktop.portal.RemoteDesktop'>
+    <method name='CreateSession'>
+      <arg type='a{sv}' name='options' direction='in'/>
+      <arg type='o' name='handle' direction='out'/>
+    </method>
+    <method name='SelectDevices'>
+      <arg type='o' name='session_handle' direction='in'/>
+      <arg type='a{sv}' name='options' direction='in'/>
+      <arg type='o' name='handle' direction='out'/>
+    </method>
+    <method name='Start'>
+      <arg type='o' name='session_handle' direction='in'/>
+      <arg type='s' name='parent_window' direction='in'/>
+      <arg type='a{sv}' name='options' direction='in'/>
+      <arg type='o' name='handle' direction='out'/>
+    </method>
+    <method name='NotifyPointerButton'>
+      <arg type='o' name='session_handle' direction='in'/>
+      <arg type='a{sv}' name='options' direction='in'/>
+      <arg type='i' name='button' direction='in'/>
+      <arg type='u' name='state' direction='in'/>
+    </method>
+    <method name='ConnectToEIS'>
+      <arg type='o' name='session_handle' direction='in'/>
+      <arg type='a{sv}' name='options' direction='in'/>
+      <arg type='h' name='fd' direction='out'/>
+    </method>
+    <property name='AvailableDeviceTypes' type='u' access='read'/>
+    <property name='version' type='u' access='read'/>
+  </interface>
+</node>
+'''
+
+SESSION_XML = '''
+<node>
+  <interface name='org.freedesktop.portal.Session'>
+    <method name='Close'/>
+    <signal name='Closed'>
+      <arg type='a{sv}' name='details'/>
+    </signal>
+  </interface>
+</node>
+'''
+
+BENCH_XML = '''
+<node>
+  <interface name='org.gclicker.Bench'>
+    <method name='TakeEvents'>
+      <arg type='a(diu)' name='events' direction='out'/>
+    </method>
+  </interface>
+</node>
+'''
+
+
+def sender_path_component(sender):
+    """Convert a unique bus name to the form used in portal object paths."""
+    return sender[1:].replace('.', '_')
+
+
+class FakePortal:
+    """Minimal RemoteDesktop portal that records button events."""
+
+    def __init__(self, version):
+        self.version = version
+        self.log = EventLog()
+        self.connection = None
+        self._session_info = Gio.DBusNodeInfo.new_for_xml(SESSION_XML).interfaces[0]
+        self._sessions = {}
+        self._session_count = 0
+
+    def start(self):
+        self.connection = Gio.bus_get_sync(Gio.BusType.SESSION, None)
+        portal_info = Gio.DBusNodeInfo.new_for_xml(PORTAL_XML).interfaces[0]
+        bench_info = Gio.DBusNodeInfo.new_for_xml(BENCH_XML).interfaces[0]
+        self.connection.register_object(
+            PORTAL_PATH, portal_info, self._handle_portal_call, self._get_property, None
+        )
+        self.connection.register_object(BENCH_PATH, bench_info, self._handle_bench_call, None, None)
+        Gio.bus_own_name_on_connection(
+            self.connection, BUS_NAME, Gio.BusNameOwnerFlags.NONE, None, None
+        )
+
+    def _get_property(self, connection, sender, object_path, interface_name, property_name):
+        if property_name == 'version':
+            return GLib.Variant('u', self.version)
+        if property_name == 'AvailableDeviceTypes':
+            return GLib.Variant('u', 3)
+        return None
+
+    def _respond(self, sender, handle_token, results):
+        """Emit Request.Response for a request once the method call has returned."""
+        request_path = f"{PORTAL_PATH}/request/{sender_path_component(sender)}/{handle_token}"
+
+        def emit():
+            self.connection.emit_signal(
+                sender, request_path, 'org.freedesktop.portal.Request', 'Response',
+                GLib.Variant('(ua{sv})', (0, results))
+            )
+            return False
+
+        GLib.idle_add(emit)
+        return request_path
+
+    def _handle_portal_call(self, connection, sender, object_path, interface_name,
+                            method_name, parameters, invocation):
+        if method_name == 'NotifyPointerButton':
+            self.log.add(parameters[2], parameters[3])
+            invocation.return_value(None)
+
+        elif method_name == 'CreateSession':
+            options = parameters[0]
+            session_path = (f"{PORTAL_PATH}/session/{sender_path_component(sender)}/"
+                            f"{options['session_handle_token']}")
+            self._sessions[session_path] = connection.register_object(
+                session_path, self._session_info, self._handle_session_call, None, None
+            )
+            request_path = self._respond(sender, options['handle_token'],
+                                         {'session_handle': GLib.Variant('s', session_path)})
+            invocation.return_value(GLib.Variant('(o)', (request_path,)))
+
+        elif method_name == 'SelectDevices':
+            options = parameters[1]
+            request_path = self._respond(sender, options['handle_token'], {})
+            invocation.return_value(GLib.Variant('(o)', (request_path,)))
+
+        elif method_name == 'Start':
+            options = parameters[2]
+            self._session_count += 1
+            request_path = self._respond(sender, options['handle_token'], {
+                'devices': GLib.Variant('u', 2),
+                'restore_token': GLib.Variant('s', f"bench-token-{self._session_count}"),
+            })
+            invocation.return_value(GLib.Variant('(o)', (request_path,)))
+
+        elif method_name == 'ConnectToEIS' and self.version >= 2:
+            server_sock, client_sock = socket.socketpair()
+            threading.Thread(
+                target=FakeEisServer(server_sock, self.log).serve, daemon=True
+            ).start()
+            fd_list = Gio.UnixFDList.new()
+            fd_list.append(client_sock.fileno())
+            client_sock.close()
+            invocation.return_value_with_unix_fd_list(GLib.Variant('(h)', (0,)), fd_list)
+
+        else:
+            invocation.return_dbus_error(
+                'org.freedesktop.DBus.Error.UnknownMethod', f"Unknown method: {method_name}"
+            )
+
+    def _handle_session_call(self, connection, sender, object_path, interface_name,
+                             method_name, parameters, invocation):
+        registration_id = self._sessions.pop(object_path, None)
+        if registration_id:
+            connection.unregister_object(registration_id)
+        invocation.return_value(None)
+
+    def _handle_bench_call(self, connection, sender, object_path, interface_name,
+                           method_name, parameters, invocation):
+        invocation.return_value(GLib.Variant('(a(diu))', (self.log.take(),)))
+
+
+def main():
+    parser = argparse.ArgumentParser(description='Stand-in RemoteDesktop portal for benchmarks')
+    parser.add_argument(
+        '--version',
+        type=int,
+        default=2,
+        help='RemoteDesktop interface version to report (ConnectToEIS needs 2, default: 2)'
+    )
+    args = parser.parse_args()
+
+    portal = FakePortal(args.version)
+    portal.start()
+    GLib.MainLoop().run()
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,356 @@
+"""Click backends: how button events reach the compositor or kernel."""
+
+import collections
+import fcntl
+import os
+import struct
+import time
+
+
+# Linux input event codes
+BTN_LEFT = 0x110
+BTN_RIGHT = 0x111
+BTN_MIDDLE = 0x112
+
+# Buttons by the names the CLI and D-Bus interface accept
+BUTTON_NAMES = {'left': BTN_LEFT, 'right': BTN_RIGHT, 'middle': BTN_MIDDLE}
+
+# Backend capabilities
+CAP_BUTTON = 'button'        # Can press and release pointer buttons
+CAP_PIPELINED = 'pipelined'  # press/release return before delivery is acknowledged
+CAP_HEADLESS = 'headless'    # Works without a compositor or portal session
+CAP_MOTION = 'motion'        # Can move the pointer and scroll
+CAP_KEYBOARD = 'keyboard'    # Can press and release keys
+
+BACKEND_NAMES = ('portal', 'uinput', 'null')
+
+
+class UnsupportedEvent(NotImplementedError):
+    """The backend cannot send this kind of event, e.g. keys without CAP_KEYBOARD."""
+
+
+class ClickBackend:
+    """
+    Base class for click backends.
+
+    A backend only injects events; scheduling is done by ClickEngine.
+    """
+
+    name = None
+    capabilities = frozenset()
+
+    # Errors reported outside press()/release(), e.g. by pipelined replies
+    # or setup, and the message of the most recent one
+    errors = 0
+    last_error = ''
+
+    def has_capability(self, capability):
+        """Check if the backend supports a capability (one of the CAP_* constants)."""
+        return capability in self.capabilities
+
+    def setup(self):
+        """
+        Prepare the backend for clicking. May block (e.g. on a permission dialog).
+
+        Returns:
+            True if the backend is ready, False otherwise
+        """
+        raise NotImplementedError
+
+    def setup_async(self, callback):
+        """
+        Prepare the backend without blocking the calling thread's main loop.
+
+        Backends without asynchronous setup just run setup().
+
+        Args:
+            callback: Called as callback(success, error) when setup finishes
+        """
+        success = self.setup()
+        callback(success, None if success else f"{self.name} backend setup failed")
+
+    def prewarm(self):
+        """
+        Start setting up in the background if that needs no user interaction.
+
+        Called when a long-lived front end starts, so the first click does
+        not wait for setup. Backends whose setup is cheap do nothing.
+        """
+
+    def is_ready(self):
+        """Check if setup() has completed successfully."""
+        raise NotImplementedError
+
+    def recover(self):
+        """
+        Try to get working again after clicks kept failing.
+
+        Called by the engine from its click thread when its circuit breaker
+        opens. Must not block; backends that cannot recover do nothing.
+        """
+
+    def press(self, button=BTN_LEFT):
+        """Press a button."""
+        raise NotImplementedError
+
+    def release(self, button=BTN_LEFT):
+        """Release a button."""
+        raise NotImplementedError
+
+    def move(self, dx, dy):
+        """Move the pointer by dx, dy (CAP_MOTION)."""
+        raise UnsupportedEvent(f"the {self.name} backend cannot move the pointer")
+
+    def scroll(self, dx, dy):
+        """Scroll by dx, dy, in the units of the portal's NotifyPointerAxis (CAP_MOTION)."""
+        raise UnsupportedEvent(f"the {self.name} backend cannot scroll")
+
+    def key(self, keycode, pressed):
+        """Press or release a key by evdev key code (CAP_KEYBOARD)."""
+        raise UnsupportedEvent(f"the {self.name} backend cannot press keys")
+
+    def set_dispatch_context(self, context):
+        """
+        Deliver completions of pipelined events on a GLib.MainContext.
+
+        Called on the click thread by engines that run their own main loop
+        there, and with None when that loop ends. Backends without
+        asynchronous completions ignore it.
+        """
+
+    def flush(self):
+        """Wait briefly for events that have been sent but not yet acknowledged."""
+
+    def interrupt(self):
+        """Abort any blocking wait in press()/release(), called from another thread."""
+
+    def close(self):
+        """Release all resources held by the backend."""
+
+
+class NullBackend(ClickBackend):
+    """Backend that records button and key events instead of injecting them."""
+
+    name = 'null'
+    capabilities = frozenset({CAP_BUTTON, CAP_HEADLESS, CAP_MOTION, CAP_KEYBOARD})
+
+    def __init__(self, max_events=10000):
+        """
+        Initialize the null backend.
+
+        Args:
+            max_events: Number of recent events to keep (0 to only count them)
+        """
+        self.events = collections.deque(maxlen=max_events) if max_events else None
+        self.presses = 0
+        self.releases = 0
+        self.moves = 0
+        self.scrolls = 0
+        self.keys = 0
+        self._ready = False
+
+    def setup(self):
+        """Nothing to set up."""
+        self._ready = True
+        return True
+
+    def is_ready(self):
+        """Check if setup() has been called."""
+        return self._ready
+
+    def press(self, button=BTN_LEFT):
+        """Record a press."""
+        self.presses += 1
+        if self.events is not None:
+            self.events.append((time.monotonic(), button, 1))
+
+    def release(self, button=BTN_LEFT):
+        """Record a release."""
+        self.releases += 1
+        if self.events is not None:
+            self.events.append((time.monotonic(), button, 0))
+
+    def move(self, dx, dy):
+        """Count a pointer motion."""
+        self.moves += 1
+
+    def scroll(self, dx, dy):
+        """Count a scroll."""
+        self.scrolls += 1
+
+    def key(self, keycode, pressed):
+        """Record a key press or release."""
+        self.keys += 1
+        if self.events is not None:
+            self.events.append((time.monotonic(), keycode, int(pressed)))
+
+    def close(self):
+        """Stop accepting events."""
+        self._ready = False
+
+
+class UinputBackend(ClickBackend):
+    """Backend that injects events through a virtual /dev/uinput mouse and keyboard."""
+
+    name = 'uinput'
+    capabilities = frozenset({CAP_BUTTON, CAP_HEADLESS, CAP_MOTION, CAP_KEYBOARD})
+
+    # From linux/uinput.h and linux/input-event-codes.h
+    UI_DEV_CREATE = 0x5501
+    UI_DEV_DESTROY = 0x5502
+    UI_DEV_SETUP = 0x405c5503
+    UI_SET_EVBIT = 0x40045564
+    UI_SET_KEYBIT = 0x40045565
+    UI_SET_RELBIT = 0x40045566
+    EV_SYN = 0x00
+    EV_KEY = 0x01
+    EV_REL = 0x02
+    SYN_REPORT = 0
+    REL_X = 0x00
+    REL_Y = 0x01
+    REL_HWHEEL = 0x06
+    REL_WHEEL = 0x08
+    KEY_MAX_KEYBOARD = 0xf8  # Keys 1 (KEY_ESC) up to KEY_MICMUTE
+    BUS_VIRTUAL = 0x06
+
+    # Scroll units per wheel notch, as for the portal's NotifyPointerAxis
+    SCROLL_STEP = 10.0
+
+    # struct input_event: struct timeval, type, code, value
+    INPUT_EVENT = struct.Struct('llHHi')
+    # struct uinput_setup: struct input_id, name[80], ff_effects_max
+    UINPUT_SETUP = struct.Struct('HHHH80sI')
+
+    def __init__(self, device='/dev/uinput', name='gclicker virtual pointer'):
+        """
+        Initialize the uinput backend.
+
+        Args:
+            device: Path to the uinput device node
+            name: Name of the virtual input device
+        """
+        self.device = device
+        self.device_name = name
+        self._fd = None
+        # Button event followed by SYN_REPORT, prebuilt per (button, state)
+        self._reports = {}
+        # Scroll not yet sent because it was less than a wheel notch
+        self._scroll_rest = [0.0, 0.0]
+
+    def setup(self):
+        """Create the virtual pointer device."""
+        if self._fd is not None:
+            return True
+
+        try:
+            fd = os.open(self.device, os.O_WRONLY | os.O_NONBLOCK)
+        except OSError as e:
+            print(f"Could not open {self.device}: {e}")
+            return False
+
+        try:
+            fcntl.ioctl(fd, self.UI_SET_EVBIT, self.EV_KEY)
+            for button in (BTN_LEFT, BTN_RIGHT, BTN_MIDDLE):
+                fcntl.ioctl(fd, self.UI_SET_KEYBIT, button)
+            for keycode in range(1, self.KEY_MAX_KEYBOARD + 1):
+                fcntl.ioctl(fd, self.UI_SET_KEYBIT, keycode)
+
+            # Relative axes make the device show up as a mouse
+            fcntl.ioctl(fd, self.UI_SET_EVBIT, self.EV_REL)
+            for axis in (self.REL_X, self.REL_Y, self.REL_HWHEEL, self.REL_WHEEL):
+                fcntl.ioctl(fd, self.UI_SET_RELBIT, axis)
+
+            setup = self.UINPUT_SETUP.pack(
+                self.BUS_VIRTUAL, 0, 0, 1, self.device_name.encode()[:79], 0
+            )
+            fcntl.ioctl(fd, self.UI_DEV_SETUP, setup)
+            fcntl.ioctl(fd, self.UI_DEV_CREATE)
+        except OSError as e:
+            os.close(fd)
+            print(f"Could not create uinput device: {e}")
+            return False
+
+        self._fd = fd
+        return True
+
+    def is_ready(self):
+        """Check if the virtual device exists."""
+        return self._fd is not None
+
+    def _report(self, button, state):
+        report = self._reports.get((button, state))
+        if report is None:
+            # The kernel fills in the timestamp when it is zero
+            report = (self.INPUT_EVENT.pack(0, 0, self.EV_KEY, button, state) +
+                      self.INPUT_EVENT.pack(0, 0, self.EV_SYN, self.SYN_REPORT, 0))
+            self._reports[(button, state)] = report
+        return report
+
+    def press(self, button=BTN_LEFT):
+        """Press a button."""
+        os.write(self._fd, self._report(button, 1))
+
+    def release(self, button=BTN_LEFT):
+        """Release a button."""
+        os.write(self._fd, self._report(button, 0))
+
+    def _write_events(self, events):
+        """Write (type, code, value) events followed by SYN_REPORT."""
+        pack = self.INPUT_EVENT.pack
+        data = b''.join(pack(0, 0, event_type, code, value) for event_type, code, value in events)
+        os.write(self._fd, data + pack(0, 0, self.EV_SYN, self.SYN_REPORT, 0))
+
+    def move(self, dx, dy):
+        """Move the pointer by whole device units."""
+        self._write_events([(self.EV_REL, self.REL_X, round(dx)),
+                            (self.EV_REL, self.REL_Y, round(dy))])
+
+    def scroll(self, dx, dy):
+        """Scroll by wheel notches, carrying over fractions of a notch."""
+        events = []
+        # The wheel axis counts up when scrolling up, unlike the portal's dy
+        for index, (axis, value, sign) in enumerate(((self.REL_HWHEEL, dx, 1),
+                                                     (self.REL_WHEEL, dy, -1))):
+            total = self._scroll_rest[index] + value / self.SCROLL_STEP
+            notches = int(total)
+            self._scroll_rest[index] = total - notches
+            if notches:
+                events.append((self.EV_REL, axis, sign * notches))
+        if events:
+            self._write_events(events)
+
+    def key(self, keycode, pressed):
+        """Press or release a key."""
+        os.write(self._fd, self._report(keycode, int(pressed)))
+
+    def close(self):
+        """Destroy the virtual device."""
+        if self._fd is None:
+            return
+        try:
+            fcntl.ioctl(self._fd, self.UI_DEV_DESTROY)
+        except OSError:
+            pass
+        os.close(self._fd)
+        self._fd = None
+
+
+def create_backend(name, **options):
+    """
+    Create a click backend by name.
+
+    Args:
+        name: One of BACKEND_NAMES
+        **options: Backend-specific constructor arguments
+
+    Returns:
+        ClickBackend instance
+    """
+    if name == 'portal':
+        from gclicker.wayland_clicker import PortalBackend
+        return PortalBackend(**options)
+    if name == 'uinput':
+        return UinputBackend(**options)
+    if name == 'null':
+        return NullBackend(**options)
+    raise ValueError(f"Unknown backend: {name}")
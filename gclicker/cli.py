@@ -3,73 +3,525 @@
 import argparse
 import os
 import sys
-import signal
+import time
 from pathlib import Path
 
-from gclicker.dbus_service import check_gui_running, call_toggle, get_state
-from gclicker.clicker import run_clicker_standalone
+# gi, the D-Bus client and the clicker are imported where they are needed,
+# so controlling a running GUI or daemon (e.g. from a hotkey) starts fast
+from gclicker.scheduler import HIRES_SPIN, MIN_INTERVAL
+
+
+# Suffixes accepted by parse_duration, longest first
+DURATION_UNITS = (('us', 1e-6), ('ms', 1e-3), ('s', 1.0))
+
+# Buttons --add-job accepts
+JOB_BUTTONS = ('left', 'right', 'middle')
+
+# How often --follow-clicks reads the click rings, and looks for new ones
+FOLLOW_POLL = 0.05
+FOLLOW_RESCAN = 1.0
+
+
+def parse_duration(value):
+    """
+    Parse a duration in seconds, optionally with a unit suffix (s, ms, us).
+
+    Examples: '0.1', '100ms', '250us'
+    """
+    text = value.strip().lower()
+    scale = 1.0
+    for suffix, factor in DURATION_UNITS:
+        if text.endswith(suffix):
+            text = text[:-len(suffix)]
+            scale = factor
+            break
+    try:
+        return float(text) * scale
+    except ValueError:
+        raise argparse.ArgumentTypeError(f"invalid duration: {value!r}")
+
+
+def parse_job_spec(value):
+    """
+    Parse a click job for --add-job: BUTTON:INTERVAL[:DURATION].
+
+    Examples: 'right:2s', 'left:50ms:30s'
+
+    Returns:
+        Tuple of (button name, interval, duration), duration 0 meaning no limit
+    """
+    parts = value.split(':')
+    if len(parts) not in (2, 3) or parts[0] not in JOB_BUTTONS:
+        raise argparse.ArgumentTypeError(
+            f"expected BUTTON:INTERVAL[:DURATION] with BUTTON one of "
+            f"{', '.join(JOB_BUTTONS)}, got {value!r}")
+    interval = parse_duration(parts[1])
+    duration = parse_duration(parts[2]) if len(parts) == 3 else 0.0
+    if interval < MIN_INTERVAL or duration < 0:
+        raise argparse.ArgumentTypeError(f"invalid job timing: {value!r}")
+    return parts[0], interval, duration
+
+
+def format_job(job, output_format):
+    """Format one job from ListJobs for --jobs."""
+    if output_format == 'json':
+        import json
+        return json.dumps(dict(job))
+
+    if job['active']:
+        state = 'playing' if job.get('kind') == 'macro' else 'clicking'
+        if job['duration']:
+            state += f" ({job['remaining']:.1f}s left)"
+    else:
+        state = 'stopped'
+    if job.get('kind') == 'macro':
+        return f"{job['id']:>4}  {'macro':<6}  {'':>11}  {job['clicks']:>10}  {state}  {job['path']}"
+    return (f"{job['id']:>4}  {job['button']:<6}  {job['interval']:>10.6g}s  "
+            f"{job['clicks']:>10}  {state}")
+
+
+def control_jobs(args):
+    """Handle --add-job, --jobs, --remove-job and --job through a running GUI or daemon."""
+    try:
+        from gclicker.control import ControlClient, ServiceNotRunning
+    except ImportError:
+        print("Error: click jobs need PyGObject", file=sys.stderr)
+        sys.exit(1)
+
+    client = ControlClient()
+    try:
+        if args.add_job:
+            for button, interval, duration in args.add_job:
+                job_id = client.add_job(button, interval, duration)
+                limit = f" for {duration}s" if duration else ""
+                print(f"Added job {job_id}: {button} every {interval}s{limit}")
+
+        if args.remove_job is not None:
+            if not client.remove_job(args.remove_job):
+                print(f"Error: No job {args.remove_job}", file=sys.stderr)
+                sys.exit(1)
+            print(f"Removed job {args.remove_job}")
+
+        if args.job is not None:
+            if args.set_interval is not None:
+                client.set_job_interval(args.job, args.set_interval)
+                print(f"Job {args.job} interval: {args.set_interval}s")
+            if args.stats:
+                stats = client.get_job_stats(args.job)
+                if 'events' in stats:
+                    print_macro_stats(stats)
+                else:
+                    print_stats(stats)
 
+        if args.jobs:
+            if args.format == 'text':
+                print(f"{'ID':>4}  {'BUTTON':<6}  {'INTERVAL':>11}  {'CLICKS':>10}  STATE")
+            for job in client.list_jobs():
+                print(format_job(job, args.format))
+
+    except ServiceNotRunning:
+        print("Error: click jobs need the GUI or daemon (gclicker-daemon)", file=sys.stderr)
+        sys.exit(1)
+    except Exception as e:
+        print(f"Error: {e}", file=sys.stderr)
+        sys.exit(1)
 
-def get_pid_file():
-    """Get the path to the PID file."""
-    runtime_dir = os.environ.get('XDG_RUNTIME_DIR', '/tmp')
-    return Path(runtime_dir) / 'gclicker.pid'
 
+def print_stats(stats):
+    """Print click telemetry from the service."""
+    print(f"Clicks: {stats['clicks']} ({stats['rate']:.1f}/s, interval: {stats['interval']}s)")
+    print(f"Latency: p50 {stats['latency_p50'] * 1000:.3f} ms, "
+          f"p95 {stats['latency_p95'] * 1000:.3f} ms, "
+          f"p99 {stats['latency_p99'] * 1000:.3f} ms")
+    print(f"Jitter: {stats['jitter'] * 1000:.3f} ms "
+          f"(mean lateness {stats['lateness_mean'] * 1000:.3f} ms)")
+    print(f"Missed deadlines: {stats['missed']}, errors: {stats['errors']}")
+
+
+def print_macro_stats(stats):
+    """Print how a macro job is keeping to its timeline."""
+    print(f"Events: {stats['events']} of {stats['total'] or 'unlimited'} "
+          f"(speed {stats['speed']:g}x)")
+    print(f"Lag: mean {stats['lag_mean'] * 1000:.3f} ms, max {stats['max_lag'] * 1000:.3f} ms, "
+          f"late events: {stats['late']}, errors: {stats['errors']}")
+
+
+def compile_macro(args):
+    """Handle --compile-macro."""
+    from gclicker.macro import MacroError, MacroReader, compile_macro as compile_source
+
+    source, output = args.compile_macro
+    try:
+        count = compile_source(source, output)
+        reader = MacroReader(output)
+        duration = reader.duration
+        reader.close()
+    except (MacroError, OSError) as e:
+        print(f"Error: {e}", file=sys.stderr)
+        sys.exit(1)
+    print(f"Compiled {count} events ({duration:g}s) to {output}")
+
+
+def play_macro_service(args):
+    """
+    Handle --play-macro through a running GUI or daemon.
+
+    Returns:
+        True if handled, False if no GUI or daemon is running
+    """
+    try:
+        from gclicker.control import ControlClient, ServiceNotRunning
+    except ImportError:
+        return False
+
+    try:
+        job_id = ControlClient().play_macro(os.path.abspath(args.play_macro),
+                                            args.speed, args.repeat)
+    except ServiceNotRunning:
+        return False
+    except Exception as e:
+        print(f"Error: {e}", file=sys.stderr)
+        sys.exit(1)
+    print(f"Playing {args.play_macro} as job {job_id}")
+    return True
 
-def get_running_pids():
-    """Get list of running gclicker PIDs."""
-    pids = []
-    pid_file = get_pid_file()
 
-    if pid_file.exists():
+def control_service(args):
+    """
+    Handle --toggle, --stop, --status and --stats through a running GUI or daemon.
+
+    Every call goes over one bus connection, straight to the service.
+
+    Returns:
+        True if handled, False if no GUI or daemon is running
+    """
+    try:
+        from gclicker.control import ControlClient, ServiceNotRunning
+    except ImportError:
+        return False  # No gi, so no GUI or daemon either
+
+    client = ControlClient()
+    try:
+        if args.toggle:
+            if not client.toggle():
+                print("Error: Failed to toggle clicking", file=sys.stderr)
+                sys.exit(1)
+            running, interval = client.get_state()
+            if running:
+                print(f"Started clicking (interval: {interval}s)")
+            else:
+                print("Stopped clicking")
+
+        elif args.stop:
+            running, interval = client.get_state()
+            if running and not client.toggle():
+                print("Error: Failed to stop clicking", file=sys.stderr)
+                sys.exit(1)
+            print("Stopped clicking")
+
+        elif args.status:
+            running, interval = client.get_state()
+            if running:
+                print(f"Status: Running (interval: {interval}s)")
+            else:
+                print(f"Status: Stopped (interval: {interval}s)")
+
+        elif args.stats:
+            print_stats(client.get_stats())
+
+        elif args.set_interval is not None:
+            client.set_interval(args.set_interval)
+            print(f"Interval: {args.set_interval}s")
+
+    except ServiceNotRunning:
+        return False
+    except Exception as e:
+        print(f"Error: {e}", file=sys.stderr)
+        sys.exit(1)
+
+    return True
+
+
+# org.gclicker.Control properties and their --watch field names
+WATCH_FIELDS = (
+    ('Running', 'running'),
+    ('Interval', 'interval'),
+    ('ClickCount', 'clicks'),
+    ('AchievedRate', 'rate'),
+    ('LastError', 'last_error'),
+)
+
+
+def format_watch_line(state, output_format):
+    """Format the watched state as one line of text or JSON."""
+    if output_format == 'json':
+        import json
+        record = {'time': time.time()}
+        for prop, field in WATCH_FIELDS:
+            if prop in state:
+                record[field] = state[prop]
+        return json.dumps(record)
+
+    line = (f"{'running' if state.get('Running') else 'stopped'} "
+            f"interval={state.get('Interval', 0.0)}s "
+            f"clicks={state.get('ClickCount', 0)} "
+            f"rate={state.get('AchievedRate', 0.0):.1f}/s")
+    if state.get('LastError'):
+        line += f" error={state['LastError']!r}"
+    return line
+
+
+def watch_service(args):
+    """
+    Stream state changes from the GUI or daemon until interrupted.
+
+    Prints one line per StateChanged/PropertiesChanged signal, all received
+    on one bus connection. With --max-rate, changes arriving faster than
+    that are coalesced into the next line.
+    """
+    import signal
+    from gi.repository import GLib
+    from gclicker.control import ControlClient, ServiceNotRunning
+
+    client = ControlClient()
+    loop = GLib.MainLoop()
+    state = {}
+    min_gap = 1.0 / args.max_rate if args.max_rate > 0 else 0.0
+    last_line = 0.0
+    flush_source = None
+
+    def write_line():
+        nonlocal last_line, flush_source
+        flush_source = None
+        last_line = time.monotonic()
         try:
-            with open(pid_file, 'r') as f:
-                for line in f:
-                    pid = int(line.strip())
-                    # Check if process is still running
+            print(format_watch_line(state, args.format), flush=True)
+        except BrokenPipeError:
+            # The reader went away (e.g. `| head`)
+            os.dup2(os.open(os.devnull, os.O_WRONLY), sys.stdout.fileno())
+            loop.quit()
+        return False
+
+    def on_changes(changes):
+        nonlocal flush_source
+        state.update(changes)
+        if flush_source is not None:
+            return  # A line with the latest state is already scheduled
+        delay = last_line + min_gap - time.monotonic()
+        if delay > 0:
+            flush_source = GLib.timeout_add(int(delay * 1000) + 1, write_line)
+        else:
+            write_line()
+
+    def on_signal():
+        loop.quit()
+        return GLib.SOURCE_REMOVE
+
+    # Subscribe before reading the initial state so no change is missed
+    subscriptions = client.subscribe(on_changes)
+    try:
+        on_changes(dict(client.get_properties()))
+    except ServiceNotRunning:
+        print("Waiting for the GUI or daemon to start...", file=sys.stderr)
+
+    GLib.unix_signal_add(GLib.PRIORITY_DEFAULT, signal.SIGINT, on_signal)
+    GLib.unix_signal_add(GLib.PRIORITY_DEFAULT, signal.SIGTERM, on_signal)
+    try:
+        loop.run()
+    finally:
+        client.unsubscribe(subscriptions)
+
+
+def format_click(pid, record, output_format):
+    """Format one click ring record for --follow-clicks."""
+    from gclicker.click_ring import STATUS_OK
+
+    if output_format == 'json':
+        import json
+        fields = record._asdict()
+        fields['status'] = 'ok' if record.status == STATUS_OK else 'error'
+        return json.dumps({'pid': pid, **fields})
+
+    source = f"PID {pid} job {record.job}" if record.job else f"PID {pid}"
+    if record.status != STATUS_OK:
+        return f"{source} #{record.number}: error"
+    late = (record.press_sent - record.scheduled) * 1000
+    latency = (record.press_ack - record.press_sent) * 1000
+    return f"{source} #{record.number}: late {late:.3f} ms, latency {latency:.3f} ms"
+
+
+def follow_clicks(args):
+    """Print the clicks of every engine publishing a click ring until interrupted."""
+    from gclicker.click_ring import ClickRingReader, find_rings
+
+    readers = {}
+    next_scan = 0.0
+
+    def drain(reader):
+        records, lost = reader.read()
+        lines = [format_click(reader.pid, record, args.format) for record in records]
+        if lost:
+            print(f"PID {reader.pid}: {lost} clicks lost", file=sys.stderr)
+        if lines:
+            print('\n'.join(lines), flush=True)
+
+    try:
+        while True:
+            now = time.monotonic()
+            if now >= next_scan:
+                # Pick up new engines and drop ones that exited, after
+                # reading their last clicks (the mapping outlives the file)
+                next_scan = now + FOLLOW_RESCAN
+                live = set(find_rings())
+                for path in live.difference(readers):
                     try:
-                        os.kill(pid, 0)  # Signal 0 just checks if process exists
-                        pids.append(pid)
-                    except OSError:
-                        # Process doesn't exist
+                        readers[path] = ClickRingReader(path)
+                    except (OSError, ValueError):
                         pass
-        except (ValueError, IOError):
-            pass
+                for path in set(readers).difference(live):
+                    reader = readers.pop(path)
+                    drain(reader)
+                    reader.close()
 
-    return pids
+            for reader in readers.values():
+                drain(reader)
+            time.sleep(FOLLOW_POLL)
+    except KeyboardInterrupt:
+        pass
+    except BrokenPipeError:
+        # The reader went away (e.g. `| head`)
+        os.dup2(os.open(os.devnull, os.O_WRONLY), sys.stdout.fileno())
 
 
-def save_pid(pid):
-    """Save a PID to the PID file."""
-    pid_file = get_pid_file()
-    existing_pids = get_running_pids()
+def control_instances(args):
+    """
+    Handle --toggle, --stop, --status, --stats and --set-interval for standalone instances.
 
-    with open(pid_file, 'w') as f:
-        for existing_pid in existing_pids:
-            f.write(f"{existing_pid}\n")
-        f.write(f"{pid}\n")
+    Returns:
+        True if handled, False for --toggle with no instance running (the
+        caller starts one)
+    """
+    from gclicker.instances import find_instances, send_command
 
+    instances = find_instances()
 
-def remove_pid(pid):
-    """Remove a PID from the PID file."""
-    pid_file = get_pid_file()
-    pids = get_running_pids()
+    if args.toggle and not instances:
+        print("No instances running, starting...")
+        return False
 
-    if pid in pids:
-        pids.remove(pid)
+    if args.status:
+        if not instances:
+            print("Status: Stopped")
+        for _path, state in instances:
+            status = 'Running' if state['running'] else 'Paused'
+            print(f"Status: {status} (PID {state['pid']}, interval: {state['interval']}s)")
+        return True
 
-    if pids:
-        with open(pid_file, 'w') as f:
-            for p in pids:
-                f.write(f"{p}\n")
+    if not instances:
+        print("No gclicker processes found")
+        if args.stats or args.set_interval is not None:
+            sys.exit(1)
+        return True
+
+    if args.toggle:
+        # Pause everything if anything is clicking, otherwise resume everything
+        command = 'pause' if any(state['running'] for _path, state in instances) else 'resume'
+    elif args.stop:
+        command = 'quit'
+    elif args.stats:
+        command = 'stats'
     else:
-        # No more PIDs, remove the file
-        if pid_file.exists():
-            pid_file.unlink()
+        command = f"interval {args.set_interval!r}"
 
+    failed = False
+    for path, state in instances:
+        try:
+            reply = send_command(path, command)
+        except (OSError, ValueError) as e:
+            reply = {'ok': False, 'error': str(e)}
+
+        pid = state['pid']
+        if not reply.get('ok'):
+            print(f"  PID {pid}: {reply.get('error', 'failed')}", file=sys.stderr)
+            failed = True
+        elif command == 'stats':
+            if len(instances) > 1:
+                print(f"PID {pid}:")
+            print_stats(reply['stats'])
+        elif command == 'quit':
+            print(f"  Stopped PID {pid}")
+        elif command == 'pause':
+            print(f"  Paused PID {pid}")
+        elif command == 'resume':
+            print(f"  Resumed PID {pid}")
+        else:
+            print(f"  PID {pid}: interval {reply['interval']}s")
 
-def main_cli():
-    """Main CLI entry point."""
+    if failed:
+        sys.exit(1)
+    return True
+
+
+def resolve_options(args):
+    """
+    Fill in clicker options not given on the command line, from --profile or settings.json.
+
+    Without --hires, the spin budget also comes from the profile or settings.
+    """
+    from gclicker.settings import Settings
+
+    settings = Settings()
+    profile = {}
+    if args.profile:
+        try:
+            profile = settings.get_profile(args.profile)
+        except KeyError:
+            print(f"Error: No profile named {args.profile!r}", file=sys.stderr)
+            sys.exit(1)
+
+    def pick(key, value):
+        if value is not None:
+            return value
+        return profile.get(key, settings.get(key))
+
+    args.interval = pick('interval', args.interval)
+    args.backend = pick('backend', args.backend)
+    args.dispatch = pick('dispatch', args.dispatch)
+    args.missed = pick('missed_policy', args.missed)
+    if not args.hires:
+        spin = pick('spin', None)
+        if spin > 0:
+            args.hires = True
+            args.spin = spin
+    args.settings = settings
+
+
+def save_profile(args):
+    """Store the resolved clicker options as a profile (--save-profile)."""
+    values = {
+        'interval': args.interval,
+        'backend': args.backend,
+        'dispatch': args.dispatch,
+        'missed_policy': args.missed,
+        'spin': args.spin if args.hires else 0.0,
+    }
+    try:
+        args.settings.save_profile(args.save_profile, values)
+    except ValueError as e:
+        print(f"Error: {e}", file=sys.stderr)
+        sys.exit(1)
+    args.settings.flush()
+    print(f"Saved profile {args.save_profile!r}: interval {args.interval}s, "
+          f"backend {args.backend}, dispatch {args.dispatch}, missed {args.missed}")
+
+
+def main_cli(argv=None):
+    """
+    Main CLI entry point.
+
+    Args:
+        argv: Arguments to parse instead of sys.argv[1:]
+    """
     parser = argparse.ArgumentParser(
         description='GClicker - Auto-clicker for Linux with Wayland support',
         prog='gclicker-cli'
@@ -81,127 +533,327 @@ def main_cli():
     )
     parser.add_argument(
         '-i', '--interval',
-        type=float,
-        default=0.1,
-        help='Click interval in seconds (default: 0.1)'
+        type=parse_duration,
+        help='Click interval in seconds, or with a unit: 10ms, 250us '
+             '(default: from settings.json, else 0.1)'
+    )
+    parser.add_argument(
+        '--hires',
+        action='store_true',
+        help='High-resolution timer: sleep, then busy-wait the last stretch '
+             'before each click (needed for sub-millisecond intervals)'
+    )
+    parser.add_argument(
+        '--spin',
+        type=parse_duration,
+        default=HIRES_SPIN,
+        help=f'CPU budget per click for --hires, i.e. how long before each '
+             f'deadline to start busy-waiting (default: {HIRES_SPIN * 1e6:.0f}us)'
+    )
+    parser.add_argument(
+        '-b', '--backend',
+        choices=['portal', 'uinput', 'null'],
+        help='How clicks are injected: RemoteDesktop portal, /dev/uinput or '
+             'null (records clicks, for benchmarking) (default: from settings.json, '
+             'else portal)'
+    )
+    parser.add_argument(
+        '--missed',
+        choices=['skip', 'catch-up'],
+        help='What to do with missed click deadlines (default: from settings.json, '
+             'else skip)'
+    )
+    parser.add_argument(
+        '--event-loop',
+        choices=['thread', 'glib'],
+        default='thread',
+        help='How the click thread waits: a plain loop, or a GLib main loop that '
+             'also handles portal replies (default: thread)'
+    )
+    parser.add_argument(
+        '--isolate',
+        action='store_true',
+        help='Run the click engine in its own process, so the D-Bus service '
+             'and other front-end work cannot delay clicks'
+    )
+    parser.add_argument(
+        '--click-ring',
+        action='store_true',
+        help='Publish every click to a shared-memory ring under '
+             '$XDG_RUNTIME_DIR/gclicker, for --follow-clicks and other readers'
+    )
+    parser.add_argument(
+        '--instrument',
+        metavar='SPEC',
+        help='Time the click path and report on exit: a comma-separated list of '
+             'timers, trace[=PATH] (Chrome trace JSON) and cprofile[=PATH] '
+             '(same as GCLICKER_INSTRUMENT)'
+    )
+    parser.add_argument(
+        '--dispatch',
+        choices=['sync', 'async'],
+        help='Wait for each portal reply (sync) or pipeline clicks (async) '
+             '(default: from settings.json, else sync)'
+    )
+    parser.add_argument(
+        '--max-in-flight',
+        type=int,
+        default=4,
+        help='Most clicks awaiting portal replies in async mode (default: 4)'
+    )
+    parser.add_argument(
+        '--eis',
+        action='store_true',
+        help='Send clicks over libei (ConnectToEIS) when the portal supports it'
+    )
+    parser.add_argument(
+        '--profile',
+        metavar='NAME',
+        help='Take interval, backend, dispatch, missed and spin defaults from a saved profile'
+    )
+    parser.add_argument(
+        '--save-profile',
+        metavar='NAME',
+        help='Save the given interval, backend, dispatch, missed and spin options '
+             'as a profile, then exit'
     )
     parser.add_argument(
         '--toggle',
         action='store_true',
-        help='Toggle: stop if running, start if not'
+        help='Toggle: pause if running, resume (or start) if not'
     )
     parser.add_argument(
         '--stop',
         action='store_true',
         help='Stop all running instances'
     )
+    parser.add_argument(
+        '--set-interval',
+        type=parse_duration,
+        metavar='INTERVAL',
+        help='Change the click interval of running instances'
+    )
     parser.add_argument(
         '--status',
         action='store_true',
         help='Show current status'
     )
+    parser.add_argument(
+        '--stats',
+        action='store_true',
+        help='Show achieved click rate, latency and jitter (GUI or daemon only)'
+    )
+    parser.add_argument(
+        '--add-job',
+        type=parse_job_spec,
+        action='append',
+        metavar='BUTTON:INTERVAL[:DURATION]',
+        help='Click another button or interval alongside the others, e.g. right:2s '
+             'or left:50ms:30s, over the same portal session (GUI or daemon only)'
+    )
+    parser.add_argument(
+        '--jobs',
+        action='store_true',
+        help='List click jobs by ID; job 0 is the one --toggle controls'
+    )
+    parser.add_argument(
+        '--remove-job',
+        type=int,
+        metavar='ID',
+        help='Stop and forget a click job'
+    )
+    parser.add_argument(
+        '--job',
+        type=int,
+        metavar='ID',
+        help='Make --set-interval and --stats apply to this click job'
+    )
+    parser.add_argument(
+        '--compile-macro',
+        nargs=2,
+        metavar=('SOURCE', 'OUTPUT'),
+        help='Compile a macro source (timed move, click, scroll and key lines) '
+             'into a file for --play-macro'
+    )
+    parser.add_argument(
+        '--play-macro',
+        metavar='FILE',
+        help='Play a compiled macro: as a job of the GUI or daemon if one is '
+             'running, else in the foreground'
+    )
+    parser.add_argument(
+        '--speed',
+        type=float,
+        default=1.0,
+        help='Playback speed factor for --play-macro (default: 1.0)'
+    )
+    parser.add_argument(
+        '--repeat',
+        type=int,
+        default=1,
+        help='Times to play the macro, 0 = until stopped (default: 1)'
+    )
+    parser.add_argument(
+        '--keyboard',
+        action='store_true',
+        help='Also ask the portal for a keyboard, so macros with key events '
+             'can be played through the daemon'
+    )
+    parser.add_argument(
+        '--watch',
+        action='store_true',
+        help='Print a line whenever the state, click count or rate changes '
+             '(GUI or daemon only)'
+    )
+    parser.add_argument(
+        '--follow-clicks',
+        action='store_true',
+        help='Print every click of engines started with --click-ring, as it happens'
+    )
+    parser.add_argument(
+        '--format',
+        choices=['text', 'json'],
+        default='text',
+        help='Output format for --watch, --follow-clicks and --jobs: text or JSON Lines '
+             '(default: text)'
+    )
+    parser.add_argument(
+        '--max-rate',
+        type=float,
+        default=0.0,
+        help='Most lines per second printed by --watch (default: no limit)'
+    )
+    parser.add_argument(
+        '--daemon',
+        action='store_true',
+        help='Run headless, keeping the clicker and portal session resident '
+             'and answering --toggle, --status and --stats over D-Bus'
+    )
 
-    args = parser.parse_args()
-
-    # Check if GUI is running
-    gui_running = check_gui_running()
+    args = parser.parse_args(argv)
 
-    # If GUI is running, use D-Bus for toggle and status
-    if gui_running and (args.toggle or args.status):
-        if args.toggle:
-            success = call_toggle()
-            if success:
-                # Get the new state
-                running, interval = get_state()
-                if running:
-                    print(f"Started clicking (interval: {interval}s)")
-                else:
-                    print("Stopped clicking")
-            else:
-                print("Error: Failed to toggle clicking", file=sys.stderr)
-                sys.exit(1)
-            return
+    if args.instrument:
+        from gclicker.profiling import ENV_VAR, parse_spec
+        try:
+            parse_spec(args.instrument)
+        except ValueError as e:
+            parser.error(f"--instrument: {e}")
+        # Also reaches the isolated engine and a standalone clicker started by --toggle
+        os.environ[ENV_VAR] = args.instrument
 
-        if args.status:
-            running, interval = get_state()
-            if running:
-                print(f"Status: Running (interval: {interval}s)")
-            else:
-                print(f"Status: Stopped (interval: {interval}s)")
-            return
+    if args.watch:
+        try:
+            watch_service(args)
+        except ImportError:
+            print("Error: --watch needs PyGObject", file=sys.stderr)
+            sys.exit(1)
+        return
 
-    # Otherwise, use standalone mode
-    # Handle stop mode
-    if args.stop:
-        pids = get_running_pids()
+    if args.follow_clicks:
+        follow_clicks(args)
+        return
 
-        if not pids:
-            print("No gclicker processes found")
-            return
+    if args.compile_macro:
+        compile_macro(args)
+        return
 
-        print(f"Stopping {len(pids)} gclicker process(es)...")
+    if args.speed <= 0 or args.repeat < 0:
+        parser.error("--speed must be positive and --repeat at least 0")
 
-        for pid in pids:
-            try:
-                os.kill(pid, signal.SIGTERM)
-                print(f"  Stopped PID {pid}")
-            except OSError as e:
-                print(f"  Failed to stop PID {pid}: {e}", file=sys.stderr)
+    if args.play_macro and play_macro_service(args):
+        return
 
-        # Clean up PID file
-        pid_file = get_pid_file()
-        if pid_file.exists():
-            pid_file.unlink()
+    if args.add_job or args.jobs or args.remove_job is not None or args.job is not None:
+        control_jobs(args)
+        return
 
-        print("Done")
+    # Talk to the GUI or daemon if one is running
+    commands = (args.toggle, args.stop, args.status, args.stats, args.set_interval is not None)
+    if any(commands) and control_service(args):
         return
 
-    # Handle status mode (standalone)
-    if args.status:
-        pids = get_running_pids()
-        if pids:
-            print(f"Status: Running (PIDs: {', '.join(map(str, pids))})")
-        else:
-            print("Status: Stopped")
+    # Otherwise, control standalone instances over their sockets
+    if any(commands) and control_instances(args):
         return
 
-    # Handle toggle mode (standalone)
-    if args.toggle:
-        pids = get_running_pids()
-
-        if pids:
-            # Instances running - stop them
-            print(f"Stopping {len(pids)} running instance(s)...")
-            for pid in pids:
-                try:
-                    os.kill(pid, signal.SIGTERM)
-                    print(f"  Stopped PID {pid}")
-                except OSError as e:
-                    print(f"  Failed to stop PID {pid}: {e}", file=sys.stderr)
-
-            # Clean up PID file
-            pid_file = get_pid_file()
-            if pid_file.exists():
-                pid_file.unlink()
-
-            print("Stopped")
-            sys.exit(0)
-        else:
-            # No instances running - start one
-            print("No instances running, starting...")
-            # Toggle will start in background below
+    resolve_options(args)
+
+    if args.save_profile:
+        save_profile(args)
+        return
 
     # Validate interval
-    if args.interval < 0.001:
-        print("Error: Interval must be at least 0.001 seconds", file=sys.stderr)
+    if args.interval < MIN_INTERVAL:
+        print(f"Error: Interval must be at least {MIN_INTERVAL * 1e6:.0f}us", file=sys.stderr)
         sys.exit(1)
 
-    # CLI mode - start clicking
+    if args.interval < 0.001 and not args.hires:
+        print("Warning: intervals below 1ms need --hires to be accurate", file=sys.stderr)
+
+    if args.max_in_flight < 1:
+        print("Error: --max-in-flight must be at least 1", file=sys.stderr)
+        sys.exit(1)
+
+    backend_options = {}
+    if args.backend == 'portal':
+        backend_options = {
+            'dispatch': args.dispatch,
+            'max_in_flight': args.max_in_flight,
+            'use_eis': args.eis,
+        }
+        if args.keyboard:
+            from gclicker.token_cache import DEVICE_KEYBOARD, DEVICE_POINTER
+            backend_options['device_types'] = DEVICE_POINTER | DEVICE_KEYBOARD
+
+    if args.play_macro:
+        from gclicker.clicker import run_macro_standalone
+        sys.exit(run_macro_standalone(
+            args.play_macro,
+            speed=args.speed,
+            repeat=args.repeat,
+            backend=args.backend,
+            spin=args.spin if args.hires else 0.0,
+            **backend_options
+        ))
+
+    if args.daemon:
+        from gclicker.daemon import run_daemon
+        sys.exit(run_daemon(
+            args.interval,
+            backend=args.backend,
+            missed_policy=args.missed,
+            spin=args.spin if args.hires else 0.0,
+            event_loop=args.event_loop,
+            isolate=args.isolate,
+            click_ring=args.click_ring,
+            **backend_options
+        ))
+
+    # No instance was running: start clicking
     # Toggle mode runs in background, otherwise foreground
     if args.toggle:
         # Use subprocess instead of fork to avoid GLib/D-Bus session issues
         import subprocess
-        cmd = [sys.executable, __file__, '-i', str(args.interval)]
+        cmd = [
+            sys.executable, __file__,
+            '-i', str(args.interval),
+            '--backend', args.backend,
+            '--missed', args.missed,
+            '--event-loop', args.event_loop,
+            '--dispatch', args.dispatch,
+            '--max-in-flight', str(args.max_in_flight),
+            '--spin', str(args.spin),
+        ]
+        if args.eis:
+            cmd.append('--eis')
+        if args.hires:
+            cmd.append('--hires')
+        if args.isolate:
+            cmd.append('--isolate')
+        if args.click_ring:
+            cmd.append('--click-ring')
+        if args.keyboard:
+            cmd.append('--keyboard')
 
         log_dir = Path(os.environ.get('XDG_RUNTIME_DIR', '/tmp'))
         log_file = log_dir / f'gclicker-toggle-{os.getpid()}.log'
@@ -215,7 +867,6 @@ def main_cli():
                 start_new_session=False,  # Stay in same session for D-Bus
                 env=os.environ.copy()  # Inherit all environment variables
             )
-            save_pid(proc.pid)
             print(f"Started gclicker with PID {proc.pid}")
             print(f"Interval: {args.interval}s")
             print(f"Log: {log_file}")
@@ -223,11 +874,18 @@ def main_cli():
         sys.exit(0)
     else:
         # Run in foreground
-        save_pid(os.getpid())
-        try:
-            run_clicker_standalone(args.interval)
-        finally:
-            remove_pid(os.getpid())
+        from gclicker.clicker import run_clicker_standalone
+
+        run_clicker_standalone(
+            args.interval,
+            backend=args.backend,
+            missed_policy=args.missed,
+            spin=args.spin if args.hires else 0.0,
+            event_loop=args.event_loop,
+            isolate=args.isolate,
+            click_ring=args.click_ring,
+            **backend_options
+        )
 
 
 if __name__ == '__main__':
@@ -0,0 +1,220 @@
+"""Shared-memory ring of per-click timestamps.
+
+An engine created with click_ring=True writes every click into a
+memory-mapped file, $XDG_RUNTIME_DIR/gclicker/clicks-<pid>.ring, which
+other processes of the same user can map and read without D-Bus traffic or
+serialization. Readers never block the writer. Each slot has its own
+sequence counter (a seqlock), and a reader that races a write, or falls a
+whole ring behind, skips and counts the affected slots.
+
+The writer holds an exclusive flock on the file for its lifetime, so a
+ring whose lock can be taken was left behind by a dead process.
+
+Layout (native byte order):
+
+    header  magic, version, slot size, capacity, writer pid, records written
+    slots   capacity x (seq, record number, scheduled, press sent,
+            press acknowledged, release acknowledged, status, job ID)
+"""
+
+import collections
+import fcntl
+import mmap
+import os
+import struct
+
+from gclicker.instances import get_socket_dir
+
+
+MAGIC = b'GCLKRING'
+VERSION = 2
+
+# magic, version, slot size, capacity, writer pid, records written
+HEADER = struct.Struct('=8sIIQQQ')
+HEADER_SIZE = 64
+WRITTEN_OFFSET = 32
+# seq, record number, scheduled, press sent, press ack, release ack, status, job ID
+SLOT = struct.Struct('=QQddddII8x')
+SEQ = struct.Struct('=Q')
+COUNTER = struct.Struct('=Q')
+
+# Slot status values
+STATUS_OK = 0
+STATUS_ERROR = 1
+
+ClickRecord = collections.namedtuple(
+    'ClickRecord', 'number scheduled press_sent press_ack release_ack status job'
+)
+
+
+class ClickRing:
+    """Writer side of the click ring. Only one thread may call write()."""
+
+    def __init__(self, capacity=4096):
+        """
+        Create this process's ring file.
+
+        Args:
+            capacity: Number of clicks kept (rounded up to a power of two)
+        """
+        size = 1
+        while size < capacity:
+            size <<= 1
+        self.capacity = size
+        self._mask = size - 1
+        self.written = 0
+
+        directory = get_socket_dir(create=True)
+        self.path = directory / f"clicks-{os.getpid()}.ring"
+        temp_path = directory / f".clicks-{os.getpid()}.ring.tmp"
+
+        # Lock and initialize under a temporary name, then rename into
+        # place, so readers only ever see a complete, locked ring
+        fd = os.open(temp_path, os.O_RDWR | os.O_CREAT | os.O_TRUNC | os.O_CLOEXEC, 0o600)
+        try:
+            os.ftruncate(fd, HEADER_SIZE + size * SLOT.size)
+            fcntl.flock(fd, fcntl.LOCK_EX)
+            self._map = mmap.mmap(fd, HEADER_SIZE + size * SLOT.size)
+            HEADER.pack_into(self._map, 0, MAGIC, VERSION, SLOT.size, size, os.getpid(), 0)
+            os.rename(temp_path, self.path)
+        except Exception:
+            os.close(fd)
+            raise
+        self._fd = fd
+
+    def write(self, scheduled, press_sent, press_ack, release_ack, status=STATUS_OK, job=0):
+        """
+        Append one click, overwriting the oldest once the ring is full.
+
+        job is the ID of the click job that clicked (0 = the main job, see
+        gclicker.jobs), so readers can tell several jobs' clicks apart.
+        """
+        number = self.written
+        offset = HEADER_SIZE + (number & self._mask) * SLOT.size
+        buf = self._map
+
+        seq = SEQ.unpack_from(buf, offset)[0] + 1
+        SEQ.pack_into(buf, offset, seq)  # Odd: readers skip the slot
+        SLOT.pack_into(buf, offset, seq, number, scheduled, press_sent, press_ack,
+                       release_ack, status, job)
+        SEQ.pack_into(buf, offset, seq + 1)  # Even: slot is consistent
+
+        self.written = number + 1
+        COUNTER.pack_into(buf, WRITTEN_OFFSET, self.written)
+
+    def close(self):
+        """Remove the ring file."""
+        if self._fd is None:
+            return
+        try:
+            self.path.unlink()
+        except OSError:
+            pass
+        self._map.close()
+        os.close(self._fd)
+        self._fd = None
+
+
+class ClickRingReader:
+    """Reader side of a click ring; never blocks or slows the writer."""
+
+    def __init__(self, path, from_start=False):
+        """
+        Map a ring file read-only.
+
+        Args:
+            path: Ring file, e.g. from find_rings()
+            from_start: Also return the clicks already in the ring on the
+                first read() (default: only new ones)
+
+        Raises:
+            OSError: If the file cannot be opened or mapped
+            ValueError: If the file is not a click ring this version can read
+        """
+        self.path = path
+        fd = os.open(path, os.O_RDONLY | os.O_CLOEXEC)
+        try:
+            self._map = mmap.mmap(fd, 0, access=mmap.ACCESS_READ)
+        finally:
+            os.close(fd)
+
+        magic, version, slot_size, capacity, pid, written = HEADER.unpack_from(self._map, 0)
+        if magic != MAGIC or version != VERSION or slot_size != SLOT.size:
+            self._map.close()
+            raise ValueError(f"{path} is not a version {VERSION} click ring")
+
+        self.capacity = capacity
+        self.pid = pid
+        self._mask = capacity - 1
+        self.next = max(0, written - capacity) if from_start else written
+
+    def read(self):
+        """
+        Get the clicks written since the previous read().
+
+        Returns:
+            Tuple of (list of ClickRecord, number of clicks lost because
+            the writer overwrote them before they were read)
+        """
+        buf = self._map
+        written = COUNTER.unpack_from(buf, WRITTEN_OFFSET)[0]
+        start = max(self.next, written - self.capacity)
+        lost = start - self.next
+        records = []
+
+        for number in range(start, written):
+            offset = HEADER_SIZE + (number & self._mask) * SLOT.size
+            seq = SEQ.unpack_from(buf, offset)[0]
+            if seq & 1:
+                lost += 1
+                continue
+            fields = SLOT.unpack_from(buf, offset)
+            if SEQ.unpack_from(buf, offset)[0] != seq or fields[1] != number:
+                lost += 1  # Overwritten while we were reading
+                continue
+            records.append(ClickRecord(*fields[1:]))
+
+        self.next = written
+        return records, lost
+
+    def close(self):
+        """Unmap the ring."""
+        self._map.close()
+
+
+def _is_stale(path):
+    """Check if a ring's writer has gone away (its lock can be taken)."""
+    try:
+        fd = os.open(path, os.O_RDONLY | os.O_CLOEXEC)
+    except OSError:
+        return False
+    try:
+        fcntl.flock(fd, fcntl.LOCK_SH | fcntl.LOCK_NB)
+        return True
+    except BlockingIOError:
+        return False
+    finally:
+        os.close(fd)
+
+
+def find_rings():
+    """
+    Find the click rings of running engines, removing ones left by dead processes.
+
+    Returns:
+        List of ring file paths
+    """
+    directory = get_socket_dir()
+    if not directory.is_dir():
+        return []
+
+    rings = []
+    for path in sorted(directory.glob('clicks-*.ring')):
+        if _is_stale(path):
+            try:
+                path.unlink()
+            except OSError:
+                pass
+            continue
+        rings.append(path)
+    return rings
@@ -4,24 +4,42 @@ import signal
 import sys
 import time
 
-from gclicker.wayland_clicker import WaylandPortalClicker
+from gclicker.engine import create_clicker
+from gclicker.instances import ControlServer
 
+try:
+    from gi.repository import GLib
+except ImportError:
+    GLib = None
 
-def run_clicker_standalone(interval=0.1):
+
+def run_clicker_standalone(interval=0.1, backend='portal', missed_policy='skip', spin=0.0,
+                           event_loop='thread', isolate=False, click_ring=False,
+                           **backend_options):
     """
-    Run the clicker as a standalone process.
+    Run the clicker as a standalone process, controllable over its control
+    socket (see gclicker.instances).
 
     Args:
         interval: Click interval in seconds
+        backend: Click backend name ('portal', 'uinput' or 'null')
+        missed_policy: How to handle missed click deadlines ('skip' or 'catch-up')
+        spin: High-resolution timer spin budget in seconds (0 disables it)
+        event_loop: How the click thread waits ('thread' or 'glib')
+        isolate: Run the click engine in a child process
+        click_ring: Publish every click to a shared-memory ring
+        **backend_options: Backend-specific options (e.g. dispatch, max_in_flight
+            and use_eis for the portal backend)
     """
-    clicker = WaylandPortalClicker(interval)
+    clicker = create_clicker(interval, backend, missed_policy=missed_policy, spin=spin,
+                             event_loop=event_loop, isolate=isolate, click_ring=click_ring,
+                             **backend_options)
+    server = ControlServer(clicker)
 
     # Handle Ctrl+C gracefully
     def signal_handler(sig, frame):
         print("\nStopping clicker...")
-        clicker.stop()
-        clicker.cleanup()
-        sys.exit(0)
+        server.quit_requested.set()
 
     signal.signal(signal.SIGINT, signal_handler)
     signal.signal(signal.SIGTERM, signal_handler)
@@ -32,12 +50,82 @@ def run_clicker_standalone(interval=0.1):
     success = clicker.start()
 
     if not success:
+        clicker.cleanup()
         sys.exit(1)
 
-    # Keep the main thread alive
+    server.start()
+
+    # Keep the main thread alive until asked to quit (pausing over the
+    # control socket keeps the process and its portal session), dispatching
+    # default main context events (e.g. the portal closing the session)
+    context = GLib.MainContext.default() if GLib else None
     try:
-        while clicker.is_running():
-            time.sleep(0.1)
+        while not server.quit_requested.is_set():
+            if context:
+                while context.pending():
+                    context.iteration(False)
+            server.quit_requested.wait(0.1)
     except KeyboardInterrupt:
-        clicker.stop()
+        pass
+    finally:
+        server.close()
         clicker.cleanup()
+
+
+def run_macro_standalone(path, speed=1.0, repeat=1, backend='portal', spin=0.0,
+                         **backend_options):
+    """
+    Play a compiled macro in the foreground until it ends or Ctrl+C.
+
+    Args:
+        path: Compiled macro file (see gclicker.macro)
+        speed: Playback speed factor
+        repeat: Times to play the macro, 0 = until interrupted
+        backend: Click backend name ('portal', 'uinput' or 'null')
+        spin: High-resolution timer spin budget in seconds (0 disables it)
+        **backend_options: Backend-specific options
+
+    Returns:
+        Process exit code
+    """
+    from gclicker.macro import MacroError, MacroReader
+
+    try:
+        reader = MacroReader(path)
+    except (MacroError, OSError) as e:
+        print(f"Error: {e}", file=sys.stderr)
+        return 1
+    if backend == 'portal' and reader.needs_keyboard:
+        from gclicker.token_cache import DEVICE_KEYBOARD, DEVICE_POINTER
+        backend_options['device_types'] = DEVICE_POINTER | DEVICE_KEYBOARD
+    reader.close()
+
+    engine = create_clicker(backend=backend, spin=spin, jobs=True, **backend_options)
+    stop = []
+    signal.signal(signal.SIGINT, lambda sig, frame: stop.append(sig))
+    signal.signal(signal.SIGTERM, lambda sig, frame: stop.append(sig))
+
+    try:
+        if not engine.backend.setup():
+            print(f"Error: {engine.backend.last_error or 'backend setup failed'}", file=sys.stderr)
+            return 1
+        try:
+            job_id = engine.add_macro(path, speed, repeat)
+        except (MacroError, OSError, ValueError) as e:
+            print(f"Error: {e}", file=sys.stderr)
+            return 1
+
+        print(f"Playing {path}... Press Ctrl+C to stop")
+        context = GLib.MainContext.default() if GLib else None
+        while not stop and engine.get_job(job_id)['active']:
+            if context:
+                while context.pending():
+                    context.iteration(False)
+            time.sleep(0.05)
+
+        stats = engine.get_job_stats(job_id)
+        print(f"Played {stats['events']} events, mean lag {stats['lag_mean'] * 1000:.3f} ms, "
+              f"max {stats['max_lag'] * 1000:.3f} ms, {stats['errors']} errors")
+        return 0
+    finally:
+        engine.cleanup()
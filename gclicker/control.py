@@ -0,0 +1,188 @@
+"""Minimal client for controlling a running gclicker GUI or daemon over D-Bus.
+
+Only needs Gio, so CLI commands that just talk to the service do not load
+the clicker, the portal backend or GTK.
+"""
+
+from gi.repository import Gio, GLib
+
+
+BUS_NAME = 'org.gclicker.Service'
+OBJECT_PATH = '/org/gclicker/Control'
+INTERFACE = 'org.gclicker.Control'
+
+# Errors meaning nobody owns BUS_NAME
+_NOT_RUNNING_ERRORS = (Gio.DBusError.SERVICE_UNKNOWN, Gio.DBusError.NAME_HAS_NO_OWNER)
+
+
+class ServiceNotRunning(Exception):
+    """Neither the GUI nor the daemon is running."""
+
+
+class ControlClient:
+    """Calls org.gclicker.Control methods over one session bus connection."""
+
+    def __init__(self, connection=None):
+        """
+        Initialize the client.
+
+        Args:
+            connection: Gio.DBusConnection to use (default: the session bus,
+                connected on first use)
+        """
+        self._connection = connection
+
+    @property
+    def connection(self):
+        """The bus connection, connecting on first use."""
+        if self._connection is None:
+            self._connection = Gio.bus_get_sync(Gio.BusType.SESSION, None)
+        return self._connection
+
+    def _call(self, method, parameters=None, reply_type=None, interface=INTERFACE):
+        """
+        Call a method on the service.
+
+        Method calls go straight to the service instead of checking for it
+        first; a missing service costs the same single round trip.
+
+        Raises:
+            ServiceNotRunning: If no GUI or daemon owns the bus name
+        """
+        try:
+            return self.connection.call_sync(
+                BUS_NAME,
+                OBJECT_PATH,
+                interface,
+                method,
+                parameters,
+                GLib.VariantType(reply_type) if reply_type else None,
+                Gio.DBusCallFlags.NO_AUTO_START,
+                -1,
+                None
+            )
+        except GLib.Error as e:
+            if any(e.matches(Gio.dbus_error_quark(), code) for code in _NOT_RUNNING_ERRORS):
+                raise ServiceNotRunning() from e
+            raise
+
+    def is_service_running(self):
+        """Check if the GUI or daemon owns the service name."""
+        result = self.connection.call_sync(
+            'org.freedesktop.DBus',
+            '/org/freedesktop/DBus',
+            'org.freedesktop.DBus',
+            'NameHasOwner',
+            GLib.Variant('(s)', (BUS_NAME,)),
+            GLib.VariantType('(b)'),
+            Gio.DBusCallFlags.NONE,
+            -1,
+            None
+        )
+        return result[0]
+
+    def toggle(self):
+        """Toggle clicking. Returns True if the service accepted the request."""
+        return self._call('Toggle', reply_type='(b)')[0]
+
+    def get_state(self):
+        """Get (running, interval) from the service."""
+        result = self._call('GetState', reply_type='(bd)')
+        return result[0], result[1]
+
+    def set_interval(self, interval):
+        """Set the click interval in seconds."""
+        return self._call('SetInterval', GLib.Variant('(d)', (interval,)), '(b)')[0]
+
+    def get_stats(self):
+        """Get click telemetry as a dict (see ClickEngine.get_stats)."""
+        return self._call('GetStats', reply_type='(a{sv})')[0]
+
+    def add_job(self, button, interval, duration=0.0):
+        """
+        Start a click job alongside the others (see gclicker.jobs).
+
+        Args:
+            button: 'left', 'right' or 'middle'
+            interval: Time between clicks in seconds
+            duration: Seconds to click for (0 clicks until removed)
+
+        Returns:
+            The job's ID
+        """
+        parameters = GLib.Variant('(sdd)', (button, interval, duration))
+        return self._call('AddJob', parameters, '(u)')[0]
+
+    def play_macro(self, path, speed=1.0, repeat=1):
+        """
+        Play a compiled macro as a job over the service's portal session.
+
+        Args:
+            path: Absolute path of the compiled macro, readable by the service
+            speed: Playback speed factor
+            repeat: Times to play it, 0 = until removed
+
+        Returns:
+            The job's ID
+        """
+        parameters = GLib.Variant('(sdu)', (path, speed, repeat))
+        return self._call('PlayMacro', parameters, '(u)')[0]
+
+    def remove_job(self, job_id):
+        """Stop and forget a job. Returns True if it existed."""
+        return self._call('RemoveJob', GLib.Variant('(u)', (job_id,)), '(b)')[0]
+
+    def set_job_interval(self, job_id, interval):
+        """Set a job's click interval in seconds."""
+        return self._call('SetJobInterval', GLib.Variant('(ud)', (job_id, interval)), '(b)')[0]
+
+    def list_jobs(self):
+        """Get every job's settings and progress as a list of dicts."""
+        return self._call('ListJobs', reply_type='(aa{sv})')[0]
+
+    def get_job_stats(self, job_id):
+        """Get one job's click telemetry as a dict."""
+        return self._call('GetJobStats', GLib.Variant('(u)', (job_id,)), '(a{sv})')[0]
+
+    def get_properties(self):
+        """Get all org.gclicker.Control properties as a dict."""
+        result = self._call('GetAll', GLib.Variant('(s)', (INTERFACE,)), '(a{sv})',
+                            interface='org.freedesktop.DBus.Properties')
+        return result[0]
+
+    def subscribe(self, callback):
+        """
+        Call callback(changes) for every StateChanged and PropertiesChanged signal.
+
+        changes is a dict of changed property values, e.g. {'Running': True}.
+        Signals are delivered on the thread-default main context, which must
+        be running. The subscriptions work whether or not the service is
+        running yet.
+
+        Returns:
+            Subscription IDs, for unsubscribe()
+        """
+        def on_state_changed(connection, sender_name, object_path, interface_name,
+                             signal_name, parameters, user_data):
+            callback({'Running': parameters[0], 'Interval': parameters[1]})
+
+        def on_properties_changed(connection, sender_name, object_path, interface_name,
+                                  signal_name, parameters, user_data):
+            if parameters[0] == INTERFACE:
+                callback(parameters[1])
+
+        return [
+            self.connection.signal_subscribe(
+                BUS_NAME, INTERFACE, 'StateChanged', OBJECT_PATH, None,
+                Gio.DBusSignalFlags.NONE, on_state_changed, None
+            ),
+            self.connection.signal_subscribe(
+                BUS_NAME, 'org.freedesktop.DBus.Properties', 'PropertiesChanged', OBJECT_PATH,
+                INTERFACE, Gio.DBusSignalFlags.NONE, on_properties_changed, None
+            ),
+        ]
+
+    def unsubscribe(self, subscription_ids):
+        """Drop subscriptions made by subscribe()."""
+        for subscription_id in subscription_ids:
+            self.connection.signal_unsubscribe(subscription_id)
@@ -0,0 +1,104 @@
+"""Headless gclicker daemon: the D-Bus service and a resident clicker, without GTK."""
+
+import signal
+import sys
+
+from gi.repository import GLib
+
+from gclicker.dbus_service import GClickerDBusService, check_gui_running
+from gclicker.engine import create_clicker
+from gclicker.settings import Settings
+from gclicker.token_cache import DEVICE_KEYBOARD, DEVICE_POINTER
+
+
+def run_daemon(interval=0.1, backend='portal', missed_policy='skip', spin=0.0,
+               event_loop='thread', isolate=False, click_ring=False, **backend_options):
+    """
+    Serve org.gclicker.Service until SIGINT/SIGTERM.
+
+    The clicker and its portal session stay alive between toggles, so
+    `gclicker-cli --toggle` is a single D-Bus call. Further click jobs
+    (`gclicker-cli --add-job`) share that session and the click thread.
+
+    Args:
+        interval: Click interval in seconds
+        backend: Click backend name ('portal', 'uinput' or 'null')
+        missed_policy: How to handle missed click deadlines ('skip' or 'catch-up')
+        spin: High-resolution timer spin budget in seconds (0 disables it)
+        event_loop: How the click thread waits ('thread' or 'glib')
+        isolate: Run the click engine in a child process
+        click_ring: Publish every click to a shared-memory ring
+        **backend_options: Backend-specific options (e.g. dispatch, max_in_flight
+            and use_eis for the portal backend)
+
+    Returns:
+        Process exit code
+    """
+    if check_gui_running():
+        print("Error: gclicker is already running (GUI or daemon)", file=sys.stderr)
+        return 1
+
+    settings = Settings()
+    if backend == 'portal':
+        backend_options.setdefault('keep_alive', settings.get('keep_alive', True))
+        if settings.get('keyboard', False):
+            backend_options.setdefault('device_types', DEVICE_POINTER | DEVICE_KEYBOARD)
+
+    clicker = create_clicker(interval, backend, missed_policy=missed_policy, spin=spin,
+                             event_loop=event_loop, isolate=isolate, click_ring=click_ring,
+                             jobs=True, **backend_options)
+    loop = GLib.MainLoop()
+
+    def on_state_changed(running, interval):
+        print(f"{'Started' if running else 'Stopped'} clicking (interval: {interval}s)",
+              flush=True)
+
+    def on_name_lost():
+        # Another instance owns the name, so nobody can reach this one
+        loop.quit()
+
+    service = GClickerDBusService(
+        clicker,
+        on_state_changed=on_state_changed,
+        prewarm=settings.get('prewarm', True),
+        on_name_lost=on_name_lost,
+        max_property_rate=settings.get('max_property_rate', 10.0)
+    )
+    if not service.start():
+        clicker.cleanup()
+        return 1
+
+    def on_settings_changed(changed):
+        # The interval was changed in settings.json, e.g. by hand
+        if 'interval' in changed:
+            clicker.set_interval(settings.get('interval'))
+            service.notify_state_changed()
+
+    settings.watch(on_settings_changed)
+
+    def on_signal():
+        loop.quit()
+        return GLib.SOURCE_REMOVE
+
+    GLib.unix_signal_add(GLib.PRIORITY_DEFAULT, signal.SIGINT, on_signal)
+    GLib.unix_signal_add(GLib.PRIORITY_DEFAULT, signal.SIGTERM, on_signal)
+
+    print("gclicker daemon running - toggle with: gclicker-cli --toggle", flush=True)
+    try:
+        loop.run()
+    finally:
+        settings.unwatch()
+        service.stop()
+        clicker.cleanup()
+
+    return 0
+
+
+def main():
+    """Entry point for gclicker-daemon; takes the same clicker options as gclicker-cli."""
+    from gclicker.cli import main_cli
+    main_cli(['--daemon'] + sys.argv[1:])
+
+
+if __name__ == '__main__':
+    main()
@@ -1,8 +1,15 @@
 """D-Bus service for gclicker GUI/CLI communication."""
 
-import threading
+import math
+import time
+
 from gi.repository import Gio, GLib
-from gclicker.wayland_clicker import WaylandPortalClicker
+
+from gclicker import control
+from gclicker.backends import BUTTON_NAMES
+from gclicker.control import ControlClient
+from gclicker.jobs import MAIN_JOB
+from gclicker.scheduler import MIN_INTERVAL
 
 
 # D-Bus XML interface definition
@@ -20,35 +27,108 @@ DBUS_INTERFACE = '''
       <arg type='d' name='interval' direction='in'/>
       <arg type='b' name='success' direction='out'/>
     </method>
+    <method name='GetStats'>
+      <arg type='a{sv}' name='stats' direction='out'/>
+    </method>
+    <method name='AddJob'>
+      <arg type='s' name='button' direction='in'/>
+      <arg type='d' name='interval' direction='in'/>
+      <arg type='d' name='duration' direction='in'/>
+      <arg type='u' name='id' direction='out'/>
+    </method>
+    <method name='RemoveJob'>
+      <arg type='u' name='id' direction='in'/>
+      <arg type='b' name='success' direction='out'/>
+    </method>
+    <method name='SetJobInterval'>
+      <arg type='u' name='id' direction='in'/>
+      <arg type='d' name='interval' direction='in'/>
+      <arg type='b' name='success' direction='out'/>
+    </method>
+    <method name='ListJobs'>
+      <arg type='aa{sv}' name='jobs' direction='out'/>
+    </method>
+    <method name='PlayMacro'>
+      <arg type='s' name='path' direction='in'/>
+      <arg type='d' name='speed' direction='in'/>
+      <arg type='u' name='repeat' direction='in'/>
+      <arg type='u' name='id' direction='out'/>
+    </method>
+    <method name='GetJobStats'>
+      <arg type='u' name='id' direction='in'/>
+      <arg type='a{sv}' name='stats' direction='out'/>
+    </method>
     <signal name='StateChanged'>
       <arg type='b' name='running'/>
       <arg type='d' name='interval'/>
     </signal>
+    <property name='Running' type='b' access='read'/>
+    <property name='Interval' type='d' access='read'/>
+    <property name='ClickCount' type='t' access='read'/>
+    <property name='AchievedRate' type='d' access='read'/>
+    <property name='LastError' type='s' access='read'/>
   </interface>
 </node>
 '''
 
 
+def _valid_interval(interval):
+    """Check an interval from a method call: finite and at least MIN_INTERVAL."""
+    return math.isfinite(interval) and interval >= MIN_INTERVAL
+
+
 class GClickerDBusService:
     """D-Bus service for controlling gclicker."""
 
-    BUS_NAME = 'org.gclicker.Service'
-    OBJECT_PATH = '/org/gclicker/Control'
+    BUS_NAME = control.BUS_NAME
+    OBJECT_PATH = control.OBJECT_PATH
+
+    # D-Bus types of the org.gclicker.Control properties
+    PROPERTY_TYPES = {
+        'Running': 'b',
+        'Interval': 'd',
+        'ClickCount': 't',
+        'AchievedRate': 'd',
+        'LastError': 's',
+    }
+
+    # Methods that address click jobs by ID
+    JOB_METHODS = ('AddJob', 'PlayMacro', 'RemoveJob', 'SetJobInterval', 'ListJobs',
+                   'GetJobStats')
 
-    def __init__(self, clicker, on_state_changed=None):
+    def __init__(self, clicker, on_state_changed=None, prewarm=False, on_name_lost=None,
+                 max_property_rate=10.0):
         """
         Initialize the D-Bus service.
 
         Args:
-            clicker: WaylandPortalClicker instance to control
+            clicker: ClickEngine instance to control
             on_state_changed: Callback function when state changes (running, interval)
+            prewarm: Prepare the clicker's backend as soon as the service
+                starts, so the first Toggle does not wait for portal setup
+            on_name_lost: Callback function when the bus name cannot be owned
+            max_property_rate: Most PropertiesChanged signals per second; changes
+                in between are coalesced into the next one
+
+        Raises:
+            ValueError: If max_property_rate is not positive
         """
+        if max_property_rate <= 0:
+            raise ValueError(f"max_property_rate must be positive, got {max_property_rate}")
         self.clicker = clicker
         self.on_state_changed = on_state_changed
+        self.prewarm = prewarm
+        self.on_name_lost = on_name_lost
+        self.max_property_rate = max_property_rate
         self.connection = None
         self.registration_id = None
         self.name_owner_id = None
 
+        # PropertiesChanged coalescing
+        self._published = {}  # Property values as last announced
+        self._properties_source = None
+        self._properties_emitted_at = 0.0
+
     def _handle_method_call(self, connection, sender, object_path, interface_name,
                            method_name, parameters, invocation):
         """Handle D-Bus method calls."""
@@ -62,12 +142,25 @@ class GClickerDBusService:
                 interval = self.clicker.interval
                 invocation.return_value(GLib.Variant('(bd)', (running, interval)))
 
+            elif method_name == 'GetStats':
+                invocation.return_value(GLib.Variant('(a{sv})', (self._stats_variants(),)))
+
             elif method_name == 'SetInterval':
                 interval = parameters[0]
+                if not _valid_interval(interval):
+                    invocation.return_error_literal(
+                        Gio.dbus_error_quark(),
+                        Gio.DBusError.INVALID_ARGS,
+                        f"Invalid interval: {interval}"
+                    )
+                    return
                 self.clicker.set_interval(interval)
                 self._emit_state_changed()
                 invocation.return_value(GLib.Variant('(b)', (True,)))
 
+            elif method_name in self.JOB_METHODS:
+                self._handle_job_method(method_name, parameters, invocation)
+
             else:
                 invocation.return_error_literal(
                     Gio.dbus_error_quark(),
@@ -81,25 +174,177 @@ class GClickerDBusService:
                 f"Method call failed: {e}"
             )
 
+    def _handle_job_method(self, method_name, parameters, invocation):
+        """Handle the methods addressing click jobs by ID (see gclicker.jobs)."""
+        clicker = self.clicker
+        if not hasattr(clicker, 'add_job'):
+            invocation.return_error_literal(
+                Gio.dbus_error_quark(),
+                Gio.DBusError.NOT_SUPPORTED,
+                "Click jobs need the 'thread' event loop without isolation"
+            )
+            return
+
+        try:
+            if method_name == 'AddJob':
+                button_name, interval, duration = parameters.unpack()
+                button = BUTTON_NAMES.get(button_name)
+                if button is None:
+                    raise ValueError(f"unknown button: {button_name!r}")
+                if not _valid_interval(interval):
+                    raise ValueError(f"invalid interval: {interval}")
+                if not (math.isfinite(duration) and duration >= 0):
+                    raise ValueError(f"invalid duration: {duration}")
+                job_id = clicker.add_job(button, interval, duration)
+                invocation.return_value(GLib.Variant('(u)', (job_id,)))
+
+            elif method_name == 'PlayMacro':
+                path, speed, repeat = parameters.unpack()
+                job_id = clicker.add_macro(path, speed, repeat)
+                invocation.return_value(GLib.Variant('(u)', (job_id,)))
+
+            elif method_name == 'RemoveJob':
+                job_id = parameters[0]
+                if job_id == MAIN_JOB:
+                    if clicker.is_running():
+                        self._toggle()
+                    success = True
+                else:
+                    success = clicker.remove_job(job_id)
+                invocation.return_value(GLib.Variant('(b)', (success,)))
+
+            elif method_name == 'SetJobInterval':
+                job_id, interval = parameters.unpack()
+                if not _valid_interval(interval):
+                    raise ValueError(f"invalid interval: {interval}")
+                clicker.set_job_interval(job_id, interval)
+                if job_id == MAIN_JOB:
+                    self._emit_state_changed()
+                invocation.return_value(GLib.Variant('(b)', (True,)))
+
+            elif method_name == 'ListJobs':
+                jobs = [self._to_variants(self._job_info(job)) for job in clicker.get_jobs()]
+                invocation.return_value(GLib.Variant('(aa{sv})', (jobs,)))
+
+            elif method_name == 'GetJobStats':
+                stats = clicker.get_job_stats(parameters[0])
+                invocation.return_value(GLib.Variant('(a{sv})', (self._to_variants(stats),)))
+
+        except (KeyError, ValueError, OSError) as e:
+            message = f"No job {e.args[0]}" if isinstance(e, KeyError) else str(e)
+            invocation.return_error_literal(
+                Gio.dbus_error_quark(),
+                Gio.DBusError.INVALID_ARGS,
+                message
+            )
+
+    @staticmethod
+    def _job_info(info):
+        """Give a job's button by name where it has one."""
+        info = dict(info)
+        if 'button' in info:
+            names = {code: name for name, code in BUTTON_NAMES.items()}
+            info['button'] = names.get(info['button'], str(info['button']))
+        return info
+
+    @staticmethod
+    def _to_variants(values):
+        """Convert a dict of bools, ints, floats and strings to GLib.Variant values."""
+        variants = {}
+        for key, value in values.items():
+            if isinstance(value, bool):
+                variants[key] = GLib.Variant('b', value)
+            elif isinstance(value, int):
+                variants[key] = GLib.Variant('t', value)
+            elif isinstance(value, str):
+                variants[key] = GLib.Variant('s', value)
+            else:
+                variants[key] = GLib.Variant('d', value)
+        return variants
+
+    def _stats_variants(self):
+        """Get the clicker's stats as a dict of GLib.Variant values."""
+        return self._to_variants(self.clicker.get_stats())
+
+    def _get_properties(self):
+        """Get the current values of all properties."""
+        clicker = self.clicker
+        return {
+            'Running': clicker.is_running(),
+            'Interval': clicker.interval,
+            'ClickCount': clicker.stats.count,
+            'AchievedRate': clicker.stats.get_rate(),
+            'LastError': clicker.last_error,
+        }
+
+    def _handle_get_property(self, connection, sender, object_path, interface_name,
+                             property_name):
+        """Handle org.freedesktop.DBus.Properties.Get/GetAll."""
+        value = self._get_properties()[property_name]
+        return GLib.Variant(self.PROPERTY_TYPES[property_name], value)
+
+    def _schedule_properties_changed(self):
+        """
+        Emit PropertiesChanged soon, at most max_property_rate times a second.
+
+        While clicking, the counters change with every click without telling
+        the service, so they are re-checked at that rate until clicking stops.
+        """
+        if self._properties_source is not None or not self.connection:
+            return
+
+        min_gap = 1.0 / self.max_property_rate
+        delay = max(0.0, self._properties_emitted_at + min_gap - time.monotonic())
+        self._properties_source = GLib.timeout_add(int(delay * 1000), self._on_properties_timer)
+
+    def _on_properties_timer(self):
+        self._properties_source = None
+        self._emit_properties_changed()
+        if self.clicker.is_running():
+            self._schedule_properties_changed()
+        return False
+
+    def _emit_properties_changed(self):
+        """Emit PropertiesChanged for properties that differ from what was last announced."""
+        if not self.connection:
+            return
+
+        self._properties_emitted_at = time.monotonic()
+        changed = {}
+        for name, value in self._get_properties().items():
+            if self._published.get(name) != value:
+                self._published[name] = value
+                changed[name] = GLib.Variant(self.PROPERTY_TYPES[name], value)
+        if not changed:
+            return
+
+        try:
+            self.connection.emit_signal(
+                None,
+                self.OBJECT_PATH,
+                'org.freedesktop.DBus.Properties',
+                'PropertiesChanged',
+                GLib.Variant('(sa{sv}as)', ('org.gclicker.Control', changed, []))
+            )
+        except Exception as e:
+            print(f"Error emitting properties changed signal: {e}")
+
+    def notify_state_changed(self):
+        """Announce a state change made outside the service (e.g. by the GUI's buttons)."""
+        self._emit_state_changed()
+
     def _toggle(self):
         """Toggle the clicker state."""
         if self.clicker.is_running():
             self.clicker.stop()
         else:
-            # Start in a thread to avoid blocking
-            def start_thread():
-                success = self.clicker.start()
-                # Emit state change after starting
-                GLib.idle_add(self._emit_state_changed)
-                # Notify the callback
+            # Setup runs asynchronously on the service's main context
+            def on_started(success):
+                self._emit_state_changed()
                 if self.on_state_changed:
-                    GLib.idle_add(lambda: self.on_state_changed(
-                        self.clicker.is_running(),
-                        self.clicker.interval
-                    ))
-                return False
+                    self.on_state_changed(self.clicker.is_running(), self.clicker.interval)
 
-            threading.Thread(target=start_thread, daemon=True).start()
+            self.clicker.start_async(on_started)
             # Return True immediately, actual state change will be signaled
             return True
 
@@ -117,6 +362,8 @@ class GClickerDBusService:
         if not self.connection:
             return
 
+        self._schedule_properties_changed()
+
         try:
             running = self.clicker.is_running()
             interval = self.clicker.interval
@@ -146,9 +393,10 @@ class GClickerDBusService:
                 self.OBJECT_PATH,
                 interface_info,
                 self._handle_method_call,
-                None,  # get_property
-                None   # set_property
+                self._handle_get_property,
+                None   # set_property (all properties are read-only)
             )
+            self._published = self._get_properties()
 
             # Own the bus name
             def on_bus_acquired(connection, name):
@@ -159,6 +407,8 @@ class GClickerDBusService:
 
             def on_name_lost(connection, name):
                 print(f"D-Bus service lost name: {name}")
+                if self.on_name_lost:
+                    self.on_name_lost()
 
             self.name_owner_id = Gio.bus_own_name(
                 Gio.BusType.SESSION,
@@ -169,6 +419,9 @@ class GClickerDBusService:
                 on_name_lost
             )
 
+            if self.prewarm:
+                self.clicker.prewarm()
+
             return True
 
         except Exception as e:
@@ -177,6 +430,10 @@ class GClickerDBusService:
 
     def stop(self):
         """Stop the D-Bus service."""
+        if self._properties_source is not None:
+            GLib.source_remove(self._properties_source)
+            self._properties_source = None
+
         if self.registration_id:
             self.connection.unregister_object(self.registration_id)
             self.registration_id = None
@@ -189,24 +446,9 @@ class GClickerDBusService:
 
 
 def check_gui_running():
-    """Check if the GUI is running by checking for the D-Bus service."""
+    """Check if the GUI or daemon is running by checking for the D-Bus service."""
     try:
-        connection = Gio.bus_get_sync(Gio.BusType.SESSION, None)
-
-        # Try to call a method to see if the service exists
-        result = connection.call_sync(
-            'org.freedesktop.DBus',
-            '/org/freedesktop/DBus',
-            'org.freedesktop.DBus',
-            'NameHasOwner',
-            GLib.Variant('(s)', (GClickerDBusService.BUS_NAME,)),
-            GLib.VariantType('(b)'),
-            Gio.DBusCallFlags.NONE,
-            -1,
-            None
-        )
-
-        return result[0]
+        return ControlClient().is_service_running()
     except Exception:
         return False
 
@@ -214,21 +456,7 @@ def check_gui_running():
 def call_toggle():
     """Call the Toggle method on the D-Bus service."""
     try:
-        connection = Gio.bus_get_sync(Gio.BusType.SESSION, None)
-
-        result = connection.call_sync(
-            GClickerDBusService.BUS_NAME,
-            GClickerDBusService.OBJECT_PATH,
-            'org.gclicker.Control',
-            'Toggle',
-            None,
-            GLib.VariantType('(b)'),
-            Gio.DBusCallFlags.NONE,
-            -1,
-            None
-        )
-
-        return result[0]
+        return ControlClient().toggle()
     except Exception as e:
         print(f"Failed to call Toggle: {e}")
         return False
@@ -237,21 +465,16 @@ def call_toggle():
 def get_state():
     """Get the current state from the D-Bus service."""
     try:
-        connection = Gio.bus_get_sync(Gio.BusType.SESSION, None)
-
-        result = connection.call_sync(
-            GClickerDBusService.BUS_NAME,
-            GClickerDBusService.OBJECT_PATH,
-            'org.gclicker.Control',
-            'GetState',
-            None,
-            GLib.VariantType('(bd)'),
-            Gio.DBusCallFlags.NONE,
-            -1,
-            None
-        )
-
-        return result[0], result[1]  # running, interval
+        return ControlClient().get_state()
     except Exception as e:
         print(f"Failed to get state: {e}")
         return False, 0.0
+
+
+def get_stats():
+    """Get click telemetry from the D-Bus service."""
+    try:
+        return ControlClient().get_stats()
+    except Exception as e:
+        print(f"Failed to get stats: {e}")
+        return {}
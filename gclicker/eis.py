@@ -0,0 +1,363 @@
+"""Minimal libei (ei protocol) sender client for RemoteDesktop ConnectToEIS sockets."""
+
+import select
+import socket
+import struct
+import time
+
+
+# Message header: object id (u64), message length in bytes (u32), opcode (u32)
+HEADER = struct.Struct('=QII')
+
+# Context types for ei_handshake.context_type
+CONTEXT_TYPE_SENDER = 2
+
+# Interfaces this client speaks, with the version it supports
+INTERFACE_VERSIONS = {
+    'ei_connection': 1,
+    'ei_callback': 1,
+    'ei_pingpong': 1,
+    'ei_seat': 1,
+    'ei_device': 1,
+    'ei_button': 1,
+}
+
+# ei_handshake
+HANDSHAKE_REQ_HANDSHAKE_VERSION = 0
+HANDSHAKE_REQ_FINISH = 1
+HANDSHAKE_REQ_CONTEXT_TYPE = 2
+HANDSHAKE_REQ_NAME = 3
+HANDSHAKE_REQ_INTERFACE_VERSION = 4
+HANDSHAKE_EV_HANDSHAKE_VERSION = 0
+HANDSHAKE_EV_INTERFACE_VERSION = 1
+HANDSHAKE_EV_CONNECTION = 2
+
+# ei_connection
+CONNECTION_REQ_DISCONNECT = 1
+CONNECTION_EV_DISCONNECTED = 0
+CONNECTION_EV_SEAT = 1
+CONNECTION_EV_INVALID_OBJECT = 2
+CONNECTION_EV_PING = 3
+
+# ei_pingpong
+PINGPONG_REQ_DONE = 0
+
+# ei_seat
+SEAT_REQ_BIND = 1
+SEAT_EV_DESTROYED = 0
+SEAT_EV_CAPABILITY = 2
+SEAT_EV_DONE = 3
+SEAT_EV_DEVICE = 4
+
+# ei_device
+DEVICE_REQ_START_EMULATING = 1
+DEVICE_REQ_STOP_EMULATING = 2
+DEVICE_REQ_FRAME = 3
+DEVICE_EV_DESTROYED = 0
+DEVICE_EV_INTERFACE = 5
+DEVICE_EV_DONE = 6
+DEVICE_EV_RESUMED = 7
+DEVICE_EV_PAUSED = 8
+
+# ei_button
+BUTTON_REQ_BUTTON = 1
+BUTTON_STATE_RELEASED = 0
+BUTTON_STATE_PRESSED = 1
+
+
+class EisError(Exception):
+    """Raised when the EIS connection fails or is closed."""
+
+
+def _pack_string(value):
+    """Encode a string argument: length including NUL, bytes, padding to 4 bytes."""
+    data = value.encode('utf-8') + b'\0'
+    padding = -len(data) % 4
+    return struct.pack('=I', len(data)) + data + b'\0' * padding
+
+
+def _unpack_string(data, offset):
+    """Decode a string argument, returning (value, new offset)."""
+    (length,) = struct.unpack_from('=I', data, offset)
+    offset += 4
+    if length == 0:
+        return None, offset
+    value = data[offset:offset + length - 1].decode('utf-8')
+    offset += length + (-length % 4)
+    return value, offset
+
+
+class EisClient:
+    """Sender-side ei protocol client that emulates pointer button events."""
+
+    def __init__(self, fd, name='gclicker'):
+        """
+        Initialize the client.
+
+        Args:
+            fd: Connected socket file descriptor from ConnectToEIS (ownership is taken)
+            name: Client name announced to the EIS implementation
+        """
+        self._sock = socket.socket(fileno=fd)
+        self._name = name
+        self._buffer = b''
+        self._pending = []  # Outgoing messages batched until flush()
+
+        self._interfaces = {0: 'ei_handshake'}
+        self._last_serial = 0
+        self._sequence = 0
+
+        self._connection = None
+        self._seats = {}           # seat id -> {'caps': {interface: mask}, 'bound': bool}
+        self._devices = {}         # device id -> {'button': id or None, 'done': bool}
+        self._device = None        # Device used for clicking
+        self._button = None        # ei_button object on that device
+        self._resumed = False
+        self._emulating = False
+
+    def fileno(self):
+        """Get the socket file descriptor."""
+        return self._sock.fileno()
+
+    def connect(self, timeout=5.0):
+        """
+        Run the handshake and wait for a resumed device with button support.
+
+        Args:
+            timeout: Seconds to wait before giving up
+
+        Raises:
+            EisError: If the handshake fails or no usable device appears
+        """
+        deadline = time.monotonic() + timeout
+        while not (self._button and self._resumed):
+            remaining = deadline - time.monotonic()
+            if remaining <= 0:
+                raise EisError("Timeout waiting for an EIS button device")
+            self._read(remaining)
+            self.flush()
+
+    # Outgoing messages
+
+    def _queue(self, object_id, opcode, payload=b''):
+        self._pending.append(HEADER.pack(object_id, HEADER.size + len(payload), opcode) + payload)
+
+    def flush(self):
+        """Send all batched messages in a single write."""
+        if not self._pending:
+            return
+        data = b''.join(self._pending)
+        self._pending.clear()
+        try:
+            self._sock.sendall(data)
+        except OSError as e:
+            raise EisError(f"EIS connection lost: {e}")
+
+    # Incoming messages
+
+    def _read(self, timeout):
+        """Wait up to timeout seconds for data and dispatch complete messages."""
+        ready, _, _ = select.select([self._sock], [], [], timeout)
+        if not ready:
+            return
+        try:
+            data = self._sock.recv(65536)
+        except BlockingIOError:
+            return
+        except OSError as e:
+            raise EisError(f"EIS connection lost: {e}")
+        if not data:
+            raise EisError("EIS connection closed")
+        self._buffer += data
+        self._dispatch_buffer()
+
+    def process_events(self):
+        """Handle any events that have arrived without blocking."""
+        self._read(0)
+        self.flush()
+
+    def _dispatch_buffer(self):
+        buffer = self._buffer
+        offset = 0
+        while len(buffer) - offset >= HEADER.size:
+            object_id, length, opcode = HEADER.unpack_from(buffer, offset)
+            if length < HEADER.size:
+                raise EisError("Malformed EIS message")
+            if len(buffer) - offset < length:
+                break
+            self._handle_event(object_id, opcode, buffer[offset + HEADER.size:offset + length])
+            offset += length
+        self._buffer = buffer[offset:]
+
+    def _handle_event(self, object_id, opcode, payload):
+        interface = self._interfaces.get(object_id)
+        if interface == 'ei_handshake':
+            self._handle_handshake(opcode, payload)
+        elif interface == 'ei_connection':
+            self._handle_connection(opcode, payload)
+        elif interface == 'ei_seat':
+            self._handle_seat(object_id, opcode, payload)
+        elif interface == 'ei_device':
+            self._handle_device(object_id, opcode, payload)
+        # Events for other interfaces (callbacks, buttons, ...) are ignored
+
+    def _handle_handshake(self, opcode, payload):
+        if opcode == HANDSHAKE_EV_HANDSHAKE_VERSION:
+            (version,) = struct.unpack_from('=I', payload)
+            self._queue(0, HANDSHAKE_REQ_HANDSHAKE_VERSION, struct.pack('=I', min(version, 1)))
+            self._queue(0, HANDSHAKE_REQ_CONTEXT_TYPE, struct.pack('=I', CONTEXT_TYPE_SENDER))
+            self._queue(0, HANDSHAKE_REQ_NAME, _pack_string(self._name))
+            for name, version in INTERFACE_VERSIONS.items():
+                self._queue(0, HANDSHAKE_REQ_INTERFACE_VERSION,
+                            _pack_string(name) + struct.pack('=I', version))
+            self._queue(0, HANDSHAKE_REQ_FINISH)
+
+        elif opcode == HANDSHAKE_EV_CONNECTION:
+            serial, connection_id, _version = struct.unpack_from('=IQI', payload)
+            self._last_serial = serial
+            self._connection = connection_id
+            self._interfaces[connection_id] = 'ei_connection'
+
+    def _handle_connection(self, opcode, payload):
+        if opcode == CONNECTION_EV_SEAT:
+            seat_id, _version = struct.unpack_from('=QI', payload)
+            self._interfaces[seat_id] = 'ei_seat'
+            self._seats[seat_id] = {'caps': {}, 'bound': False}
+
+        elif opcode == CONNECTION_EV_PING:
+            ping_id, _version = struct.unpack_from('=QI', payload)
+            self._queue(ping_id, PINGPONG_REQ_DONE, struct.pack('=Q', 0))
+
+        elif opcode == CONNECTION_EV_DISCONNECTED:
+            _serial, _reason = struct.unpack_from('=II', payload)
+            explanation, _ = _unpack_string(payload, 8)
+            raise EisError(f"EIS disconnected: {explanation or 'no reason given'}")
+
+    def _handle_seat(self, seat_id, opcode, payload):
+        seat = self._seats.get(seat_id)
+        if seat is None:
+            return
+
+        if opcode == SEAT_EV_CAPABILITY:
+            (mask,) = struct.unpack_from('=Q', payload)
+            interface, _ = _unpack_string(payload, 8)
+            seat['caps'][interface] = mask
+
+        elif opcode == SEAT_EV_DONE:
+            mask = seat['caps'].get('ei_button')
+            if mask and not seat['bound']:
+                self._queue(seat_id, SEAT_REQ_BIND, struct.pack('=Q', mask))
+                seat['bound'] = True
+
+        elif opcode == SEAT_EV_DEVICE:
+            device_id, _version = struct.unpack_from('=QI', payload)
+            self._interfaces[device_id] = 'ei_device'
+            self._devices[device_id] = {'button': None, 'done': False}
+
+        elif opcode == SEAT_EV_DESTROYED:
+            del self._seats[seat_id]
+
+    def _handle_device(self, device_id, opcode, payload):
+        device = self._devices.get(device_id)
+        if device is None:
+            return
+
+        if opcode == DEVICE_EV_INTERFACE:
+            (object_id,) = struct.unpack_from('=Q', payload)
+            interface, _ = _unpack_string(payload, 8)
+            self._interfaces[object_id] = interface
+            if interface == 'ei_button':
+                device['button'] = object_id
+
+        elif opcode == DEVICE_EV_DONE:
+            device['done'] = True
+            if self._device is None and device['button']:
+                self._device = device_id
+                self._button = device['button']
+
+        elif opcode == DEVICE_EV_RESUMED:
+            (self._last_serial,) = struct.unpack_from('=I', payload)
+            if device_id == self._device:
+                self._resumed = True
+
+        elif opcode == DEVICE_EV_PAUSED:
+            (self._last_serial,) = struct.unpack_from('=I', payload)
+            if device_id == self._device:
+                self._resumed = False
+                self._emulating = False
+
+        elif opcode == DEVICE_EV_DESTROYED:
+            del self._devices[device_id]
+            if device_id == self._device:
+                self._device = None
+                self._button = None
+                self._resumed = False
+                self._emulating = False
+
+    # Emulation
+
+    def is_ready(self):
+        """Check if a resumed button device is available."""
+        return bool(self._button and self._resumed)
+
+    def queue_button(self, button, pressed):
+        """
+        Queue a button event and the frame that completes it.
+
+        Nothing is sent until flush() is called, so several frames can be
+        written to the socket at once.
+
+        Args:
+            button: Linux input event code (e.g. 0x110 for BTN_LEFT)
+            pressed: True for press, False for release
+        """
+        if not self.is_ready():
+            raise EisError("No resumed EIS button device")
+
+        if not self._emulating:
+            self._sequence += 1
+            self._queue(self._device, DEVICE_REQ_START_EMULATING,
+                        struct.pack('=II', self._last_serial, self._sequence))
+            self._emulating = True
+
+        state = BUTTON_STATE_PRESSED if pressed else BUTTON_STATE_RELEASED
+        self._queue(self._button, BUTTON_REQ_BUTTON, struct.pack('=II', button, state))
+        self._queue(self._device, DEVICE_REQ_FRAME,
+                    struct.pack('=IQ', self._last_serial, time.monotonic_ns() // 1000))
+
+    def close(self):
+        """Stop emulating and disconnect."""
+        try:
+            if self._emulating and self._device:
+                self._queue(self._device, DEVICE_REQ_STOP_EMULATING,
+                            struct.pack('=I', self._last_serial))
+            if self._connection:
+                self._queue(self._connection, CONNECTION_REQ_DISCONNECT)
+            self.flush()
+        except EisError:
+            pass
+        finally:
+            self._sock.close()
+
+
+def connect_eis_fd(fd, timeout=5.0):
+    """
+    Create an EisClient for a ConnectToEIS file descriptor and run the handshake.
+
+    Args:
+        fd: Socket file descriptor returned by the portal
+        timeout: Seconds to wait for a usable device
+
+    Returns:
+        Connected EisClient
+
+    Raises:
+        EisError: If the handshake fails
+    """
+    client = EisClient(fd)
+    try:
+        client.connect(timeout)
+    except Exception:
+        client.close()
+        raise
+    return client
@@ -0,0 +1,307 @@
+"""Click engine: schedules clicks and hands them to a backend."""
+
+import threading
+import time
+
+from gclicker.backends import BTN_LEFT, create_backend
+from gclicker.click_ring import ClickRing
+from gclicker.profiling import instrument
+from gclicker.recovery import CircuitBreaker, ErrorLog
+from gclicker.scheduler import MIN_INTERVAL, DeadlineScheduler
+from gclicker.stats import ClickStats
+
+
+EVENT_LOOPS = ('thread', 'glib')
+
+# How often the click thread checks whether clicking can resume while the
+# backend is down or the circuit breaker is open, in seconds
+IDLE_POLL = 0.05
+
+
+class ClickEngine:
+    """Auto-clicker that drives a click backend from a scheduler thread."""
+
+    def __init__(self, interval=0.1, backend=None, missed_policy=DeadlineScheduler.SKIP,
+                 button=BTN_LEFT, press_hold=0.001, spin=0.0, click_ring=False):
+        """
+        Initialize the click engine.
+
+        Args:
+            interval: Time between clicks in seconds (default 0.1s = 100ms)
+            backend: ClickBackend used to inject events
+            missed_policy: How to handle missed click deadlines ('skip' or 'catch-up')
+            button: Linux input event code of the button to click
+            press_hold: Seconds to hold the button down on each click (capped
+                at half the interval)
+            spin: High-resolution timer budget: seconds before each deadline
+                to busy-wait instead of sleeping (0 disables spinning)
+            click_ring: Publish every click to a shared-memory ring under
+                $XDG_RUNTIME_DIR/gclicker (see gclicker.click_ring)
+        """
+        interval = max(MIN_INTERVAL, interval)
+        self.interval = interval
+        self.backend = backend
+        self.button = button
+        self.press_hold = press_hold
+        self.running = False
+        self._starting = False
+        self.stats = ClickStats(ring=ClickRing() if click_ring else None)
+        self.last_error = ''    # Message of the most recent click or setup error
+        self._backend_errors = 0  # backend.errors as last seen by the click thread
+        self._breaker = CircuitBreaker()
+        self._error_log = ErrorLog('Error clicking')
+        self._thread = None
+        self._stop_event = threading.Event()
+        self._scheduler = DeadlineScheduler(interval, policy=missed_policy, spin=spin)
+
+    def set_interval(self, interval):
+        """Set the click interval in seconds."""
+        self.interval = max(MIN_INTERVAL, interval)
+        self._scheduler.set_interval(self.interval)
+
+    def get_lag(self):
+        """Get how far behind schedule the most recent click fired, in seconds."""
+        return self._scheduler.lag
+
+    def get_schedule_stats(self):
+        """Get tick, missed-deadline and lag counters from the scheduler."""
+        return self._scheduler.get_stats()
+
+    def get_stats(self):
+        """
+        Get click telemetry for the current run.
+
+        Returns:
+            Dict with achieved rate, latency percentiles, jitter, missed
+            deadlines and error counts (see ClickStats.get_summary)
+        """
+        stats = self.stats.get_summary()
+        stats['errors'] += self.backend.errors
+        stats['missed'] = self._scheduler.missed
+        stats['max_lag'] = self._scheduler.max_lag
+        stats['interval'] = self.interval
+        return stats
+
+    def _click(self):
+        """
+        Perform a single click through the backend.
+
+        Returns:
+            True if the click went out
+        """
+        backend = self.backend
+        if not backend.is_ready():
+            return False
+
+        try:
+            press_sent = time.monotonic()
+            backend.press(self.button)
+            press_ack = time.monotonic()
+            hold = min(self.press_hold, self.interval / 2)
+            if hold > 0:
+                # Release even if stop() interrupts the hold
+                self._scheduler.sleep_until(press_ack + hold, self._stop_event)
+            backend.release(self.button)
+            self.stats.record(self._scheduler.deadline, press_sent, press_ack, time.monotonic())
+            return True
+        except Exception as e:
+            self._record_error(e)
+            return False
+
+    def _record_error(self, error):
+        """Count and report a failed click."""
+        self.stats.record_error(self._scheduler.deadline)
+        self.last_error = str(error)
+        self._error_log.report(self.last_error)
+        self._click_failed()
+
+    def _click_failed(self):
+        """Feed a failure to the circuit breaker, pausing clicks if they keep failing."""
+        delay = self._breaker.record_failure()
+        if delay is not None:
+            print(f"Clicks keep failing, pausing for {delay:.1f}s", flush=True)
+            self.backend.recover()
+
+    def _click_succeeded(self):
+        """Close the circuit breaker after it paused clicks."""
+        if self._breaker.record_success():
+            self._error_log.flush()
+            print("Clicking again", flush=True)
+
+    def _can_click(self):
+        """Check if the backend is up and the circuit breaker lets clicks through."""
+        return self.backend.is_ready() and self._breaker.allow()
+
+    def _check_backend_errors(self):
+        """
+        Pick up errors that pipelined replies reported after the click returned.
+
+        Returns:
+            True if there were any
+        """
+        if self.backend.errors == self._backend_errors:
+            return False
+        self._backend_errors = self.backend.errors
+        self.last_error = self.backend.last_error
+        self._click_failed()
+        return True
+
+    def _click_loop(self):
+        """Main clicking loop."""
+        # Deadlines are absolute, so time spent inside _click() does not
+        # stretch the interval
+        self._scheduler.reset()
+        self._backend_errors = self.backend.errors
+        self._breaker = CircuitBreaker()
+        try:
+            while self._scheduler.wait(self._stop_event):
+                if not self._can_click():
+                    # Poll slowly instead of once per interval until the
+                    # backend is back, then restart the schedule from there
+                    while not self._can_click():
+                        if self._stop_event.wait(IDLE_POLL):
+                            return
+                    self._scheduler.resync()
+                    continue
+                clicked = self._click()
+                if not self._check_backend_errors() and clicked:
+                    self._click_succeeded()
+        finally:
+            self.backend.flush()
+            self._error_log.flush()
+
+    def start(self):
+        """Start auto-clicking, blocking until the backend is set up."""
+        if self.running:
+            return True
+
+        if not self.backend.is_ready() and not self.backend.setup():
+            self.last_error = self.backend.last_error or f"{self.backend.name} backend setup failed"
+            return False
+
+        self._start_thread()
+        return True
+
+    def start_async(self, callback=None):
+        """
+        Start auto-clicking without blocking on backend setup.
+
+        Backend setup runs on the calling thread's thread-default main context.
+
+        Args:
+            callback: Called as callback(success) once clicking has started or setup failed
+        """
+        if self.running or self.backend.is_ready():
+            success = self.start()
+            if callback:
+                callback(success)
+            return
+
+        self._starting = True
+
+        def on_ready(success, error):
+            if error:
+                self.last_error = error
+            # stop() may have been called while the backend was setting up
+            if success and self._starting:
+                self._start_thread()
+            self._starting = False
+            if callback:
+                callback(self.running)
+
+        self.backend.setup_async(on_ready)
+
+    def prewarm(self):
+        """
+        Prepare the backend in the background so the first start is immediate.
+
+        Like start_async(), any setup runs on the calling thread's
+        thread-default main context.
+        """
+        if not self.running and not self._starting:
+            self.backend.prewarm()
+
+    def _start_thread(self):
+        """Start the click thread."""
+        if self.running:
+            return
+
+        # Start clicking
+        self.running = True
+        self.stats.reset()
+        self._stop_event.clear()
+        self._thread = threading.Thread(target=self._click_loop, daemon=True)
+        self._thread.start()
+
+    def stop(self):
+        """Stop auto-clicking."""
+        self._starting = False
+        if not self.running:
+            return
+
+        self.running = False
+        self._stop_event.set()
+
+        # Wake the click thread if the backend is blocked waiting for replies
+        self.backend.interrupt()
+
+        if self._thread:
+            self._thread.join(timeout=1.0)
+        self._thread = None
+
+    def is_running(self):
+        """Check if auto-clicker is running."""
+        return self.running
+
+    def cleanup(self):
+        """Stop clicking and release backend resources."""
+        self.stop()
+        self.backend.close()
+        if self.stats.ring is not None:
+            self.stats.ring.close()
+
+
+def create_clicker(interval=0.1, backend='portal', missed_policy=DeadlineScheduler.SKIP,
+                   spin=0.0, event_loop='thread', isolate=False, click_ring=False,
+                   jobs=False, **backend_options):
+    """
+    Create a click engine with the named backend.
+
+    Args:
+        interval: Click interval in seconds
+        backend: Backend name ('portal', 'uinput' or 'null')
+        missed_policy: How to handle missed click deadlines ('skip' or 'catch-up')
+        spin: High-resolution timer spin budget in seconds (0 disables it)
+        event_loop: How the click thread waits: 'thread' (a plain loop) or
+            'glib' (a private GLib main loop, see GLibClickEngine)
+        isolate: Run the engine in a child process (see IsolatedClickEngine),
+            so it does not share the GIL with the caller
+        click_ring: Publish every click to a shared-memory ring (see
+            gclicker.click_ring)
+        jobs: Return a JobEngine, which can click several jobs at once (see
+            gclicker.jobs); only with the 'thread' event loop and without isolate
+        **backend_options: Passed to the backend constructor
+
+    Set GCLICKER_INSTRUMENT to time the engine's stages (see gclicker.profiling).
+
+    Returns:
+        ClickEngine instance, or an IsolatedClickEngine with the same interface
+    """
+    if isolate:
+        from gclicker.isolated import IsolatedClickEngine
+        return IsolatedClickEngine(interval, backend, missed_policy=missed_policy, spin=spin,
+                                   event_loop=event_loop, click_ring=click_ring,
+                                   **backend_options)
+
+    if event_loop == 'glib':
+        from gclicker.glib_engine import GLibClickEngine as engine_class
+    elif event_loop == 'thread' and jobs:
+        from gclicker.jobs import JobEngine as engine_class
+    elif event_loop == 'thread':
+        engine_class = ClickEngine
+    else:
+        raise ValueError(f"Unknown event loop: {event_loop}")
+
+    engine = engine_class(interval, create_backend(backend, **backend_options),
+                          missed_policy=missed_policy, spin=spin, click_ring=click_ring)
+    return instrument(engine)
@@ -0,0 +1,170 @@
+"""Click engine whose click thread runs a private GLib main loop."""
+
+import time
+
+from gi.repository import GLib
+
+from gclicker.engine import IDLE_POLL, ClickEngine
+from gclicker.recovery import CircuitBreaker
+
+
+class _DeadlineSource(GLib.Source):
+    """GSource dispatched once its ready time (set with set_ready_time) is reached."""
+
+    def __init__(self, on_ready):
+        super().__init__()
+        self._on_ready = on_ready
+
+    def prepare(self):
+        # Readiness comes from the ready time alone
+        return False, -1
+
+    def check(self):
+        return False
+
+    def dispatch(self, callback, args):
+        self._on_ready()
+        return GLib.SOURCE_CONTINUE
+
+
+class GLibClickEngine(ClickEngine):
+    """
+    Click engine driven by a GLib main loop on its click thread.
+
+    Presses and releases are dispatched from one timer source, and the
+    backend's pipelined replies are handled on the same context, so
+    waiting, reply handling and stop requests all go through one poll()
+    instead of Python sleeps and separate reply draining.
+
+    GLib rounds poll timeouts to milliseconds, so the spin budget still
+    applies: the source wakes spin seconds early and busy-waits the rest.
+    """
+
+    def __init__(self, *args, **kwargs):
+        """Initialize the engine; takes the same arguments as ClickEngine."""
+        super().__init__(*args, **kwargs)
+        # Kept across runs, so replies still in flight when one run ends
+        # are handled by the next
+        self._context = GLib.MainContext.new()
+        self._loop = GLib.MainLoop.new(self._context, False)
+        self._source = None
+
+        # The click in progress, between press and release
+        self._release_at = None
+        self._click_deadline = 0.0
+        self._press_sent = 0.0
+        self._press_ack = 0.0
+
+    def set_interval(self, interval):
+        """Set the click interval in seconds."""
+        super().set_interval(interval)
+        if self.running:
+            self._invoke(self._arm)
+
+    def _invoke(self, func):
+        """Run func on the click thread's main loop, from any thread."""
+        def callback(*args):
+            func()
+            return GLib.SOURCE_REMOVE
+
+        source = GLib.idle_source_new()
+        source.set_priority(GLib.PRIORITY_HIGH)
+        source.set_callback(callback)
+        source.attach(self._context)
+
+    def _arm(self):
+        """Make the source ready at the next press or release, less the spin budget."""
+        if self._source is None:
+            return
+        due = self._release_at if self._release_at is not None else self._scheduler.next_deadline
+        delay = due - self._scheduler.spin - time.monotonic()
+        # GLib's monotonic clock is in microseconds with its own origin
+        self._source.set_ready_time(GLib.get_monotonic_time() + max(0, int(delay * 1e6)))
+
+    def _on_ready(self):
+        """Send the due press or release, then re-arm for the next one."""
+        if self._release_at is not None:
+            if not self._scheduler.sleep_until(self._release_at, self._stop_event):
+                self._source.set_ready_time(-1)
+                return
+            self._release()
+        else:
+            if not self._scheduler.sleep_until(self._scheduler.next_deadline, self._stop_event):
+                self._source.set_ready_time(-1)
+                return
+            if not self._can_click():
+                # Poll slowly until the backend is back, restarting the
+                # schedule from then
+                self._scheduler.resync(time.monotonic() + IDLE_POLL)
+                self._arm()
+                return
+            self._scheduler.tick()
+            self._press()
+        self._arm()
+
+    def _press(self):
+        """Press the button and schedule its release."""
+        backend = self.backend
+        try:
+            self._press_sent = time.monotonic()
+            backend.press(self.button)
+            self._press_ack = time.monotonic()
+        except Exception as e:
+            self._record_error(e)
+            return
+
+        self._click_deadline = self._scheduler.deadline
+        hold = min(self.press_hold, self.interval / 2)
+        if hold > 0:
+            self._release_at = self._press_ack + hold
+        else:
+            self._release()
+
+    def _release(self):
+        """Release the button and record the click."""
+        self._release_at = None
+        try:
+            self.backend.release(self.button)
+            self.stats.record(self._click_deadline, self._press_sent, self._press_ack,
+                              time.monotonic())
+        except Exception as e:
+            self._record_error(e)
+            self._check_backend_errors()
+            return
+        if not self._check_backend_errors():
+            self._click_succeeded()
+
+    def _click_loop(self):
+        """Run the main loop until stop()."""
+        context = self._context
+        backend = self.backend
+        context.push_thread_default()
+        backend.set_dispatch_context(context)
+
+        self._scheduler.reset()
+        self._backend_errors = backend.errors
+        self._breaker = CircuitBreaker()
+        self._release_at = None
+        self._source = _DeadlineSource(self._on_ready)
+        self._source.attach(context)
+        self._arm()
+        try:
+            self._loop.run()
+        finally:
+            self._source.destroy()
+            self._source = None
+            # Never leave the button held down
+            if self._release_at is not None:
+                self._release()
+            backend.flush()
+            self._error_log.flush()
+            backend.set_dispatch_context(None)
+            context.pop_thread_default()
+
+    def stop(self):
+        """Stop auto-clicking."""
+        if self.running:
+            # Quit from inside the loop, so this works even if it has not
+            # started running yet
+            self._invoke(self._loop.quit)
+        super().stop()
@@ -4,11 +4,13 @@ import gi
 gi.require_version('Gtk', '4.0')
 gi.require_version('Adw', '1')
 from gi.repository import Gtk, Adw, GLib, Gio
-import threading
 
-from gclicker.wayland_clicker import WaylandPortalClicker
+from gclicker.engine import create_clicker
+from gclicker.scheduler import MIN_INTERVAL
 from gclicker.dbus_service import GClickerDBusService
 from gclicker.settings import Settings
+from gclicker.stats_panel import StatsPanel
+from gclicker.token_cache import DEVICE_KEYBOARD, DEVICE_POINTER
 
 
 class GClickerWindow(Gtk.ApplicationWindow):
@@ -20,18 +22,37 @@ class GClickerWindow(Gtk.ApplicationWindow):
         # Settings
         self.settings = Settings()
 
-        # Initial interval is set via on_interval_changed after spinboxes are created
-        self.clicker = WaylandPortalClicker(interval=0.1)
+        # The spinboxes are set to the saved interval once they are created
+        backend = self.settings.get('backend', 'portal')
+        backend_options = {}
+        if backend == 'portal':
+            backend_options['keep_alive'] = self.settings.get('keep_alive', True)
+            backend_options['dispatch'] = self.settings.get('dispatch', 'sync')
+            if self.settings.get('keyboard', False):
+                backend_options['device_types'] = DEVICE_POINTER | DEVICE_KEYBOARD
+        self.clicker = create_clicker(
+            interval=self.settings.get('interval', 0.1),
+            backend=backend,
+            missed_policy=self.settings.get('missed_policy', 'skip'),
+            spin=self.settings.get('spin', 0.0),
+            event_loop=self.settings.get('event_loop', 'thread'),
+            isolate=self.settings.get('isolate', False),
+            click_ring=self.settings.get('click_ring', False),
+            jobs=True,
+            **backend_options
+        )
 
-        # D-Bus service
+        # D-Bus service (also restores the portal session in the background)
         self.dbus_service = GClickerDBusService(
             self.clicker,
-            on_state_changed=self.on_clicker_state_changed
+            on_state_changed=self.on_clicker_state_changed,
+            prewarm=self.settings.get('prewarm', True),
+            max_property_rate=self.settings.get('max_property_rate', 10.0)
         )
         self.dbus_service.start()
 
         # Window setup
-        self.set_default_size(450, 200)
+        self.set_default_size(560, 380 if self.settings.get('stats_panel', True) else 200)
         self.set_title("GClicker")
 
         # Header bar with menu button
@@ -105,7 +126,24 @@ class GClickerWindow(Gtk.ApplicationWindow):
         ms_box.append(self.milliseconds_spin)
         time_box.append(ms_box)
 
+        # Microseconds
+        us_box = Gtk.Box(orientation=Gtk.Orientation.VERTICAL, spacing=5)
+        us_label = Gtk.Label(label="Microseconds")
+        us_label.add_css_class("caption")
+        us_box.append(us_label)
+
+        us_adj = Gtk.Adjustment(value=0, lower=0, upper=999, step_increment=10, page_increment=100)
+        self.microseconds_spin = Gtk.SpinButton()
+        self.microseconds_spin.set_adjustment(us_adj)
+        self.microseconds_spin.set_digits(0)
+        self.microseconds_spin.set_width_chars(5)
+        self.microseconds_spin.connect("value-changed", self.on_interval_changed)
+        us_box.append(self.microseconds_spin)
+        time_box.append(us_box)
+
         main_box.append(time_box)
+        self._updating_spins = False
+        self._set_interval_spins(self.settings.get('interval', 0.1))
 
         # Control buttons
         button_box = Gtk.Box(orientation=Gtk.Orientation.HORIZONTAL, spacing=10)
@@ -129,8 +167,15 @@ class GClickerWindow(Gtk.ApplicationWindow):
 
         main_box.append(button_box)
 
+        # Live clicks/s, latency and missed deadlines
+        if self.settings.get('stats_panel', True):
+            main_box.append(StatsPanel(self.clicker))
+
         self.set_child(main_box)
 
+        # Pick up interval changes saved by other instances
+        self.settings.watch(self.on_settings_changed)
+
     def on_clicker_state_changed(self, running, interval):
         """Handle state change from D-Bus service."""
         GLib.idle_add(self._update_ui_state, running, interval)
@@ -143,66 +188,98 @@ class GClickerWindow(Gtk.ApplicationWindow):
             self.minutes_spin.set_sensitive(False)
             self.seconds_spin.set_sensitive(False)
             self.milliseconds_spin.set_sensitive(False)
+            self.microseconds_spin.set_sensitive(False)
         else:
             self.start_button.set_sensitive(True)
             self.stop_button.set_sensitive(False)
             self.minutes_spin.set_sensitive(True)
             self.seconds_spin.set_sensitive(True)
             self.milliseconds_spin.set_sensitive(True)
+            self.microseconds_spin.set_sensitive(True)
         return False
 
+    def _set_interval_spins(self, interval):
+        """Show an interval in the spinboxes without saving it again."""
+        total_us = round(interval * 1e6)
+        minutes, rest = divmod(total_us, 60_000_000)
+        seconds, rest = divmod(rest, 1_000_000)
+        milliseconds, microseconds = divmod(rest, 1000)
+
+        self._updating_spins = True
+        try:
+            self.minutes_spin.set_value(min(minutes, 59))
+            self.seconds_spin.set_value(seconds)
+            self.milliseconds_spin.set_value(milliseconds)
+            self.microseconds_spin.set_value(microseconds)
+        finally:
+            self._updating_spins = False
+
+    def on_settings_changed(self, changed):
+        """Handle settings saved by another process."""
+        if 'interval' in changed and not self.clicker.running:
+            interval = self.settings.get('interval')
+            self._set_interval_spins(interval)
+            self.clicker.set_interval(interval)
+            self.dbus_service.notify_state_changed()
+
     def on_interval_changed(self, spin_button):
         """Handle interval change."""
+        if self._updating_spins:
+            return
+
         minutes = self.minutes_spin.get_value()
         seconds = self.seconds_spin.get_value()
         milliseconds = self.milliseconds_spin.get_value()
+        microseconds = self.microseconds_spin.get_value()
 
         # Calculate total interval in seconds
-        total_interval = (minutes * 60) + seconds + (milliseconds / 1000.0)
+        total_interval = (minutes * 60) + seconds + (milliseconds / 1000.0) + (microseconds / 1e6)
 
         # Ensure minimum interval
-        if total_interval < 0.001:
-            total_interval = 0.001
+        if total_interval < MIN_INTERVAL:
+            total_interval = MIN_INTERVAL
 
         self.clicker.set_interval(total_interval)
+        self.dbus_service.notify_state_changed()
+        # Written to disk once the spinbox settles
+        self.settings.set('interval', total_interval)
 
     def on_start_clicked(self, button):
         """Handle start button click."""
         # Disable button while setting up
         self.start_button.set_sensitive(False)
 
-        # Start in a thread to avoid blocking UI
-        def start_thread():
-            success = self.clicker.start()
-
-            # Update UI in main thread
-            def update_ui():
-                if success:
-                    self.stop_button.set_sensitive(True)
-                    self.minutes_spin.set_sensitive(False)
-                    self.seconds_spin.set_sensitive(False)
-                    self.milliseconds_spin.set_sensitive(False)
-                else:
-                    self.start_button.set_sensitive(True)
-                return False
-
-            GLib.idle_add(update_ui)
+        # Portal setup runs asynchronously on the GTK main loop
+        def on_started(success):
+            if success:
+                self.stop_button.set_sensitive(True)
+                self.minutes_spin.set_sensitive(False)
+                self.seconds_spin.set_sensitive(False)
+                self.milliseconds_spin.set_sensitive(False)
+                self.microseconds_spin.set_sensitive(False)
+            else:
+                self.start_button.set_sensitive(True)
+            self.dbus_service.notify_state_changed()
 
-        threading.Thread(target=start_thread, daemon=True).start()
+        self.clicker.start_async(on_started)
 
     def on_stop_clicked(self, button):
         """Handle stop button click."""
         self.clicker.stop()
+        self.dbus_service.notify_state_changed()
         self.start_button.set_sensitive(True)
         self.stop_button.set_sensitive(False)
         self.minutes_spin.set_sensitive(True)
         self.seconds_spin.set_sensitive(True)
         self.milliseconds_spin.set_sensitive(True)
+        self.microseconds_spin.set_sensitive(True)
 
     def cleanup(self):
         """Clean up resources."""
         self.dbus_service.stop()
         self.clicker.cleanup()
+        self.settings.unwatch()
+        self.settings.flush()
 
 
 class GClickerApplication(Adw.Application):
@@ -0,0 +1,240 @@
+"""Control sockets for standalone clicker instances.
+
+Every standalone instance listens on its own Unix socket in a per-user
+directory ($XDG_RUNTIME_DIR/gclicker/). A socket only appears there once it
+is accepting connections, so an instance is alive exactly when its socket
+accepts a connection; no PID file is needed.
+
+The protocol is one text command per line, answered by one line of JSON:
+
+    state             {"ok": true, "pid": 1234, "running": true, "interval": 0.1}
+    pause             stop clicking, keeping the backend (and portal session)
+    resume            start clicking again
+    interval SECONDS  change the click interval
+    stats             {"ok": true, "stats": {...}} (see ClickEngine.get_stats)
+    quit              stop clicking and exit the instance
+
+Errors are answered with {"ok": false, "error": "..."}.
+"""
+
+import json
+import os
+import selectors
+import socket
+import threading
+from pathlib import Path
+
+
+def get_socket_dir(create=False):
+    """
+    Get the per-user directory holding instance control sockets.
+
+    Args:
+        create: Create the directory (mode 0700) if it does not exist
+
+    Raises:
+        PermissionError: If the directory belongs to another user
+    """
+    runtime_dir = os.environ.get('XDG_RUNTIME_DIR') or f"/tmp/gclicker-{os.getuid()}"
+    directory = Path(runtime_dir) / 'gclicker'
+    if create:
+        directory.mkdir(mode=0o700, parents=True, exist_ok=True)
+    if directory.exists() and directory.stat().st_uid != os.getuid():
+        raise PermissionError(f"{directory} is not owned by the current user")
+    return directory
+
+
+def send_command(path, command, timeout=2.0):
+    """
+    Send one command to an instance.
+
+    Args:
+        path: Control socket path
+        command: Command line, e.g. 'state' or 'interval 0.01'
+        timeout: Seconds to wait for the connection and the reply
+
+    Returns:
+        Decoded JSON reply
+
+    Raises:
+        OSError: If the instance cannot be reached
+        ValueError: If the reply is not valid JSON
+    """
+    with socket.socket(socket.AF_UNIX, socket.SOCK_STREAM) as sock:
+        sock.settimeout(timeout)
+        sock.connect(str(path))
+        sock.sendall(command.encode() + b'\n')
+        reply = b''
+        while not reply.endswith(b'\n'):
+            chunk = sock.recv(4096)
+            if not chunk:
+                break
+            reply += chunk
+    return json.loads(reply)
+
+
+def find_instances():
+    """
+    Find running standalone instances.
+
+    Sockets left behind by instances that died without cleaning up refuse
+    connections, and are removed.
+
+    Returns:
+        List of (socket path, state reply) tuples, ordered by socket path
+    """
+    directory = get_socket_dir()
+    if not directory.is_dir():
+        return []
+
+    instances = []
+    for path in sorted(directory.glob('*.sock')):
+        try:
+            state = send_command(path, 'state')
+        except ConnectionRefusedError:
+            try:
+                path.unlink()
+            except OSError:
+                pass
+            continue
+        except (OSError, ValueError):
+            continue
+        instances.append((path, state))
+    return instances
+
+
+class ControlServer:
+    """Serves control commands for one clicker from a background thread."""
+
+    def __init__(self, clicker):
+        """
+        Initialize the control server.
+
+        Args:
+            clicker: ClickEngine instance to control
+        """
+        self.clicker = clicker
+        self.path = None
+        self.quit_requested = threading.Event()
+        self._sock = None
+        self._selector = None
+        self._wakeup = None
+        self._thread = None
+
+    def start(self):
+        """Start listening on this process's control socket."""
+        directory = get_socket_dir(create=True)
+        self.path = directory / f"{os.getpid()}.sock"
+        temp_path = directory / f".{os.getpid()}.sock.tmp"
+        for stale in (self.path, temp_path):
+            if stale.exists():
+                stale.unlink()
+
+        # Bind and listen under a temporary name, then rename into place,
+        # so clients never see a socket that is not accepting yet
+        sock = socket.socket(socket.AF_UNIX, socket.SOCK_STREAM)
+        sock.bind(str(temp_path))
+        sock.listen(8)
+        os.rename(temp_path, self.path)
+        sock.setblocking(False)
+        self._sock = sock
+
+        self._wakeup = socket.socketpair()
+        self._selector = selectors.DefaultSelector()
+        self._selector.register(sock, selectors.EVENT_READ)
+        self._selector.register(self._wakeup[0], selectors.EVENT_READ)
+
+        self._thread = threading.Thread(target=self._serve, daemon=True)
+        self._thread.start()
+
+    def _serve(self):
+        """Accept connections and answer commands until close()."""
+        while True:
+            for key, _events in self._selector.select():
+                if key.fileobj is self._wakeup[0]:
+                    return
+                if key.fileobj is self._sock:
+                    self._accept()
+                else:
+                    self._read(key.fileobj, key.data)
+
+    def _accept(self):
+        try:
+            conn, _address = self._sock.accept()
+        except BlockingIOError:
+            return
+        conn.setblocking(False)
+        self._selector.register(conn, selectors.EVENT_READ, bytearray())
+
+    def _read(self, conn, buffer):
+        try:
+            data = conn.recv(4096)
+        except BlockingIOError:
+            return
+        except OSError:
+            data = b''
+
+        if not data:
+            self._selector.unregister(conn)
+            conn.close()
+            return
+
+        buffer += data
+        while b'\n' in buffer:
+            line, _, rest = bytes(buffer).partition(b'\n')
+            buffer[:] = rest
+            reply = json.dumps(self._handle(line.decode(errors='replace').strip()))
+            try:
+                # Replies are small, so this does not block in practice
+                conn.setblocking(True)
+                conn.sendall(reply.encode() + b'\n')
+                conn.setblocking(False)
+            except OSError:
+                pass
+
+    def _handle(self, line):
+        """Run one command and build its reply."""
+        command, _, argument = line.partition(' ')
+        clicker = self.clicker
+        try:
+            if command == 'state':
+                return {'ok': True, 'pid': os.getpid(), 'running': clicker.is_running(),
+                        'interval': clicker.interval}
+            if command == 'pause':
+                clicker.stop()
+                return {'ok': True, 'running': False}
+            if command == 'resume':
+                started = clicker.start()
+                return {'ok': started, 'running': clicker.is_running()}
+            if command == 'interval':
+                clicker.set_interval(float(argument))
+                return {'ok': True, 'interval': clicker.interval}
+            if command == 'stats':
+                return {'ok': True, 'stats': clicker.get_stats()}
+            if command == 'quit':
+                self.quit_requested.set()
+                return {'ok': True}
+            return {'ok': False, 'error': f"Unknown command: {command}"}
+        except Exception as e:
+            return {'ok': False, 'error': str(e)}
+
+    def close(self):
+        """Stop serving and remove the control socket."""
+        if self._sock is None:
+            return
+
+        # Unlink first so no new client finds the socket
+        try:
+            self.path.unlink()
+        except OSError:
+            pass
+
+        self._wakeup[1].send(b'\0')
+        if self._thread and self._thread is not threading.current_thread():
+            self._thread.join(timeout=1.0)
+
+        for key in list(self._selector.get_map().values()):
+            key.fileobj.close()
+        self._selector.close()
+        self._wakeup[1].close()
+        self._sock = None
@@ -0,0 +1,541 @@
+"""Run the click engine in a child process, controlled through shared memory.
+
+The front end (GUI, D-Bus service) and the engine then no longer share a
+GIL, so redraws and callbacks cannot delay clicks.
+
+Both processes map one page of shared memory (a memfd) laid out as:
+
+    COMMAND   written by the front end: what the engine should be doing,
+              with a generation counter bumped on every change
+    STATUS    written by the engine under a seqlock: state, the generation
+              it has applied and live counters, refreshed while clicking
+    SUMMARY   written by the engine on request: latency and jitter
+    ERROR     the engine's last error message (part of the STATUS seqlock)
+
+Each side wakes the other with an eventfd (a pipe on Pythons without
+os.eventfd): "wakeup" when the command changed, "notify" when the status did.
+"""
+
+import json
+import mmap
+import os
+import select
+import signal
+import struct
+import subprocess
+import sys
+import threading
+import time
+
+from gclicker.scheduler import MIN_INTERVAL
+
+try:
+    from gi.repository import GLib
+except ImportError:
+    GLib = None
+
+
+# generation, stats_request, prewarm, interval, run, quit
+COMMAND = struct.Struct('=QQQdII')
+# seq, applied generation, state, (padding), clicks, errors, missed, rate, lag, max_lag
+STATUS = struct.Struct('=QQIIQQQddd')
+# summary generation, latency p50/p95/p99, lateness mean, jitter
+SUMMARY = struct.Struct('=Qddddd')
+
+COMMAND_OFFSET = 0
+STATUS_OFFSET = 64
+SUMMARY_OFFSET = 192
+ERROR_OFFSET = 256
+ERROR_SIZE = 256
+CONTROL_SIZE = mmap.PAGESIZE
+
+# Engine states
+STATE_STOPPED = 0
+STATE_STARTING = 1
+STATE_RUNNING = 2
+STATE_FAILED = 3
+
+# How often the engine refreshes STATUS counters while clicking, in seconds
+PUBLISH_INTERVAL = 0.05
+
+# How long start() waits, covering the portal's own setup timeout
+START_TIMEOUT = 35.0
+
+
+def _make_channel():
+    """Create a wakeup channel, returning (read fd, write fd, is_eventfd)."""
+    if hasattr(os, 'eventfd'):
+        fd = os.eventfd(0, os.EFD_CLOEXEC | os.EFD_NONBLOCK)
+        return fd, fd, True
+    read_fd, write_fd = os.pipe()
+    os.set_blocking(read_fd, False)
+    return read_fd, write_fd, False
+
+
+def _signal(fd, is_eventfd):
+    """Wake whoever is waiting on the other end of a channel."""
+    try:
+        if is_eventfd:
+            os.eventfd_write(fd, 1)
+        else:
+            os.write(fd, b'\0')
+    except BlockingIOError:
+        pass  # Already signalled and not yet drained
+
+
+def _drain(fd, is_eventfd):
+    """Clear a channel after waking up."""
+    try:
+        if is_eventfd:
+            os.eventfd_read(fd)
+        else:
+            while os.read(fd, 4096):
+                pass
+    except BlockingIOError:
+        pass
+
+
+class _SharedStats:
+    """Counters the engine process publishes, readable like ClickStats."""
+
+    def __init__(self, engine):
+        self._engine = engine
+
+    @property
+    def count(self):
+        """Clicks recorded since the engine last started."""
+        return self._engine._read_status()['clicks']
+
+    def get_rate(self):
+        """Achieved click rate in clicks/s."""
+        return self._engine._read_status()['rate']
+
+
+class IsolatedClickEngine:
+    """
+    ClickEngine stand-in that runs the real engine in a child process.
+
+    Supports the ClickEngine methods the front ends use: start, start_async,
+    stop, set_interval, prewarm, get_stats, get_lag, get_schedule_stats, is_running and
+    cleanup, plus the interval, running, last_error and stats.count attributes.
+    start_async() callbacks are dispatched on the default main context.
+    """
+
+    def __init__(self, interval=0.1, backend='portal', missed_policy='skip', spin=0.0,
+                 event_loop='thread', click_ring=False, **backend_options):
+        """
+        Start the engine process.
+
+        Args:
+            interval: Click interval in seconds
+            backend: Backend name ('portal', 'uinput' or 'null')
+            missed_policy: How to handle missed click deadlines ('skip' or 'catch-up')
+            spin: High-resolution timer spin budget in seconds (0 disables it)
+            event_loop: How the engine's click thread waits ('thread' or 'glib')
+            click_ring: Have the engine publish every click to a shared-memory
+                ring (named after the engine process's PID)
+            **backend_options: Passed to the backend constructor (must be JSON-serializable)
+        """
+        self.interval = max(MIN_INTERVAL, interval)
+        self.stats = _SharedStats(self)
+
+        self._lock = threading.Lock()
+        self._command = {'generation': 0, 'stats_request': 0, 'prewarm': 0,
+                         'interval': self.interval, 'run': 0, 'quit': 0}
+        self._start_callbacks = []
+        self._notify_watch = None
+
+        self._control_fd = os.memfd_create('gclicker-control', os.MFD_CLOEXEC)
+        os.ftruncate(self._control_fd, CONTROL_SIZE)
+        self._block = mmap.mmap(self._control_fd, CONTROL_SIZE)
+        self._write_command()
+
+        self._wakeup_read, self._wakeup_write, wakeup_eventfd = _make_channel()
+        self._notify_read, self._notify_write, notify_eventfd = _make_channel()
+        self._wakeup_eventfd = wakeup_eventfd
+        self._notify_eventfd = notify_eventfd
+
+        config = {
+            'interval': self.interval,
+            'backend': backend,
+            'missed_policy': missed_policy,
+            'spin': spin,
+            'event_loop': event_loop,
+            'click_ring': click_ring,
+            'backend_options': backend_options,
+        }
+        cmd = [
+            sys.executable, '-m', 'gclicker.isolated',
+            '--control-fd', str(self._control_fd),
+            '--wakeup-fd', str(self._wakeup_read),
+            '--notify-fd', str(self._notify_write),
+            '--config', json.dumps(config),
+        ]
+        if wakeup_eventfd:
+            cmd.append('--wakeup-eventfd')
+        if notify_eventfd:
+            cmd.append('--notify-eventfd')
+
+        self._process = subprocess.Popen(
+            cmd,
+            stdin=subprocess.DEVNULL,
+            pass_fds=(self._control_fd, self._wakeup_read, self._notify_write)
+        )
+
+    # Shared memory access
+
+    def _write_command(self):
+        c = self._command
+        COMMAND.pack_into(self._block, COMMAND_OFFSET, c['generation'], c['stats_request'],
+                          c['prewarm'], c['interval'], c['run'], c['quit'])
+
+    def _send(self, request_stats=False, **changes):
+        """Update the command, wake the engine and return the new generation."""
+        with self._lock:
+            self._command.update(changes)
+            self._command['generation'] += 1
+            if request_stats:
+                self._command['stats_request'] = self._command['generation']
+            self._write_command()
+            generation = self._command['generation']
+        _signal(self._wakeup_write, self._wakeup_eventfd)
+        return generation
+
+    def _read_status(self):
+        """Read a consistent STATUS snapshot (seqlock reader)."""
+        block = self._block
+        # Bounded, in case the engine process died halfway through a write
+        for _attempt in range(10000):
+            seq = struct.unpack_from('=Q', block, STATUS_OFFSET)[0]
+            if seq & 1:
+                continue  # Writer in progress
+            (_seq, applied, state, _pad, clicks, errors, missed,
+             rate, lag, max_lag) = STATUS.unpack_from(block, STATUS_OFFSET)
+            error = block[ERROR_OFFSET:ERROR_OFFSET + ERROR_SIZE].split(b'\0', 1)[0]
+            if struct.unpack_from('=Q', block, STATUS_OFFSET)[0] == seq:
+                break
+        else:
+            (_seq, applied, state, _pad, clicks, errors, missed,
+             rate, lag, max_lag) = STATUS.unpack_from(block, STATUS_OFFSET)
+            error = b''
+        return {'applied': applied, 'state': state, 'clicks': clicks, 'errors': errors,
+                'missed': missed, 'rate': rate, 'lag': lag, 'max_lag': max_lag,
+                'last_error': error.decode(errors='replace')}
+
+    def _wait(self, predicate, timeout):
+        """Wait for a STATUS snapshot matching predicate, or None on timeout."""
+        deadline = time.monotonic() + timeout
+        while True:
+            status = self._read_status()
+            if predicate(status):
+                return status
+            remaining = deadline - time.monotonic()
+            if remaining <= 0 or self._process.poll() is not None:
+                return None
+            select.select([self._notify_read], [], [], remaining)
+            _drain(self._notify_read, self._notify_eventfd)
+
+    # ClickEngine interface
+
+    @property
+    def running(self):
+        """Whether the engine process is clicking."""
+        return self._read_status()['state'] == STATE_RUNNING
+
+    def is_running(self):
+        """Check if auto-clicker is running."""
+        return self.running
+
+    @property
+    def last_error(self):
+        """Message of the engine's most recent click or setup error."""
+        return self._read_status()['last_error']
+
+    def set_interval(self, interval):
+        """Set the click interval in seconds."""
+        self.interval = max(MIN_INTERVAL, interval)
+        self._send(interval=self.interval)
+
+    def get_lag(self):
+        """Get how far behind schedule the most recent click fired, in seconds."""
+        return self._read_status()['lag']
+
+    def get_schedule_stats(self):
+        """Get missed-deadline, lag and rate counters, without asking the engine process."""
+        status = self._read_status()
+        return {
+            'missed': status['missed'],
+            'lag': status['lag'],
+            'max_lag': status['max_lag'],
+            'rate': status['rate'],
+        }
+
+    def prewarm(self):
+        """Prepare the engine's backend in the background."""
+        self._send(prewarm=self._command['prewarm'] + 1)
+
+    def start(self):
+        """Start auto-clicking, blocking until the engine process has set up."""
+        generation = self._send(run=1)
+        status = self._wait(
+            lambda s: s['applied'] >= generation and s['state'] != STATE_STARTING,
+            START_TIMEOUT
+        )
+        self._settle_start()
+        return status is not None and status['state'] == STATE_RUNNING
+
+    def start_async(self, callback=None):
+        """
+        Start auto-clicking without blocking.
+
+        Args:
+            callback: Called as callback(success) on the default main context
+                once clicking has started or setup failed
+        """
+        if GLib is None:
+            success = self.start()
+            if callback:
+                callback(success)
+            return
+
+        if self._notify_watch is None:
+            self._notify_watch = GLib.unix_fd_add_full(
+                GLib.PRIORITY_DEFAULT, self._notify_read, GLib.IOCondition.IN, self._on_notify
+            )
+        self._start_callbacks.append((self._send(run=1), callback))
+
+    def _on_notify(self, fd, condition):
+        _drain(self._notify_read, self._notify_eventfd)
+        self._settle_start()
+        return True
+
+    def _settle_start(self):
+        """Report the outcome of start requests the engine has finished with."""
+        status = self._read_status()
+        if status['state'] == STATE_STARTING:
+            return
+
+        if status['state'] == STATE_FAILED:
+            # Stay stopped rather than retrying on the next unrelated command
+            with self._lock:
+                self._command['run'] = 0
+                self._write_command()
+
+        finished = [(g, cb) for g, cb in self._start_callbacks if status['applied'] >= g]
+        self._start_callbacks = [(g, cb) for g, cb in self._start_callbacks
+                                 if status['applied'] < g]
+        for _generation, callback in finished:
+            if callback:
+                callback(status['state'] == STATE_RUNNING)
+
+    def stop(self):
+        """Stop auto-clicking."""
+        generation = self._send(run=0)
+        self._wait(lambda s: s['applied'] >= generation, 2.0)
+        self._settle_start()
+
+    def get_stats(self):
+        """
+        Get click telemetry for the current run.
+
+        Returns:
+            Dict with the same keys as ClickEngine.get_stats()
+        """
+        generation = self._send(request_stats=True)
+        self._wait(lambda s: struct.unpack_from('=Q', self._block, SUMMARY_OFFSET)[0] >= generation,
+                   1.0)
+        _gen, p50, p95, p99, lateness_mean, jitter = SUMMARY.unpack_from(self._block, SUMMARY_OFFSET)
+        status = self._read_status()
+        return {
+            'clicks': status['clicks'],
+            'errors': status['errors'],
+            'rate': status['rate'],
+            'latency_p50': p50,
+            'latency_p95': p95,
+            'latency_p99': p99,
+            'lateness_mean': lateness_mean,
+            'jitter': jitter,
+            'missed': status['missed'],
+            'max_lag': status['max_lag'],
+            'interval': self.interval,
+        }
+
+    def cleanup(self):
+        """Stop clicking and shut down the engine process."""
+        if self._process is None:
+            return
+
+        self._send(run=0, quit=1)
+        try:
+            self._process.wait(timeout=2.0)
+        except subprocess.TimeoutExpired:
+            self._process.kill()
+            self._process.wait()
+        self._process = None
+
+        if self._notify_watch is not None:
+            GLib.source_remove(self._notify_watch)
+            self._notify_watch = None
+        for fd in {self._wakeup_read, self._wakeup_write, self._notify_read, self._notify_write,
+                   self._control_fd}:
+            os.close(fd)
+        self._block.close()
+
+
+class EngineHost:
+    """Engine process side: applies commands and publishes status."""
+
+    def __init__(self, block, wakeup_fd, wakeup_eventfd, notify_fd, notify_eventfd, config):
+        from gclicker.engine import create_clicker
+
+        self.block = block
+        self.wakeup_fd = wakeup_fd
+        self.wakeup_eventfd = wakeup_eventfd
+        self.notify_fd = notify_fd
+        self.notify_eventfd = notify_eventfd
+        self.engine = create_clicker(
+            config['interval'],
+            config['backend'],
+            missed_policy=config['missed_policy'],
+            spin=config['spin'],
+            event_loop=config['event_loop'],
+            click_ring=config['click_ring'],
+            **config['backend_options']
+        )
+
+        self.parent_pid = os.getppid()
+        self.state = STATE_STOPPED
+        self.applied = 0
+        self.seq = 0
+        self.quit = False
+        self._prewarm = 0
+        self._summary_generation = 0
+        self._loop = None
+
+    def publish(self):
+        """Write STATUS and the last error under the seqlock."""
+        engine = self.engine
+        schedule = engine.get_schedule_stats()
+        error = engine.last_error.encode()[:ERROR_SIZE - 1]
+
+        self.seq += 1  # Odd: readers retry
+        struct.pack_into('=Q', self.block, STATUS_OFFSET, self.seq)
+        STATUS.pack_into(
+            self.block, STATUS_OFFSET, self.seq, self.applied, self.state, 0,
+            engine.stats.count, engine.stats.errors + engine.backend.errors, schedule['missed'],
+            engine.stats.get_rate(), schedule['lag'], schedule['max_lag']
+        )
+        self.block[ERROR_OFFSET:ERROR_OFFSET + ERROR_SIZE] = error.ljust(ERROR_SIZE, b'\0')
+        self.seq += 1  # Even: consistent again
+        struct.pack_into('=Q', self.block, STATUS_OFFSET, self.seq)
+
+        _signal(self.notify_fd, self.notify_eventfd)
+
+    def on_wakeup(self, *args):
+        """Apply the latest command."""
+        _drain(self.wakeup_fd, self.wakeup_eventfd)
+        generation, stats_request, prewarm, interval, run, quit_ = \
+            COMMAND.unpack_from(self.block, COMMAND_OFFSET)
+        engine = self.engine
+
+        if quit_:
+            self.stop()
+            return False
+
+        if interval != engine.interval:
+            engine.set_interval(interval)
+
+        if prewarm != self._prewarm:
+            self._prewarm = prewarm
+            engine.prewarm()
+
+        if run and self.state not in (STATE_RUNNING, STATE_STARTING):
+            self.state = STATE_STARTING
+            engine.start_async(self._on_started)
+        elif not run and self.state in (STATE_RUNNING, STATE_STARTING):
+            engine.stop()
+            self.state = STATE_STOPPED
+
+        if stats_request != self._summary_generation:
+            self._summary_generation = stats_request
+            stats = engine.get_stats()
+            SUMMARY.pack_into(self.block, SUMMARY_OFFSET, 0, stats['latency_p50'],
+                              stats['latency_p95'], stats['latency_p99'],
+                              stats['lateness_mean'], stats['jitter'])
+            # Generation last, so the front end never sees it with stale values
+            struct.pack_into('=Q', self.block, SUMMARY_OFFSET, stats_request)
+
+        self.applied = generation
+        self.publish()
+        return True
+
+    def _on_started(self, success):
+        # stop() may have been requested while the backend was setting up
+        if self.state == STATE_STARTING:
+            self.state = STATE_RUNNING if success else STATE_FAILED
+        self.publish()
+
+    def on_timer(self, *args):
+        """Refresh counters while clicking; exit if the front end is gone."""
+        if os.getppid() != self.parent_pid:
+            self.stop()
+            return False
+        if self.engine.is_running():
+            self.publish()
+        return True
+
+    def stop(self):
+        self.quit = True
+        if self._loop:
+            self._loop.quit()
+
+    def run(self):
+        """Serve commands until told to quit or the front end exits."""
+        self.publish()
+        if GLib is not None:
+            # The portal backend also needs the default main context for
+            # setup and session monitoring
+            self._loop = GLib.MainLoop()
+            GLib.unix_fd_add_full(GLib.PRIORITY_HIGH, self.wakeup_fd, GLib.IOCondition.IN,
+                                  self.on_wakeup)
+            GLib.timeout_add(int(PUBLISH_INTERVAL * 1000), self.on_timer)
+            self.on_wakeup()  # Pick up anything sent before the loop started
+            if not self.quit:
+                self._loop.run()
+        else:
+            while not self.quit:
+                ready, _, _ = select.select([self.wakeup_fd], [], [], PUBLISH_INTERVAL)
+                if ready:
+                    self.on_wakeup()
+                if not self.quit:
+                    self.on_timer()
+
+        self.engine.cleanup()
+        self.state = STATE_STOPPED
+        self.publish()
+
+
+def main():
+    """Entry point of the engine process (started by IsolatedClickEngine)."""
+    import argparse
+
+    parser = argparse.ArgumentParser(description='gclicker engine process')
+    parser.add_argument('--control-fd', type=int, required=True)
+    parser.add_argument('--wakeup-fd', type=int, required=True)
+    parser.add_argument('--wakeup-eventfd', action='store_true')
+    parser.add_argument('--notify-fd', type=int, required=True)
+    parser.add_argument('--notify-eventfd', action='store_true')
+    parser.add_argument('--config', required=True)
+    args = parser.parse_args()
+
+    # Ctrl+C in the terminal is for the front end, which shuts us down
+    signal.signal(signal.SIGINT, signal.SIG_IGN)
+
+    block = mmap.mmap(args.control_fd, CONTROL_SIZE)
+    host = EngineHost(block, args.wakeup_fd, args.wakeup_eventfd, args.notify_fd,
+                      args.notify_eventfd, json.loads(args.config))
+    host.run()
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,688 @@
+"""Several independent click jobs over one backend and one click thread.
+
+A job has its own button, interval and optional duration, or plays a
+compiled macro (see gclicker.macro). All jobs share the engine's backend
+(so one portal session) and its click thread, which waits for the
+earliest event on a heap of press, release and macro event times, so
+adding a job costs a heap entry, not a thread.
+"""
+
+import heapq
+import itertools
+import threading
+import time
+
+from gclicker.backends import BTN_LEFT, UnsupportedEvent
+from gclicker.engine import IDLE_POLL, ClickEngine
+from gclicker.macro import EVENT_BUTTON, EVENT_KEY, MacroReader, play_event
+from gclicker.recovery import CircuitBreaker
+from gclicker.scheduler import MIN_INTERVAL, DeadlineScheduler
+from gclicker.stats import ClickStats
+
+
+# ID of the job start()/stop() control: the engine's own interval and button
+MAIN_JOB = 0
+
+# Finished jobs kept for get_jobs()/get_job_stats() until removed; older ones are dropped
+MAX_FINISHED_JOBS = 64
+
+# Most macro events sent in one go before other jobs get a turn
+MACRO_BATCH = 64
+
+# Macro events sent this late or later count as late, in seconds
+MACRO_LATE = 0.001
+
+# Heap event kinds
+_PRESS = 0
+_RELEASE = 1
+_EVENT = 2  # Next event of a macro
+
+
+class ClickJob:
+    """One button clicked at one interval, optionally for a limited time."""
+
+    kind = 'click'
+    event = _PRESS
+
+    def __init__(self, job_id, button, scheduler, stats, press_hold, duration=None):
+        self.id = job_id
+        self.button = button
+        self.scheduler = scheduler
+        self.stats = stats
+        self.press_hold = press_hold
+        self.duration = duration   # Seconds, or None to click until removed
+        self.active = False
+        self.finished = False
+        self.ends_at = None
+        self.generation = 0        # Press events pushed before the latest one are stale
+        self.pressed = None        # (deadline, press_sent, press_ack) while held
+
+    @property
+    def interval(self):
+        return self.scheduler.interval
+
+    @property
+    def next_due(self):
+        return self.scheduler.next_deadline
+
+    def resync(self):
+        """Restart the schedule from now, after a pause."""
+        self.scheduler.resync()
+
+    def activate(self, now):
+        """Anchor the schedule so the first click is due now."""
+        self.scheduler.reset(now)
+        self.stats.reset()
+        self.ends_at = now + self.duration if self.duration else None
+        self.active = True
+        self.finished = False
+
+    def get_info(self):
+        """Get the job's settings and progress."""
+        remaining = 0.0
+        if self.active and self.ends_at is not None:
+            remaining = max(0.0, self.ends_at - time.monotonic())
+        return {
+            'id': self.id,
+            'kind': self.kind,
+            'button': self.button,
+            'interval': self.interval,
+            'duration': self.duration or 0.0,
+            'remaining': remaining,
+            'active': self.active,
+            'clicks': self.stats.count,
+        }
+
+
+class MacroJob:
+    """Plays a compiled macro, streaming its events from the mapped file."""
+
+    kind = 'macro'
+    event = _EVENT
+
+    def __init__(self, job_id, reader, speed=1.0, repeat=1):
+        self.id = job_id
+        self.reader = reader
+        self.speed = speed
+        self.repeat = repeat       # Times to play the macro, 0 = until removed
+        self.active = False
+        self.finished = False
+        self.generation = 0
+        self.held = set()          # (kind, code) of buttons and keys pressed, not released
+        self.played = 0
+        self.late = 0
+        self.errors = 0
+        self.lag_total = 0.0
+        self.max_lag = 0.0
+        self.ends_at = None
+        self._started_at = 0.0     # When the current round started
+        self._round = 0
+        self._events = iter(())
+        self._next = None          # Next (offset_ns, kind, a, b)
+
+    @property
+    def duration(self):
+        """Seconds all rounds take, or 0 if the macro repeats until removed."""
+        return self.reader.duration * self.repeat / self.speed
+
+    @property
+    def next_due(self):
+        """Monotonic time of the next event, or None when the macro is done."""
+        if self._next is None:
+            return None
+        return self._started_at + self._next[0] * 1e-9 / self.speed
+
+    def activate(self, now):
+        """Start the first round now."""
+        self._started_at = now
+        self._round = 0
+        self._events = self.reader.events()
+        self._next = next(self._events, None)
+        self.ends_at = now + self.duration if self.repeat else None
+        self.active = True
+
+    def resync(self):
+        """Delay the rest of the macro so its next event is due now, after a pause."""
+        due = self.next_due
+        if due is not None:
+            delay = max(0.0, time.monotonic() - due)
+            self._started_at += delay
+            if self.ends_at is not None:
+                self.ends_at += delay
+
+    def take(self):
+        """Take the next event, moving on to the next round after the last one."""
+        event = self._next
+        self._next = next(self._events, None)
+        if self._next is None and (not self.repeat or self._round + 1 < self.repeat):
+            # Rounds follow each other back to back
+            self._round += 1
+            self._started_at += self.reader.duration / self.speed
+            self._events = self.reader.events()
+            self._next = next(self._events, None)
+        return event
+
+    def get_info(self):
+        """Get the job's settings and progress."""
+        remaining = 0.0
+        if self.active and self.ends_at is not None:
+            remaining = max(0.0, self.ends_at - time.monotonic())
+        return {
+            'id': self.id,
+            'kind': self.kind,
+            'duration': self.duration,
+            'remaining': remaining,
+            'active': self.active,
+            'clicks': self.played,
+            'path': str(self.reader.path),
+        }
+
+    def get_stats(self):
+        """Get how many events went out, and how late."""
+        return {
+            'events': self.played,
+            'total': self.reader.count * self.repeat,
+            'late': self.late,
+            'lag_mean': self.lag_total / self.played if self.played else 0.0,
+            'max_lag': self.max_lag,
+            'errors': self.errors,
+            'speed': self.speed,
+        }
+
+
+class JobEngine(ClickEngine):
+    """
+    ClickEngine that clicks any number of jobs from its one click thread.
+
+    The engine's own interval and button form job MAIN_JOB, which start()
+    and stop() turn on and off as before. add_job() adds more; they click
+    whether or not the main job is running. The click thread runs while
+    any job is active.
+    """
+
+    def __init__(self, *args, **kwargs):
+        super().__init__(*args, **kwargs)
+        self._main = ClickJob(MAIN_JOB, self.button, self._scheduler, self.stats, self.press_hold)
+        self._jobs = {MAIN_JOB: self._main}
+        self._job_ids = itertools.count(MAIN_JOB + 1)
+        self._jobs_lock = threading.Lock()
+        self._pending = []              # Jobs to (re)schedule on the click thread
+        self._wake = threading.Event()  # Set when jobs change, or to stop
+        self._heap = []                 # (due, sequence, kind, job, generation)
+        self._sequence = itertools.count()
+
+    # Jobs
+
+    def add_job(self, button=BTN_LEFT, interval=0.1, duration=None, press_hold=None):
+        """
+        Start clicking another button or interval alongside the others.
+
+        Backend setup, if needed, runs on the calling thread's thread-default
+        main context.
+
+        Args:
+            button: Linux input event code of the button to click
+            interval: Time between clicks in seconds
+            duration: Seconds to click for (None or 0 clicks until removed)
+            press_hold: Seconds to hold the button down (default: the engine's)
+
+        Returns:
+            The new job's ID
+        """
+        scheduler = DeadlineScheduler(max(MIN_INTERVAL, interval),
+                                      policy=self._scheduler.policy)
+        job_id = next(self._job_ids)
+        job = ClickJob(job_id, button, scheduler, ClickStats(ring=self.stats.ring, job=job_id),
+                       self.press_hold if press_hold is None else press_hold,
+                       duration=duration or None)
+        job.activate(time.monotonic())
+        with self._jobs_lock:
+            self._prune_finished()
+            self._jobs[job.id] = job
+        self._schedule(job)
+        self._ensure_thread()
+        return job.id
+
+    def add_macro(self, path, speed=1.0, repeat=1):
+        """
+        Play a compiled macro alongside the other jobs.
+
+        Args:
+            path: Compiled macro file (see gclicker.macro)
+            speed: Playback speed factor (2.0 plays twice as fast)
+            repeat: Times to play the macro back to back, 0 = until removed
+
+        Returns:
+            The new job's ID
+
+        Raises:
+            gclicker.macro.MacroError: If the file is not a compiled macro
+            OSError: If the file cannot be read
+            ValueError: If the macro cannot be played on this backend
+        """
+        if speed <= 0:
+            raise ValueError("speed must be positive")
+        reader = MacroReader(path)
+        missing = reader.required_capabilities - self.backend.capabilities
+        if missing:
+            reader.close()
+            raise ValueError(f"the {self.backend.name} backend cannot play this macro "
+                             f"(it has no {', '.join(sorted(missing))} support)")
+        if not repeat and reader.duration == 0:
+            reader.close()
+            raise ValueError("a macro that takes no time cannot repeat until removed")
+
+        job = MacroJob(next(self._job_ids), reader, speed, repeat)
+        job.activate(time.monotonic())
+        with self._jobs_lock:
+            self._prune_finished()
+            self._jobs[job.id] = job
+        self._schedule(job)
+        self._ensure_thread()
+        return job.id
+
+    def remove_job(self, job_id):
+        """
+        Stop a job and forget it. Removing MAIN_JOB just stops it.
+
+        Returns:
+            True if the job existed
+        """
+        if job_id == MAIN_JOB:
+            self.stop()
+            return True
+        with self._jobs_lock:
+            job = self._jobs.pop(job_id, None)
+        if job is None:
+            return False
+        job.active = False
+        self._wake.set()
+        self._stop_thread_if_idle()
+        return True
+
+    def set_job_interval(self, job_id, interval):
+        """
+        Change a job's interval.
+
+        Raises:
+            KeyError: If there is no such job
+        """
+        if job_id == MAIN_JOB:
+            self.set_interval(interval)
+            return
+        job = self._jobs[job_id]
+        job.scheduler.set_interval(max(MIN_INTERVAL, interval))
+        self._schedule(job)
+
+    def get_jobs(self):
+        """Get get_info() of every job, MAIN_JOB first."""
+        with self._jobs_lock:
+            jobs = sorted(self._jobs.values(), key=lambda job: job.id)
+        return [job.get_info() for job in jobs]
+
+    def get_job(self, job_id):
+        """
+        Get one job's get_info().
+
+        Raises:
+            KeyError: If there is no such job
+        """
+        return self._jobs[job_id].get_info()
+
+    def get_job_stats(self, job_id):
+        """
+        Get click telemetry of one job (see ClickEngine.get_stats).
+
+        Raises:
+            KeyError: If there is no such job
+        """
+        if job_id == MAIN_JOB:
+            return self.get_stats()
+        job = self._jobs[job_id]
+        if job.kind == 'macro':
+            return job.get_stats()
+        stats = job.stats.get_summary()
+        stats['missed'] = job.scheduler.missed
+        stats['max_lag'] = job.scheduler.max_lag
+        stats['interval'] = job.interval
+        return stats
+
+    def _prune_finished(self):
+        """Drop the oldest finished jobs beyond MAX_FINISHED_JOBS (jobs lock held)."""
+        finished = [job_id for job_id, job in self._jobs.items() if job.finished]
+        for job_id in finished[:-MAX_FINISHED_JOBS or None]:
+            del self._jobs[job_id]
+
+    def _active_jobs(self):
+        with self._jobs_lock:
+            return [job for job in self._jobs.values() if job.active]
+
+    def _schedule(self, job):
+        """Have the click thread (re)schedule a job's next press."""
+        with self._jobs_lock:
+            self._pending.append(job)
+        self._wake.set()
+
+    # Main job
+
+    def set_interval(self, interval):
+        """Set the main job's click interval in seconds."""
+        super().set_interval(interval)
+        if self._main.active:
+            self._schedule(self._main)
+
+    def _start_thread(self):
+        """Start the main job, and the click thread if it is not running."""
+        if self.running:
+            return
+        self.running = True
+        self._main.activate(time.monotonic())
+        self._backend_errors = self.backend.errors
+        self._schedule(self._main)
+        self._ensure_thread()
+
+    def stop(self):
+        """Stop the main job; other jobs keep clicking."""
+        self._starting = False
+        if not self.running:
+            return
+        self.running = False
+        self._main.active = False
+        self._wake.set()
+        self._stop_thread_if_idle()
+
+    def cleanup(self):
+        """Stop all jobs and release backend resources."""
+        with self._jobs_lock:
+            for job in self._jobs.values():
+                job.active = False
+        self.stop()
+        self._stop_thread()
+        # Macros the click thread never got to, e.g. while the backend was set up
+        with self._jobs_lock:
+            for job in self._jobs.values():
+                if job.kind == 'macro':
+                    job.reader.close()
+        super().cleanup()
+
+    # Click thread
+
+    def _ensure_thread(self):
+        """Start the click thread, setting the backend up first if needed."""
+        if self.backend.is_ready():
+            # Under the jobs lock, so a thread exiting because it ran out of
+            # jobs either sees the new ones or has already cleared _thread
+            with self._jobs_lock:
+                if self._thread is not None and self._thread.is_alive():
+                    return
+                self._stop_event.clear()
+                self._thread = threading.Thread(target=self._click_loop, daemon=True)
+                self._thread.start()
+            return
+        if self._thread is not None and self._thread.is_alive():
+            return
+
+        def on_ready(success, error):
+            if error:
+                self.last_error = error
+            if success and self._active_jobs():
+                self._ensure_thread()
+
+        self.backend.setup_async(on_ready)
+
+    def _stop_thread_if_idle(self):
+        if not self._active_jobs():
+            self._stop_thread()
+
+    def _stop_thread(self):
+        """
+        Stop the click thread, releasing any held buttons.
+
+        If the thread does not stop in time (e.g. it is blocked in a portal
+        call), it stays registered so no second click thread is started; it
+        unregisters itself when it ends.
+        """
+        thread = self._thread
+        if thread is None:
+            return
+        self._stop_event.set()
+        self._wake.set()
+        # Wake the click thread if the backend is blocked waiting for replies
+        self.backend.interrupt()
+        if thread is not threading.current_thread():
+            thread.join(timeout=1.0)
+        with self._jobs_lock:
+            if self._thread is thread and not thread.is_alive():
+                self._thread = None
+
+    def _push_next(self, job):
+        """Schedule a job's next press or macro event, making any earlier one stale."""
+        job.generation += 1
+        heapq.heappush(self._heap, (job.next_due, next(self._sequence),
+                                    job.event, job, job.generation))
+
+    def _take_pending(self):
+        """Schedule the jobs added or changed since the last call."""
+        self._wake.clear()
+        with self._jobs_lock:
+            pending, self._pending = self._pending, []
+        for job in pending:
+            if job.active:
+                self._push_next(job)
+            elif job.kind == 'macro':
+                self._finish_macro(job)  # Removed before it was scheduled
+
+    def _sleep_until(self, deadline):
+        """
+        Wait for a monotonic deadline like DeadlineScheduler.sleep_until().
+
+        Returns:
+            True when the deadline was reached, False if the jobs changed first
+        """
+        wake = self._wake
+        spin = self._scheduler.spin
+        while True:
+            remaining = deadline - time.monotonic()
+            if remaining <= spin:
+                break
+            if wake.wait(remaining - spin):
+                return False
+
+        while time.monotonic() < deadline:
+            if wake.is_set():
+                return False
+        return True
+
+    def _press_job(self, job, now):
+        """Fire a job's due press and schedule its release and next press."""
+        scheduler = job.scheduler
+        scheduler.tick(now)
+        if job.ends_at is not None and scheduler.deadline >= job.ends_at:
+            job.active = False
+            job.finished = True
+            return
+        if job.pressed is not None:
+            # Running late: the previous click's release is still queued
+            self._release_job(job)
+
+        try:
+            press_sent = time.monotonic()
+            self.backend.press(job.button)
+            press_ack = time.monotonic()
+        except Exception as e:
+            self._job_error(job, e)
+        else:
+            job.pressed = (scheduler.deadline, press_sent, press_ack)
+            hold = min(job.press_hold, job.interval / 2)
+            if hold > 0:
+                heapq.heappush(self._heap, (press_ack + hold, next(self._sequence),
+                                            _RELEASE, job, job.generation))
+            else:
+                self._release_job(job)
+        self._push_next(job)
+
+    def _release_job(self, job):
+        """Release a job's held button and record the click."""
+        if job.pressed is None:
+            return  # Released early by _press_job()
+        deadline, press_sent, press_ack = job.pressed
+        job.pressed = None
+        try:
+            self.backend.release(job.button)
+        except Exception as e:
+            self._job_error(job, e)
+            return
+        job.stats.record(deadline, press_sent, press_ack, time.monotonic())
+        if not self._check_backend_errors():
+            self._click_succeeded()
+
+    def _job_error(self, job, error):
+        """Count and report a failed press or release of a job."""
+        job.stats.record_error(job.scheduler.deadline)
+        self.last_error = str(error)
+        self._error_log.report(self.last_error)
+        self._click_failed()
+
+    def _play_macro(self, job):
+        """Send a macro's due events, then schedule its next one."""
+        backend = self.backend
+        held = job.held
+        for _ in range(MACRO_BATCH):
+            due = job.next_due
+            if due is None:
+                break
+            now = time.monotonic()
+            if due > now:
+                break
+            _, kind, a, b = job.take()
+            try:
+                play_event(backend, kind, a, b)
+            except UnsupportedEvent as e:
+                # The backend lost a capability after add_macro() checked it,
+                # e.g. the portal session connected to EIS. The session is
+                # fine, so stop the macro without tripping the circuit breaker.
+                job.errors += 1
+                self.last_error = str(e)
+                self._error_log.report(self.last_error)
+                job.active = False
+                self._finish_macro(job)
+                return
+            except Exception as e:
+                job.errors += 1
+                self.last_error = str(e)
+                self._error_log.report(self.last_error)
+                self._click_failed()
+                continue
+            if kind == EVENT_BUTTON or kind == EVENT_KEY:
+                if b:
+                    held.add((kind, int(a)))
+                else:
+                    held.discard((kind, int(a)))
+            lag = now - due
+            job.played += 1
+            job.lag_total += lag
+            if lag > job.max_lag:
+                job.max_lag = lag
+            if lag >= MACRO_LATE:
+                job.late += 1
+
+        if job.next_due is None:
+            self._finish_macro(job)
+        else:
+            self._push_next(job)
+        if not self._check_backend_errors():
+            self._click_succeeded()
+
+    def _finish_macro(self, job):
+        """Release what a stopped or finished macro still holds down, and unmap it."""
+        for kind, code in job.held:
+            try:
+                if kind == EVENT_BUTTON:
+                    self.backend.release(code)
+                else:
+                    self.backend.key(code, False)
+            except Exception:
+                pass
+        job.held.clear()
+        job.finished = job.active or job.finished
+        job.active = False
+        job.reader.close()
+
+    def _resync(self):
+        """Restart every active job's schedule from now, after a pause."""
+        for job in self._active_jobs():
+            job.resync()
+            self._push_next(job)
+
+    def _click_loop(self):
+        """Fire the earliest due press or release until stopped."""
+        heap = self._heap
+        heap.clear()
+        self._backend_errors = self.backend.errors
+        self._breaker = CircuitBreaker()
+        with self._jobs_lock:
+            # Jobs a previous thread had scheduled and dropped when it stopped
+            queued = set(self._pending)
+            self._pending.extend(job for job in self._jobs.values()
+                                 if job.active and job not in queued)
+        self._take_pending()
+        try:
+            while not self._stop_event.is_set():
+                if self._wake.is_set():
+                    self._take_pending()
+                if not heap:
+                    with self._jobs_lock:
+                        if not self._pending:
+                            # Every job finished or was removed
+                            self._thread = None
+                            return
+                    self._take_pending()
+                    continue
+
+                due, _, kind, job, generation = heap[0]
+                # Releases are never dropped, so no button stays held
+                if kind != _RELEASE and (not job.active or generation != job.generation):
+                    heapq.heappop(heap)
+                    if kind == _EVENT and not job.active:
+                        self._finish_macro(job)
+                    continue
+                if not self._sleep_until(due):
+                    continue
+                heapq.heappop(heap)
+
+                if kind == _RELEASE:
+                    self._release_job(job)
+                    continue
+                if not self._can_click():
+                    # Poll slowly until the backend is back, then restart
+                    # every schedule from there
+                    while not self._can_click():
+                        if self._stop_event.wait(IDLE_POLL):
+                            return
+                    self._resync()
+                    continue
+                if kind == _EVENT:
+                    self._play_macro(job)
+                else:
+                    self._press_job(job, time.monotonic())
+        finally:
+            for _, _, kind, job, _ in heap:
+                if kind == _EVENT:
+                    self._finish_macro(job)
+                elif kind == _RELEASE and job.pressed is not None:
+                    try:
+                        self.backend.release(job.button)
+                    except Exception:
+                        pass
+                    job.pressed = None
+            heap.clear()
+            self.backend.flush()
+            self._error_log.flush()
+            with self._jobs_lock:
+                if self._thread is threading.current_thread():
+                    self._thread = None
+                # Jobs added while a stop was taking too long to finish
+                restart = (self._stop_event.is_set() and
+                           any(job.active for job in self._jobs.values()))
+            if restart and self.backend.is_ready():
+                self._ensure_thread()
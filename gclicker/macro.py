@@ -0,0 +1,382 @@
+"""Compiled macros: timed pointer, button, scroll and key events.
+
+A macro is authored as text (see compile_macro) and compiled into a
+binary file of typed arrays, one array per field, so a player can
+memory-map it and stream through events in chunks. Playback holds one
+chunk at a time however long the macro is.
+
+Layout (little-endian):
+
+    header   magic, version, flags, event count, duration (ns), and the
+             file offsets of the four arrays
+    offsets  int64, nanoseconds from the start of the macro, non-decreasing
+    kinds    uint8, one of the EVENT_* kinds
+    arg a    float64: dx, button or key code
+    arg b    float64: dy, or 1.0 = pressed / 0.0 = released
+"""
+
+import heapq
+import mmap
+import os
+import struct
+import sys
+import tempfile
+from array import array
+from pathlib import Path
+
+from gclicker.backends import BUTTON_NAMES, CAP_BUTTON, CAP_KEYBOARD, CAP_MOTION
+
+
+MAGIC = b'GCLKMACR'
+VERSION = 2
+
+# magic, version, flags, count, duration, offsets/kinds/a/b array positions
+HEADER = struct.Struct('<8sIIQQQQQQ')
+HEADER_SIZE = 64
+
+# Header flags: the event kinds a macro has, so a player can check them up front
+FLAG_KEYBOARD = 1  # Key events, so needs a keyboard device
+FLAG_MOTION = 2    # Pointer motion
+FLAG_AXIS = 4      # Scrolling
+FLAG_BUTTON = 8    # Button presses
+
+# Version 1 files only flagged key events
+_V1_FLAGS = FLAG_MOTION | FLAG_AXIS | FLAG_BUTTON
+
+# Event kinds
+EVENT_MOTION = 0  # a, b = dx, dy
+EVENT_BUTTON = 1  # a = button code, b = pressed
+EVENT_AXIS = 2    # a, b = dx, dy scroll
+EVENT_KEY = 3     # a = evdev key code, b = pressed
+EVENT_KINDS = (EVENT_MOTION, EVENT_BUTTON, EVENT_AXIS, EVENT_KEY)
+
+# Header flag and backend capability of each event kind
+_KIND_FLAGS = {EVENT_MOTION: FLAG_MOTION, EVENT_BUTTON: FLAG_BUTTON, EVENT_AXIS: FLAG_AXIS,
+               EVENT_KEY: FLAG_KEYBOARD}
+_FLAG_CAPABILITIES = ((FLAG_KEYBOARD, CAP_KEYBOARD), (FLAG_MOTION, CAP_MOTION),
+                      (FLAG_AXIS, CAP_MOTION), (FLAG_BUTTON, CAP_BUTTON))
+
+# Events read or written per chunk
+CHUNK = 4096
+
+# Default press length of `click` and `tap`, in seconds
+DEFAULT_HOLD = 0.001
+
+# Array type codes of the columns
+_COLUMNS = ('q', 'B', 'd', 'd')
+
+# evdev key codes by name, for `key` and `tap`
+KEY_NAMES = {
+    'esc': 1, 'backspace': 14, 'tab': 15, 'enter': 28, 'ctrl': 29, 'shift': 42,
+    'alt': 56, 'space': 57, 'capslock': 58, 'up': 103, 'left': 105, 'right': 106,
+    'down': 108, 'delete': 111, 'super': 125,
+}
+KEY_NAMES.update({str(digit): code for code, digit in enumerate('1234567890', start=2)})
+for _row, _first in (('qwertyuiop', 16), ('asdfghjkl', 30), ('zxcvbnm', 44)):
+    KEY_NAMES.update({letter: code for code, letter in enumerate(_row, start=_first)})
+
+
+class MacroError(ValueError):
+    """A macro source or file is invalid."""
+
+
+class MacroWriter:
+    """
+    Writes a compiled macro one event at a time.
+
+    Columns are buffered per CHUNK events and spilled to temporary files,
+    so writing millions of events uses constant memory. Nothing appears at
+    path until close().
+    """
+
+    def __init__(self, path):
+        """
+        Start a macro file.
+
+        Args:
+            path: Where close() puts the finished file
+        """
+        self.path = Path(path)
+        self.count = 0
+        self.flags = 0
+        self._last_offset = 0
+        self._buffers = [array(code) for code in _COLUMNS]
+        self._spills = [tempfile.TemporaryFile(dir=self.path.parent) for _ in _COLUMNS]
+
+    def add(self, offset, kind, a=0.0, b=0.0):
+        """
+        Append an event.
+
+        Args:
+            offset: Seconds from the start of the macro, not before the previous event
+            kind: One of EVENT_KINDS
+            a, b: The kind's arguments (see the module docstring)
+
+        Raises:
+            MacroError: If the event is out of order or of an unknown kind
+        """
+        offset_ns = round(offset * 1e9)
+        if offset_ns < self._last_offset:
+            raise MacroError(f"event at {offset}s is before the previous one")
+        if kind not in EVENT_KINDS:
+            raise MacroError(f"unknown event kind: {kind}")
+        self.flags |= _KIND_FLAGS[kind]
+        self._last_offset = offset_ns
+
+        offsets, kinds, first, second = self._buffers
+        offsets.append(offset_ns)
+        kinds.append(kind)
+        first.append(a)
+        second.append(b)
+        self.count += 1
+        if len(offsets) >= CHUNK:
+            self._spill()
+
+    def _spill(self):
+        """Move the buffered events to the column files."""
+        for buffer, spill in zip(self._buffers, self._spills):
+            if sys.byteorder != 'little':
+                buffer.byteswap()
+            buffer.tofile(spill)
+            del buffer[:]
+
+    def close(self):
+        """Write the file, replacing path atomically."""
+        self._spill()
+        positions = []
+        position = HEADER_SIZE
+        for code in _COLUMNS:
+            positions.append(position)
+            size = self.count * array(code).itemsize
+            position += (size + 7) // 8 * 8  # Keep every column 8-byte aligned
+
+        temp_path = self.path.with_name(f".{self.path.name}.{os.getpid()}.tmp")
+        try:
+            with open(temp_path, 'wb') as f:
+                f.write(HEADER.pack(MAGIC, VERSION, self.flags, self.count,
+                                    self._last_offset, *positions).ljust(HEADER_SIZE, b'\0'))
+                for position, spill in zip(positions, self._spills):
+                    f.write(b'\0' * (position - f.tell()))
+                    spill.seek(0)
+                    while True:
+                        data = spill.read(1 << 20)
+                        if not data:
+                            break
+                        f.write(data)
+            os.replace(temp_path, self.path)
+        except BaseException:
+            temp_path.unlink(missing_ok=True)
+            raise
+        finally:
+            for spill in self._spills:
+                spill.close()
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, exc_type, exc, tb):
+        if exc_type is None:
+            self.close()
+        else:
+            for spill in self._spills:
+                spill.close()
+
+
+class MacroReader:
+    """Memory-mapped compiled macro."""
+
+    def __init__(self, path):
+        """
+        Open a compiled macro.
+
+        Raises:
+            MacroError: If the file is not a compiled macro
+            OSError: If it cannot be read
+        """
+        self.path = Path(path)
+        with open(self.path, 'rb') as f:
+            size = os.fstat(f.fileno()).st_size
+            if size < HEADER_SIZE:
+                raise MacroError(f"{self.path} is not a compiled macro")
+            self._map = mmap.mmap(f.fileno(), 0, prot=mmap.PROT_READ)
+
+        magic, version, self.flags, self.count, self.duration_ns, *self._positions = \
+            HEADER.unpack_from(self._map)
+        if magic != MAGIC:
+            self.close()
+            raise MacroError(f"{self.path} is not a compiled macro")
+        if version == 1:
+            self.flags |= _V1_FLAGS
+        elif version != VERSION:
+            self.close()
+            raise MacroError(f"{self.path} has unsupported macro version {version}")
+        for position, code in zip(self._positions, _COLUMNS):
+            if position + self.count * array(code).itemsize > size:
+                self.close()
+                raise MacroError(f"{self.path} is truncated")
+
+    @property
+    def duration(self):
+        """Offset of the last event, in seconds."""
+        return self.duration_ns / 1e9
+
+    @property
+    def needs_keyboard(self):
+        return bool(self.flags & FLAG_KEYBOARD)
+
+    @property
+    def required_capabilities(self):
+        """The backend CAP_* capabilities its events need."""
+        return frozenset(capability for flag, capability in _FLAG_CAPABILITIES
+                         if self.flags & flag)
+
+    def _read_column(self, column, start, end):
+        code = _COLUMNS[column]
+        values = array(code)
+        itemsize = values.itemsize
+        position = self._positions[column]
+        values.frombytes(self._map[position + start * itemsize:position + end * itemsize])
+        if sys.byteorder != 'little':
+            values.byteswap()
+        return values
+
+    def _drop_pages(self, end):
+        """Let the kernel drop the mapped pages of events before end."""
+        if not hasattr(self._map, 'madvise'):
+            return
+        for column, code in enumerate(_COLUMNS):
+            position = self._positions[column]
+            length = (position + end * array(code).itemsize) // mmap.PAGESIZE * mmap.PAGESIZE
+            start = position // mmap.PAGESIZE * mmap.PAGESIZE
+            if length > start:
+                self._map.madvise(mmap.MADV_DONTNEED, start, length - start)
+
+    def events(self, start=0):
+        """
+        Iterate over (offset_ns, kind, a, b) from event number start on.
+
+        Reads CHUNK events at a time and releases the pages behind them.
+        """
+        for chunk_start in range(start, self.count, CHUNK):
+            chunk_end = min(chunk_start + CHUNK, self.count)
+            yield from zip(*(self._read_column(column, chunk_start, chunk_end)
+                             for column in range(len(_COLUMNS))))
+            self._drop_pages(chunk_end)
+
+    def close(self):
+        """Unmap the file."""
+        if self._map is not None:
+            self._map.close()
+            self._map = None
+
+
+def play_event(backend, kind, a, b):
+    """Send one macro event through a backend."""
+    if kind == EVENT_MOTION:
+        backend.move(a, b)
+    elif kind == EVENT_BUTTON:
+        if b:
+            backend.press(int(a))
+        else:
+            backend.release(int(a))
+    elif kind == EVENT_AXIS:
+        backend.scroll(a, b)
+    elif kind == EVENT_KEY:
+        backend.key(int(a), bool(b))
+
+
+def _parse_time(text):
+    """Parse '1.5s', '200ms', '250us' or plain seconds."""
+    for suffix, scale in (('us', 1e-6), ('ms', 1e-3), ('s', 1.0)):
+        if text.endswith(suffix):
+            return float(text[:-len(suffix)]) * scale
+    return float(text)
+
+
+def _parse_code(text, names):
+    """Parse a button or key name, or a numeric evdev code."""
+    code = names.get(text.lower())
+    if code is None:
+        code = int(text, 0)
+    return code
+
+
+def compile_macro(source, path):
+    """
+    Compile a macro source file.
+
+    Each line is a time followed by an action. Times are absolute (`1.5s`,
+    `200ms`, `250us`, plain seconds) or, with a leading `+`, relative to the
+    previous line. `#` starts a comment. Actions:
+
+        move DX DY             Move the pointer by DX, DY
+        scroll DX DY           Scroll by DX, DY
+        press|release BUTTON   left, right, middle or an evdev code
+        click BUTTON [HOLD]    Press, then release HOLD later (default 1ms)
+        key KEY down|up        A key name (a-z, 0-9, enter, space, ...) or evdev code
+        tap KEY [HOLD]         Press and release a key
+
+    Compiling streams the source, so macros of any length fit in memory.
+
+    Args:
+        source: Path of the text source
+        path: Path of the compiled file to write
+
+    Returns:
+        Number of events written
+
+    Raises:
+        MacroError: On a syntax error, with the line number
+    """
+    releases = []  # Heap of (offset, sequence, kind, code) for click/tap
+    sequence = 0
+    previous = 0.0
+
+    with open(source) as f, MacroWriter(path) as writer:
+        for number, line in enumerate(f, start=1):
+            fields = line.split('#', 1)[0].split()
+            if not fields:
+                continue
+            try:
+                time_text, action, *args = fields
+                if time_text.startswith('+'):
+                    offset = previous + _parse_time(time_text[1:])
+                else:
+                    offset = _parse_time(time_text)
+                if offset < previous:
+                    raise MacroError("time goes backwards")
+                previous = offset
+
+                # Releases scheduled by earlier clicks and taps come first
+                while releases and releases[0][0] <= offset:
+                    at, _, kind, code = heapq.heappop(releases)
+                    writer.add(at, kind, code, 0.0)
+
+                if action in ('move', 'scroll') and len(args) == 2:
+                    kind = EVENT_MOTION if action == 'move' else EVENT_AXIS
+                    writer.add(offset, kind, float(args[0]), float(args[1]))
+                elif action in ('press', 'release') and len(args) == 1:
+                    writer.add(offset, EVENT_BUTTON, _parse_code(args[0], BUTTON_NAMES),
+                               1.0 if action == 'press' else 0.0)
+                elif action == 'key' and len(args) == 2 and args[1] in ('down', 'up'):
+                    writer.add(offset, EVENT_KEY, _parse_code(args[0], KEY_NAMES),
+                               1.0 if args[1] == 'down' else 0.0)
+                elif action in ('click', 'tap') and len(args) in (1, 2):
+                    kind, names = ((EVENT_BUTTON, BUTTON_NAMES) if action == 'click'
+                                   else (EVENT_KEY, KEY_NAMES))
+                    code = _parse_code(args[0], names)
+                    hold = _parse_time(args[1]) if len(args) == 2 else DEFAULT_HOLD
+                    if hold < 0:
+                        raise MacroError(f"hold must not be negative: {args[1]}")
+                    writer.add(offset, kind, code, 1.0)
+                    heapq.heappush(releases, (offset + hold, sequence, kind, code))
+                    sequence += 1
+                else:
+                    raise MacroError(f"invalid action: {' '.join(fields[1:])!r}")
+            except (MacroError, ValueError) as e:
+                raise MacroError(f"{source}:{number}: {e}") from None
+
+        while releases:
+            at, _, kind, code = heapq.heappop(releases)
+            writer.add(at, kind, code, 0.0)
+        return writer.count
@@ -0,0 +1,320 @@
+"""Opt-in instrumentation of the click path.
+
+Enabled with the GCLICKER_INSTRUMENT environment variable or
+`gclicker-cli --instrument`, both taking a comma-separated list of:
+
+    timers          print per-stage call counts and timings on exit (default)
+    trace[=PATH]    write Chrome trace events (chrome://tracing, Perfetto)
+    cprofile[=PATH] write cProfile statistics of every engine thread
+
+"{pid}" in a PATH is replaced by the process ID, so an isolated engine
+process writes its own files. Instrumentation wraps methods of the engine,
+scheduler, stats and backend instances when they are created, so nothing
+in the click path changes, or costs anything, when it is off.
+"""
+
+import atexit
+import collections
+import json
+import os
+import sys
+import threading
+import time
+
+
+ENV_VAR = 'GCLICKER_INSTRUMENT'
+
+DEFAULT_TRACE_PATH = 'gclicker-trace-{pid}.json'
+DEFAULT_CPROFILE_PATH = 'gclicker-{pid}.prof'
+
+# Most trace events kept; older ones are dropped
+MAX_TRACE_EVENTS = 1_000_000
+
+# Methods timed on every engine, scheduler, stats object and backend, by stage name
+ENGINE_STAGES = {
+    '_click': 'click',
+    '_check_backend_errors': 'check_errors',
+    '_on_ready': 'glib.dispatch',
+    '_press': 'glib.press',
+    '_release': 'glib.release',
+    '_press_job': 'jobs.press',
+    '_release_job': 'jobs.release',
+    '_play_macro': 'jobs.macro',
+}
+SCHEDULER_STAGES = {
+    'wait': 'wait',
+    'sleep_until': 'sleep',
+}
+STATS_STAGES = {
+    'record': 'record',
+}
+BACKEND_STAGES = {
+    'press': 'backend.press',
+    'release': 'backend.release',
+    # PortalBackend
+    '_get_click_params': 'portal.variant',
+    '_notify_button_async': 'portal.queue',
+    '_ensure_eis': 'portal.eis',
+}
+# PortalBackend setup steps, timed and also traced as the waits between them
+SETUP_STEPS = (
+    '_start_setup',
+    '_create_session',
+    '_on_create_session_response',
+    '_on_select_devices_response',
+    '_on_start_response',
+    '_connect_eis',
+    '_finish_setup',
+)
+
+_recorder = None
+
+
+class Recorder:
+    """Collects stage timings and, optionally, trace events and profiles."""
+
+    def __init__(self, timers=True, trace_path=None, cprofile_path=None):
+        self.timers = timers
+        self.trace_path = trace_path
+        self.cprofile_path = cprofile_path
+        self.pid = os.getpid()
+
+        # Per stage: [calls, total ns, max ns]. The click thread, dispatch
+        # replies and the main loop all record, so both are behind _lock.
+        self._lock = threading.Lock()
+        self.totals = collections.defaultdict(lambda: [0, 0, 0])
+        self.events = collections.deque(maxlen=MAX_TRACE_EVENTS) if trace_path else None
+        self.origin = time.perf_counter_ns()
+
+        self._profiles = []
+        self._profiles_lock = threading.Lock()
+        if cprofile_path:
+            self._start_profile()
+
+    def add(self, name, start, end):
+        """Record one call of a stage (perf_counter_ns() timestamps)."""
+        duration = end - start
+        with self._lock:
+            totals = self.totals[name]
+            totals[0] += 1
+            totals[1] += duration
+            if duration > totals[2]:
+                totals[2] = duration
+            if self.events is not None:
+                self.events.append(('X', name, start, duration, threading.get_ident()))
+
+    def counter(self, name, value):
+        """Record a sampled value, e.g. scheduling lag (trace only)."""
+        if self.events is not None:
+            with self._lock:
+                self.events.append(('C', name, time.perf_counter_ns(), value,
+                                    threading.get_ident()))
+
+    def timed(self, name, func):
+        """Wrap func so every call is recorded as stage name."""
+        add = self.add
+        clock = time.perf_counter_ns
+
+        def wrapper(*args, **kwargs):
+            start = clock()
+            try:
+                return func(*args, **kwargs)
+            finally:
+                add(name, start, clock())
+
+        wrapper.__wrapped__ = func
+        return wrapper
+
+    def _start_profile(self):
+        """Profile the calling thread until finish()."""
+        import cProfile
+        profile = cProfile.Profile()
+        with self._profiles_lock:
+            self._profiles.append(profile)
+        profile.enable()
+        return profile
+
+    def profiled(self, func):
+        """Wrap a thread's target function so the thread is profiled too."""
+        if not self.cprofile_path:
+            return func
+
+        def wrapper(*args, **kwargs):
+            profile = self._start_profile()
+            try:
+                return func(*args, **kwargs)
+            finally:
+                profile.disable()
+
+        wrapper.__wrapped__ = func
+        return wrapper
+
+    def finish(self):
+        """Write the configured outputs."""
+        if self.timers and self.totals:
+            self._print_timers()
+        if self.trace_path:
+            self._write_trace()
+        if self.cprofile_path:
+            self._write_profile()
+
+    def _print_timers(self):
+        with self._lock:
+            rows = [(name, list(totals)) for name, totals in self.totals.items()]
+        rows.sort(key=lambda item: item[1][1], reverse=True)
+        lines = [f"gclicker stage timings (PID {self.pid}):",
+                 f"  {'stage':<28} {'calls':>10} {'mean us':>10} {'max us':>10} {'total ms':>10}"]
+        for name, (calls, total, maximum) in rows:
+            lines.append(f"  {name:<28} {calls:>10} {total / calls / 1e3:>10.1f} "
+                         f"{maximum / 1e3:>10.1f} {total / 1e6:>10.1f}")
+        print('\n'.join(lines), file=sys.stderr, flush=True)
+
+    def _write_trace(self):
+        origin = self.origin
+        pid = self.pid
+        with self._lock:
+            events = list(self.events)
+        trace = []
+        for kind, name, start, value, tid in events:
+            event = {'name': name, 'ph': kind, 'ts': (start - origin) / 1e3, 'pid': pid, 'tid': tid}
+            if kind == 'X':
+                event['dur'] = value / 1e3
+            else:
+                event['args'] = {name: value}
+            trace.append(event)
+        try:
+            with open(self.trace_path, 'w') as f:
+                json.dump({'traceEvents': trace, 'displayTimeUnit': 'ms'}, f)
+            print(f"Wrote trace to {self.trace_path}", file=sys.stderr)
+        except OSError as e:
+            print(f"Error writing trace: {e}", file=sys.stderr)
+
+    def _write_profile(self):
+        import pstats
+        with self._profiles_lock:
+            profiles = list(self._profiles)
+        for profile in profiles:
+            profile.disable()
+        stats = None
+        for profile in profiles:
+            try:
+                if stats is None:
+                    stats = pstats.Stats(profile)
+                else:
+                    stats.add(profile)
+            except TypeError:
+                pass  # Thread ended before running any Python code
+        if stats is None:
+            return
+        try:
+            stats.dump_stats(self.cprofile_path)
+            print(f"Wrote profile to {self.cprofile_path}", file=sys.stderr)
+        except OSError as e:
+            print(f"Error writing profile: {e}", file=sys.stderr)
+
+
+def parse_spec(spec):
+    """
+    Parse an instrumentation spec, e.g. 'timers,trace=/tmp/trace-{pid}.json'.
+
+    Returns:
+        Dict of Recorder arguments
+
+    Raises:
+        ValueError: If the spec names an unknown output
+    """
+    options = {'timers': False, 'trace_path': None, 'cprofile_path': None}
+    pid = str(os.getpid())
+    for item in spec.split(','):
+        name, _, path = item.strip().partition('=')
+        if name in ('', '1', 'timers'):
+            options['timers'] = True
+        elif name == 'trace':
+            options['trace_path'] = (path or DEFAULT_TRACE_PATH).replace('{pid}', pid)
+        elif name == 'cprofile':
+            options['cprofile_path'] = (path or DEFAULT_CPROFILE_PATH).replace('{pid}', pid)
+        else:
+            raise ValueError(f"unknown instrumentation output: {name!r}")
+    return options
+
+
+def get_recorder():
+    """Get the process's Recorder, creating it from GCLICKER_INSTRUMENT; None if off."""
+    global _recorder
+    if _recorder is None:
+        spec = os.environ.get(ENV_VAR)
+        if not spec:
+            return None
+        try:
+            options = parse_spec(spec)
+        except ValueError as e:
+            print(f"Ignoring {ENV_VAR}: {e}", file=sys.stderr)
+            os.environ.pop(ENV_VAR, None)
+            return None
+        _recorder = Recorder(**options)
+        atexit.register(_recorder.finish)
+    return _recorder
+
+
+def _wrap(recorder, obj, stages):
+    """Replace obj's bound methods listed in stages with timed ones."""
+    for attribute, stage in stages.items():
+        method = getattr(obj, attribute, None)
+        if callable(method):
+            setattr(obj, attribute, recorder.timed(stage, method))
+
+
+def _wrap_setup(recorder, backend):
+    """Time the portal setup steps, and the waits for the portal in between."""
+    last_step = [None]
+
+    def step_wrapper(name, func):
+        def wrapper(*args, **kwargs):
+            start = time.perf_counter_ns()
+            if last_step[0] is not None:
+                previous, previous_end = last_step[0]
+                recorder.add(f"portal.wait {previous} -> {name}", previous_end, start)
+            try:
+                return func(*args, **kwargs)
+            finally:
+                end = time.perf_counter_ns()
+                recorder.add(f"portal.{name}", start, end)
+                last_step[0] = None if name == '_finish_setup' else (name, end)
+
+        wrapper.__wrapped__ = func
+        return wrapper
+
+    for name in SETUP_STEPS:
+        method = getattr(backend, name, None)
+        if callable(method):
+            setattr(backend, name, step_wrapper(name, method))
+
+
+def instrument(engine):
+    """
+    Time the stages of a ClickEngine and its backend if instrumentation is on.
+
+    Returns:
+        The engine
+    """
+    recorder = get_recorder()
+    if recorder is None:
+        return engine
+
+    scheduler = engine._scheduler
+    _wrap(recorder, engine, ENGINE_STAGES)
+    _wrap(recorder, scheduler, SCHEDULER_STAGES)
+    _wrap(recorder, engine.stats, STATS_STAGES)
+    _wrap(recorder, engine.backend, BACKEND_STAGES)
+    _wrap_setup(recorder, engine.backend)
+    engine._click_loop = recorder.profiled(engine._click_loop)
+
+    # How late each tick fired: sleep overshoot and GIL contention
+    tick = scheduler.tick
+
+    def timed_tick(now=None):
+        tick(now)
+        recorder.counter('lag_us', scheduler.lag * 1e6)
+
+    scheduler.tick = timed_tick
+    return engine
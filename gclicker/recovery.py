@@ -0,0 +1,136 @@
+"""Error handling for long-running click loops: back-off and rate-limited logging."""
+
+import threading
+import time
+
+
+# Longest pause between recovery attempts, in seconds
+MAX_BACKOFF = 30.0
+
+# How often repeated errors are summarized, in seconds
+SUMMARY_INTERVAL = 5.0
+
+
+def backoff_delay(attempt, base=0.5, maximum=MAX_BACKOFF):
+    """Get the exponential back-off delay before retry number attempt (0 = first retry)."""
+    return min(maximum, base * (2 ** min(attempt, 32)))
+
+
+class CircuitBreaker:
+    """
+    Stops calling something that keeps failing, then probes it with back-off.
+
+    After threshold consecutive failures the breaker opens: allow() returns
+    False until a back-off delay has passed, then lets one attempt through.
+    If that attempt fails too, the breaker reopens with twice the delay; a
+    success closes it.
+    """
+
+    def __init__(self, threshold=5, base_delay=0.5, max_delay=MAX_BACKOFF):
+        """
+        Initialize the breaker.
+
+        Args:
+            threshold: Consecutive failures that open the breaker
+            base_delay: Back-off after the breaker first opens, in seconds
+            max_delay: Longest back-off, in seconds
+        """
+        self.threshold = threshold
+        self.base_delay = base_delay
+        self.max_delay = max_delay
+        self.failures = 0     # Consecutive failures
+        self.opened = 0       # Times opened since the last success
+        self.retry_at = None  # While open, when the next attempt is allowed
+
+    def allow(self, now=None):
+        """Check if an attempt may be made now."""
+        if self.retry_at is None:
+            return True
+        if now is None:
+            now = time.monotonic()
+        return now >= self.retry_at
+
+    def record_success(self):
+        """
+        Close the breaker after a successful attempt.
+
+        Returns:
+            True if this ended a run of failures
+        """
+        if not self.failures:
+            return False
+        self.failures = 0
+        self.opened = 0
+        self.retry_at = None
+        return True
+
+    def record_failure(self, now=None):
+        """
+        Count a failed attempt.
+
+        Returns:
+            Back-off delay in seconds if the breaker (re)opened, else None
+        """
+        self.failures += 1
+        if self.failures < self.threshold:
+            return None
+        if now is None:
+            now = time.monotonic()
+        delay = backoff_delay(self.opened, self.base_delay, self.max_delay)
+        self.opened += 1
+        self.retry_at = now + delay
+        return delay
+
+
+class ErrorLog:
+    """
+    Prints errors without flooding the output.
+
+    The first occurrence of a message is printed straight away; repeats are
+    counted and printed as one summary line per SUMMARY_INTERVAL.
+    """
+
+    def __init__(self, prefix, interval=SUMMARY_INTERVAL):
+        """
+        Initialize the log.
+
+        Args:
+            prefix: Printed before every message, e.g. 'Error clicking'
+            interval: Seconds between summaries of repeated messages
+        """
+        self.prefix = prefix
+        self.interval = interval
+        self._lock = threading.Lock()
+        self._last_message = None
+        self._repeats = 0
+        self._summary_at = 0.0
+
+    def report(self, message):
+        """Print message, or count it if it was printed recently."""
+        now = time.monotonic()
+        with self._lock:
+            if message == self._last_message:
+                self._repeats += 1
+                if now < self._summary_at:
+                    return
+                lines = [self._take_summary()]
+            else:
+                lines = [self._take_summary()] if self._repeats else []
+                lines.append(f"{self.prefix}: {message}")
+                self._last_message = message
+            self._summary_at = now + self.interval
+        print('\n'.join(lines), flush=True)
+
+    def flush(self):
+        """Print the summary of repeats not printed yet, and start over."""
+        with self._lock:
+            line = self._take_summary() if self._repeats else None
+            self._last_message = None
+        if line:
+            print(line, flush=True)
+
+    def _take_summary(self):
+        """Get the summary line for the counted repeats and reset the count."""
+        line = f"{self.prefix}: {self._last_message} (repeated {self._repeats} times)"
+        self._repeats = 0
+        return line
@@ -0,0 +1,178 @@
+"""Deadline-based scheduling for the click loop."""
+
+import time
+
+
+# Shortest interval the engine accepts, in seconds. Anything below about a
+# millisecond needs the hybrid sleep/spin timer (spin > 0) to be reachable.
+MIN_INTERVAL = 0.00001
+
+# Default spin budget for the high-resolution timer, in seconds
+HIRES_SPIN = 0.0005
+
+
+class DeadlineScheduler:
+    """Schedule clicks against absolute monotonic deadlines."""
+
+    # Missed-deadline policies
+    SKIP = 'skip'          # Drop missed deadlines and resume on the next slot
+    CATCH_UP = 'catch-up'  # Fire missed deadlines back-to-back until caught up
+    POLICIES = (SKIP, CATCH_UP)
+
+    def __init__(self, interval, policy=SKIP, max_catch_up=10, spin=0.0):
+        """
+        Initialize the scheduler.
+
+        Args:
+            interval: Time between deadlines in seconds
+            policy: What to do with missed deadlines ('skip' or 'catch-up')
+            max_catch_up: Most missed deadlines fired in one burst under the
+                catch-up policy; anything beyond that is skipped
+            spin: Seconds before each deadline to stop sleeping and busy-wait
+                instead (0 sleeps all the way). Bounds the CPU spent per tick.
+        """
+        if policy not in self.POLICIES:
+            raise ValueError(f"Unknown missed-deadline policy: {policy}")
+
+        self.interval = interval
+        self.policy = policy
+        self.max_catch_up = max_catch_up
+        self.spin = spin
+
+        self._next_deadline = None
+        self._started_at = None
+        self.deadline = None    # Deadline of the most recent tick
+
+        # Lag reporting
+        self.lag = 0.0          # How late the most recent tick fired, in seconds
+        self.max_lag = 0.0
+        self.ticks = 0
+        self.missed = 0         # Deadlines dropped by the skip policy
+
+    def reset(self, now=None):
+        """Anchor the schedule so the first deadline is due immediately."""
+        if now is None:
+            now = time.monotonic()
+        self._started_at = now
+        self._next_deadline = now
+        self.lag = 0.0
+        self.max_lag = 0.0
+        self.ticks = 0
+        self.missed = 0
+
+    def resync(self, at=None):
+        """
+        Restart the schedule with the next deadline at a given time (default: now).
+
+        Used after a pause in clicking (e.g. while the backend is down), so the
+        gap is neither caught up nor counted as missed deadlines.
+        """
+        self._next_deadline = time.monotonic() if at is None else at
+
+    def set_interval(self, interval):
+        """Change the interval, keeping the current phase of the schedule."""
+        if self._next_deadline is not None:
+            self._next_deadline += interval - self.interval
+        self.interval = interval
+
+    def wait(self, stop_event):
+        """
+        Block until the next deadline is due.
+
+        Args:
+            stop_event: threading.Event that aborts the wait when set
+
+        Returns:
+            True when a tick is due, False if stop_event was set
+        """
+        if self._next_deadline is None:
+            self.reset()
+
+        if not self.sleep_until(self._next_deadline, stop_event):
+            return False
+
+        self.tick()
+        return True
+
+    @property
+    def next_deadline(self):
+        """Monotonic time of the next deadline, for callers that do their own waiting."""
+        if self._next_deadline is None:
+            self.reset()
+        return self._next_deadline
+
+    def tick(self, now=None):
+        """
+        Fire the next deadline, which the caller has waited for itself.
+
+        Records how late it fired and moves on according to the policy.
+        """
+        if now is None:
+            now = time.monotonic()
+        self.deadline = self._next_deadline
+        self.lag = now - self._next_deadline
+        if self.lag > self.max_lag:
+            self.max_lag = self.lag
+        self.ticks += 1
+
+        self._advance(now)
+
+    def sleep_until(self, deadline, stop_event):
+        """
+        Block until a monotonic deadline.
+
+        Sleeps until spin seconds before the deadline, then busy-waits for
+        the rest, since sleeping overshoots by more than a sub-millisecond
+        interval.
+
+        Args:
+            deadline: time.monotonic() value to wait for
+            stop_event: threading.Event that aborts the wait when set
+
+        Returns:
+            True when the deadline was reached, False if stop_event was set
+        """
+        spin = self.spin
+        while True:
+            remaining = deadline - time.monotonic()
+            if remaining <= spin:
+                break
+            if stop_event.wait(remaining - spin):
+                return False
+
+        while time.monotonic() < deadline:
+            if stop_event.is_set():
+                return False
+
+        return not stop_event.is_set()
+
+    def _advance(self, now):
+        """Move to the next deadline according to the missed-deadline policy."""
+        self._next_deadline += self.interval
+        if now < self._next_deadline:
+            return
+
+        # Number of deadlines that are already overdue
+        behind = int((now - self._next_deadline) // self.interval) + 1
+
+        if self.policy == self.CATCH_UP:
+            # Keep up to max_catch_up overdue deadlines, drop the rest
+            behind = max(0, behind - self.max_catch_up)
+            if not behind:
+                return
+
+        self._next_deadline += behind * self.interval
+        self.missed += behind
+
+    def get_stats(self):
+        """Get a summary of how the schedule is keeping up."""
+        elapsed = 0.0
+        if self._started_at is not None:
+            elapsed = time.monotonic() - self._started_at
+        return {
+            'ticks': self.ticks,
+            'missed': self.missed,
+            'lag': self.lag,
+            'max_lag': self.max_lag,
+            'rate': self.ticks / elapsed if elapsed > 0 else 0.0,
+        }
@@ -1,9 +1,102 @@
-"""Settings management for gclicker."""
+"""Settings management for gclicker.
 
+Settings are typed (see SCHEMA) and cached in memory. Changes are written
+back after a short quiet period, so a spin button sending a value per tick
+costs one write. Only the keys changed in this process are written, merged
+into the file under a lock, and the file is replaced atomically, so a reader
+never sees a half-written file and concurrent writers do not undo each
+other's changes. watch() follows changes made by other processes.
+"""
+
+import atexit
+import fcntl
 import json
 import os
+import threading
+import time
 from pathlib import Path
 
+from gclicker.scheduler import MIN_INTERVAL
+
+
+# How long set() waits for further changes before writing, in seconds
+SAVE_DELAY = 0.5
+
+
+class Setting:
+    """Type, default and allowed values of one setting."""
+
+    def __init__(self, value_type, default, choices=None, minimum=None, description=''):
+        self.type = value_type
+        self.default = default
+        self.choices = choices
+        self.minimum = minimum
+        self.description = description
+
+    def validate(self, value):
+        """
+        Check a value, converting ints to floats for float settings.
+
+        Returns:
+            The value to store
+
+        Raises:
+            ValueError: If the value has the wrong type or is out of range
+        """
+        if self.type is float and isinstance(value, int) and not isinstance(value, bool):
+            value = float(value)
+        if not isinstance(value, self.type) or (self.type is not bool and isinstance(value, bool)):
+            raise ValueError(f"expected {self.type.__name__}, got {value!r}")
+        if self.choices is not None and value not in self.choices:
+            raise ValueError(f"expected one of {', '.join(self.choices)}, got {value!r}")
+        if self.minimum is not None and value < self.minimum:
+            raise ValueError(f"must be at least {self.minimum}, got {value!r}")
+        return value
+
+
+SCHEMA = {
+    'interval': Setting(float, 0.1, minimum=MIN_INTERVAL,
+                        description='Click interval in seconds'),
+    'backend': Setting(str, 'portal', choices=('portal', 'uinput', 'null'),
+                       description='Click backend'),
+    'dispatch': Setting(str, 'sync', choices=('sync', 'async'),
+                        description='Wait for each portal reply, or pipeline clicks'),
+    'missed_policy': Setting(str, 'skip', choices=('skip', 'catch-up'),
+                             description='What to do with missed click deadlines'),
+    'spin': Setting(float, 0.0, minimum=0.0,
+                    description='High-resolution timer spin budget in seconds (0 = off)'),
+    'event_loop': Setting(str, 'thread', choices=('thread', 'glib'),
+                          description='Click thread: plain loop or private GLib main loop'),
+    'isolate': Setting(bool, False, description='Run the click engine in its own process'),
+    'click_ring': Setting(bool, False, description='Publish every click to a shared-memory ring'),
+    'prewarm': Setting(bool, True,
+                       description='Restore the portal session at startup, before the first click'),
+    'keep_alive': Setting(bool, True,
+                          description='Restore the portal session when the portal closes it'),
+    'max_property_rate': Setting(float, 10.0, minimum=0.1,
+                                 description='Most D-Bus PropertiesChanged signals per second'),
+    'keyboard': Setting(bool, False,
+                        description='Also ask the portal for a keyboard, for macros with key events'),
+    'stats_panel': Setting(bool, True,
+                           description='Show the live clicks/s and latency graph in the GUI'),
+    'profiles': Setting(dict, {}, description='Named sets of PROFILE_KEYS values'),
+}
+
+# Settings a profile can hold
+PROFILE_KEYS = ('interval', 'backend', 'dispatch', 'missed_policy', 'spin')
+
+
+def _validate_profile(values):
+    """Check a profile's values, returning them validated."""
+    if not isinstance(values, dict):
+        raise ValueError(f"expected a dict, got {values!r}")
+    profile = {}
+    for key, value in values.items():
+        if key not in PROFILE_KEYS:
+            raise ValueError(f"{key!r} cannot be stored in a profile")
+        profile[key] = SCHEMA[key].validate(value)
+    return profile
+
 
 class Settings:
     """Manage gclicker settings."""
@@ -12,28 +105,245 @@ class Settings:
         """Initialize settings."""
         self.config_dir = Path(os.environ.get('XDG_CONFIG_HOME', Path.home() / '.config')) / 'gclicker'
         self.config_file = self.config_dir / 'settings.json'
+        self.lock_file = self.config_dir / '.settings.json.lock'
+
+        self._lock = threading.Lock()
+        self._dirty = set()        # Keys changed here and not yet written
+        self._save_timer = None
+        self._save_at = 0.0        # Monotonic time of the pending write
+        self._monitor = None
         self._settings = self._load()
+        atexit.register(self.flush)
 
-    def _load(self):
-        """Load settings from file."""
-        if self.config_file.exists():
+    def _validate(self, key, value):
+        """Validate a value for key; keys outside SCHEMA are stored as they are."""
+        setting = SCHEMA.get(key)
+        if setting is None:
+            return value
+        if key == 'profiles':
+            value = setting.validate(value)
+            return {name: _validate_profile(profile) for name, profile in value.items()}
+        return setting.validate(value)
+
+    def _read_file(self):
+        """Read the settings file, skipping invalid values."""
+        settings = {}
+        if not self.config_file.exists():
+            return settings
+        try:
+            with open(self.config_file, 'r') as f:
+                data = json.load(f)
+        except Exception as e:
+            print(f"Error loading settings: {e}")
+            return settings
+
+        for key, value in data.items():
             try:
-                with open(self.config_file, 'r') as f:
-                    return json.load(f)
-            except Exception as e:
-                print(f"Error loading settings: {e}")
+                settings[key] = self._validate(key, value)
+            except ValueError as e:
+                print(f"Ignoring setting {key}: {e}")
+        return settings
 
-        return self._defaults()
+    def _load(self):
+        """Load settings from file."""
+        settings = self._defaults()
+        settings.update(self._read_file())
+        return settings
 
     def _defaults(self):
         """Get default settings."""
-        return {}
+        return {key: (dict(setting.default) if isinstance(setting.default, dict) else setting.default)
+                for key, setting in SCHEMA.items()}
+
+    def get(self, key, default=None):
+        """Get a setting value from the cache."""
+        return self._settings.get(key, default)
+
+    def set(self, key, value):
+        """
+        Set a setting value. It is written to disk once no other setting has
+        changed for SAVE_DELAY seconds, or by flush().
+
+        Raises:
+            ValueError: If the value does not fit the setting's type
+        """
+        value = self._validate(key, value)
+        with self._lock:
+            if key in self._settings and self._settings[key] == value:
+                return
+            self._settings[key] = value
+            self._dirty.add(key)
+            # Push the write back; a running timer re-arms itself when it fires
+            self._save_at = time.monotonic() + SAVE_DELAY
+            if self._save_timer is None:
+                self._start_save_timer(SAVE_DELAY)
+
+    def _start_save_timer(self, delay):
+        """Start the timer that writes pending changes. Call with the lock held."""
+        self._save_timer = threading.Timer(delay, self._on_save_timer)
+        self._save_timer.daemon = True
+        self._save_timer.start()
+
+    def _on_save_timer(self):
+        with self._lock:
+            if self._save_timer is not threading.current_thread():
+                return  # Cancelled by flush()
+            remaining = self._save_at - time.monotonic()
+            if remaining > 0:
+                self._start_save_timer(remaining)
+                return
+            self._save_timer = None
+        self.flush()
+
+    def flush(self):
+        """Write pending changes now."""
+        with self._lock:
+            if self._save_timer is not None:
+                self._save_timer.cancel()
+                self._save_timer = None
+            if not self._dirty:
+                return
+            if self.save():
+                self._dirty.clear()
 
     def save(self):
-        """Save settings to file."""
+        """
+        Write changed settings to file, replacing it atomically.
+
+        The file is re-read under an exclusive lock on lock_file and only
+        the keys changed in this process are written over it, so changes
+        other processes saved in the meantime are kept.
+
+        Returns:
+            True on success
+        """
+        temp_file = self.config_file.with_name(f".{self.config_file.name}.{os.getpid()}.tmp")
         try:
             self.config_dir.mkdir(parents=True, exist_ok=True)
-            with open(self.config_file, 'w') as f:
-                json.dump(self._settings, f, indent=2)
+            with open(self.lock_file, 'a') as lock:
+                fcntl.flock(lock, fcntl.LOCK_EX)
+                data = self._read_raw()
+                if data is None:
+                    data = dict(self._settings)
+                for key in self._dirty:
+                    data[key] = self._settings[key]
+                with open(temp_file, 'w') as f:
+                    json.dump(data, f, indent=2)
+                    f.flush()
+                    os.fsync(f.fileno())
+                os.replace(temp_file, self.config_file)
+            return True
         except Exception as e:
             print(f"Error saving settings: {e}")
+            try:
+                temp_file.unlink()
+            except OSError:
+                pass
+            return False
+
+    def _read_raw(self):
+        """
+        Read the settings file as it is, for save().
+
+        Returns:
+            The file's dict ({} if there is no file), or None if it is unreadable
+        """
+        try:
+            with open(self.config_file, 'r') as f:
+                data = json.load(f)
+        except FileNotFoundError:
+            return {}
+        except (OSError, ValueError):
+            return None
+        return data if isinstance(data, dict) else None
+
+    def reload(self):
+        """
+        Re-read the settings file, keeping changes not written yet.
+
+        Returns:
+            Set of keys whose values changed
+        """
+        values = self._load()
+        with self._lock:
+            changed = set()
+            for key, value in values.items():
+                if key in self._dirty or self._settings.get(key) == value:
+                    continue
+                self._settings[key] = value
+                changed.add(key)
+            return changed
+
+    def watch(self, callback):
+        """
+        Follow changes other processes make to the settings file.
+
+        Needs Gio; events are delivered on the thread-default main context.
+
+        Args:
+            callback: Called as callback(changed_keys) after the cache was updated
+        """
+        from gi.repository import Gio
+
+        def on_changed(monitor, file, other_file, event_type):
+            names = {f.get_basename() for f in (file, other_file) if f is not None}
+            if self.config_file.name not in names:
+                return
+            if event_type in (Gio.FileMonitorEvent.CHANGED, Gio.FileMonitorEvent.ATTRIBUTE_CHANGED):
+                return  # Wait for CHANGES_DONE_HINT
+            changed = self.reload()
+            if changed:
+                callback(changed)
+
+        # Watch the directory, as saving replaces the file
+        self.config_dir.mkdir(parents=True, exist_ok=True)
+        directory = Gio.File.new_for_path(str(self.config_dir))
+        self._monitor = directory.monitor_directory(Gio.FileMonitorFlags.WATCH_MOVES, None)
+        self._monitor.connect('changed', on_changed)
+
+    def unwatch(self):
+        """Stop following changes."""
+        if self._monitor is not None:
+            self._monitor.cancel()
+            self._monitor = None
+
+    # Profiles
+
+    def get_profile(self, name):
+        """
+        Get a profile's values.
+
+        Raises:
+            KeyError: If there is no such profile
+        """
+        return dict(self._settings['profiles'][name])
+
+    def save_profile(self, name, values=None):
+        """
+        Store a profile.
+
+        Args:
+            name: Profile name
+            values: Dict of PROFILE_KEYS values (default: the current settings)
+        """
+        if values is None:
+            values = {key: self._settings[key] for key in PROFILE_KEYS}
+        profiles = dict(self._settings['profiles'])
+        profiles[name] = _validate_profile(values)
+        self.set('profiles', profiles)
+
+    def delete_profile(self, name):
+        """Remove a profile if it exists."""
+        profiles = dict(self._settings['profiles'])
+        if profiles.pop(name, None) is not None:
+            self.set('profiles', profiles)
+
+    def apply_profile(self, name):
+        """
+        Make a profile's values the current settings.
+
+        Raises:
+            KeyError: If there is no such profile
+        """
+        for key, value in self.get_profile(name).items():
+            self.set(key, value)
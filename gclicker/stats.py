@@ -0,0 +1,127 @@
+"""Per-click timing telemetry."""
+
+from array import array
+import math
+
+from gclicker.click_ring import STATUS_ERROR
+
+
+def percentile(sorted_values, fraction):
+    """Get a percentile (fraction in [0, 1]) from an already sorted sequence."""
+    if not sorted_values:
+        return 0.0
+    index = min(len(sorted_values) - 1, int(math.ceil(fraction * len(sorted_values))) - 1)
+    return sorted_values[max(0, index)]
+
+
+class ClickStats:
+    """
+    Fixed-size ring buffer of per-click timestamps.
+
+    Each click records four monotonic timestamps: when it was scheduled, when
+    the press was sent, when the press was acknowledged and when the release
+    was acknowledged. For pipelined backends "acknowledged" means the event
+    was handed off, not that the compositor replied.
+    """
+
+    def __init__(self, size=4096, ring=None, job=0):
+        """
+        Initialize the ring buffer.
+
+        Args:
+            size: Number of clicks kept (rounded up to a power of two)
+            ring: ClickRing to also publish every click and error to
+            job: Click job ID the clicks are published under
+        """
+        capacity = 1
+        while capacity < size:
+            capacity <<= 1
+        self.size = capacity
+        self._mask = capacity - 1
+
+        self.scheduled = array('d', bytes(8 * capacity))
+        self.press_sent = array('d', bytes(8 * capacity))
+        self.press_ack = array('d', bytes(8 * capacity))
+        self.release_ack = array('d', bytes(8 * capacity))
+
+        self.count = 0   # Clicks recorded since reset()
+        self.errors = 0
+        self.ring = ring
+        self.job = job
+
+    def reset(self):
+        """Forget all recorded clicks."""
+        self.count = 0
+        self.errors = 0
+
+    def record(self, scheduled, press_sent, press_ack, release_ack):
+        """Record the timestamps of one click."""
+        i = self.count & self._mask
+        self.scheduled[i] = scheduled
+        self.press_sent[i] = press_sent
+        self.press_ack[i] = press_ack
+        self.release_ack[i] = release_ack
+        self.count += 1
+        if self.ring is not None:
+            self.ring.write(scheduled, press_sent, press_ack, release_ack, job=self.job)
+
+    def record_error(self, scheduled=0.0):
+        """Count a failed click, optionally with the deadline it was scheduled for."""
+        self.errors += 1
+        if self.ring is not None:
+            self.ring.write(scheduled, 0.0, 0.0, 0.0, STATUS_ERROR, self.job)
+
+    def get_rate(self):
+        """Get the achieved click rate (clicks/s) over the ring buffer, without a full summary."""
+        n = min(self.count, self.size)
+        if n < 2:
+            return 0.0
+        newest = (self.count - 1) & self._mask
+        oldest = (self.count - n) & self._mask
+        span = self.press_sent[newest] - self.press_sent[oldest]
+        return (n - 1) / span if span > 0 else 0.0
+
+    def _window(self):
+        """Get the ring indices of the recorded clicks, oldest first."""
+        count = self.count
+        n = min(count, self.size)
+        start = count - n
+        mask = self._mask
+        return [(start + k) & mask for k in range(n)]
+
+    def get_summary(self):
+        """
+        Summarize the clicks currently in the ring buffer.
+
+        Returns:
+            Dict with achieved rate (clicks/s), press round-trip latency
+            percentiles, scheduling lateness and jitter (seconds) and counters
+        """
+        indices = self._window()
+        summary = {
+            'clicks': self.count,
+            'errors': self.errors,
+            'rate': 0.0,
+            'latency_p50': 0.0,
+            'latency_p95': 0.0,
+            'latency_p99': 0.0,
+            'lateness_mean': 0.0,
+            'jitter': 0.0,
+        }
+        if not indices:
+            return summary
+
+        press_sent = self.press_sent
+        latencies = sorted(self.press_ack[i] - press_sent[i] for i in indices)
+        summary['latency_p50'] = percentile(latencies, 0.50)
+        summary['latency_p95'] = percentile(latencies, 0.95)
+        summary['latency_p99'] = percentile(latencies, 0.99)
+
+        # Jitter is the standard deviation of how late each press went out
+        lateness = [press_sent[i] - self.scheduled[i] for i in indices]
+        mean = sum(lateness) / len(lateness)
+        summary['lateness_mean'] = mean
+        summary['jitter'] = math.sqrt(sum((x - mean) ** 2 for x in lateness) / len(lateness))
+
+        summary['rate'] = self.get_rate()
+        return summary
@@ -0,0 +1,275 @@
+"""Live click statistics panel for the GUI."""
+
+import collections
+import math
+import time
+
+from gi.repository import GLib, Gtk
+
+
+# Redraw budget: the panel samples the engine and redraws at most this often,
+# however fast it clicks
+FRAME_INTERVAL_MS = 100
+# Width of one bar in the graph, and how many are kept
+BUCKET_SECONDS = 1.0
+HISTORY = 60
+# Most clicks whose latency is binned per frame; faster click rates are sampled
+MAX_SAMPLES_PER_FRAME = 512
+
+# Latency histogram: log-spaced bins, 4 per octave, from 1us
+LATENCY_BASE = 1e-6
+BINS_PER_OCTAVE = 4
+LATENCY_BINS = 96
+
+HEADER_HEIGHT = 22
+MISSED_COLOR = (0.88, 0.11, 0.14)
+LATENCY_COLOR = (0.21, 0.52, 0.89)
+
+Bucket = collections.namedtuple('Bucket', 'rate p50 p95 p99 missed')
+
+
+def _latency_bin(latency):
+    """Get the histogram bin of a latency in seconds."""
+    if latency <= LATENCY_BASE:
+        return 0
+    return min(LATENCY_BINS - 1, int(math.log2(latency / LATENCY_BASE) * BINS_PER_OCTAVE))
+
+
+def _histogram_percentile(histogram, total, fraction):
+    """Get a percentile (fraction in [0, 1]) as the upper edge of the bin holding it."""
+    if not total:
+        return 0.0
+    target = fraction * total
+    seen = 0
+    for i, n in enumerate(histogram):
+        seen += n
+        if n and seen >= target:
+            return LATENCY_BASE * 2 ** ((i + 1) / BINS_PER_OCTAVE)
+    return 0.0
+
+
+def _format_ms(seconds):
+    return f"{seconds * 1000:.3f} ms"
+
+
+class StatsPanel(Gtk.DrawingArea):
+    """
+    Graph of achieved clicks/s, press latency and missed deadlines.
+
+    Each frame folds the clicks recorded since the previous frame into the
+    current one-second bucket: a click count, a missed-deadline count and
+    a latency histogram. Drawing only reads finished buckets, so its cost
+    does not depend on the click rate, and nothing runs per click.
+    """
+
+    def __init__(self, clicker):
+        """
+        Initialize the panel.
+
+        Args:
+            clicker: ClickEngine (or IsolatedClickEngine) to follow
+        """
+        super().__init__()
+        self.clicker = clicker
+        self.history = collections.deque(maxlen=HISTORY)
+
+        # The bucket being filled
+        self._live = None
+        self._bucket_start = None
+        self._clicks = 0
+        self._missed = 0
+        self._histogram = [0] * LATENCY_BINS
+        self._binned = 0
+
+        # Engine counters as of the previous frame
+        self._count_seen = 0
+        self._missed_seen = 0
+
+        # Only an in-process engine exposes per-click timestamps; for an
+        # isolated engine, percentiles come from get_stats() once per bucket
+        self._per_click = hasattr(clicker.stats, 'press_ack')
+
+        self._timer = None
+        self.set_content_width(480)
+        self.set_content_height(140)
+        self.set_draw_func(self._draw)
+        self.connect('map', self._on_map)
+        self.connect('unmap', self._on_unmap)
+
+    def _on_map(self, widget):
+        if self._timer is None:
+            self._timer = GLib.timeout_add(FRAME_INTERVAL_MS, self._on_frame)
+
+    def _on_unmap(self, widget):
+        if self._timer is not None:
+            GLib.source_remove(self._timer)
+            self._timer = None
+
+    def _on_frame(self):
+        if self._collect():
+            self.queue_draw()
+        return GLib.SOURCE_CONTINUE
+
+    def _collect(self):
+        """
+        Fold new clicks into the current bucket.
+
+        Returns:
+            True if the panel needs redrawing
+        """
+        clicker = self.clicker
+        running = clicker.running
+        count = clicker.stats.count
+        missed = clicker.get_schedule_stats()['missed']
+        if count < self._count_seen or missed < self._missed_seen:
+            # The engine restarted and reset its counters
+            self._count_seen = 0
+            self._missed_seen = 0
+
+        new_clicks = count - self._count_seen
+        if not running and not new_clicks and self._bucket_start is None:
+            return False
+
+        now = time.monotonic()
+        if self._bucket_start is None:
+            # Clicks from before the first frame of a run belong to no bucket
+            self._bucket_start = now
+            self._count_seen = count
+            self._missed_seen = missed
+            return False
+
+        if self._per_click:
+            self._bin_latencies(self._count_seen, count)
+        self._clicks += new_clicks
+        self._missed += missed - self._missed_seen
+        self._count_seen = count
+        self._missed_seen = missed
+
+        elapsed = now - self._bucket_start
+        bucket = self._make_bucket(elapsed)
+        if elapsed >= BUCKET_SECONDS or not running:
+            self.history.append(bucket)
+            self._live = None
+            self._bucket_start = now if running else None
+            self._clicks = 0
+            self._missed = 0
+            self._histogram = [0] * LATENCY_BINS
+            self._binned = 0
+        else:
+            self._live = bucket
+        return True
+
+    def _bin_latencies(self, start, end):
+        """Add the press latencies of clicks start..end to the histogram, sampling if many."""
+        stats = self.clicker.stats
+        # Older clicks have already been overwritten
+        start = max(start, end - stats.size)
+        n = end - start
+        if n <= 0:
+            return
+        step = -(-n // MAX_SAMPLES_PER_FRAME)
+        mask = stats.size - 1
+        press_sent = stats.press_sent
+        press_ack = stats.press_ack
+        histogram = self._histogram
+        for number in range(start, end, step):
+            i = number & mask
+            histogram[_latency_bin(press_ack[i] - press_sent[i])] += 1
+            self._binned += 1
+
+    def _make_bucket(self, elapsed):
+        """Summarize the current bucket."""
+        rate = self._clicks / elapsed if elapsed > 0 else 0.0
+        if self._per_click:
+            histogram, total = self._histogram, self._binned
+            return Bucket(rate,
+                          _histogram_percentile(histogram, total, 0.50),
+                          _histogram_percentile(histogram, total, 0.95),
+                          _histogram_percentile(histogram, total, 0.99),
+                          self._missed)
+
+        if elapsed < BUCKET_SECONDS and self.clicker.running:
+            # Keep the previous percentiles until the bucket is finished
+            previous = self.history[-1] if self.history else Bucket(0.0, 0.0, 0.0, 0.0, 0)
+            return Bucket(rate, previous.p50, previous.p95, previous.p99, self._missed)
+        stats = self.clicker.get_stats()
+        return Bucket(rate, stats['latency_p50'], stats['latency_p95'], stats['latency_p99'],
+                      self._missed)
+
+    def _draw(self, area, cr, width, height):
+        """Draw the header line and the graph."""
+        buckets = list(self.history)
+        if self._live is not None:
+            buckets.append(self._live)
+
+        try:
+            fg = self.get_color()
+        except AttributeError:
+            # GTK < 4.10
+            fg = self.get_style_context().get_color()
+        fg = (fg.red, fg.green, fg.blue)
+
+        # Header: the latest bucket and the total missed deadlines on screen
+        cr.set_font_size(12)
+        cr.set_source_rgb(*fg)
+        cr.move_to(0, 14)
+        if buckets:
+            latest = buckets[-1]
+            cr.show_text(f"{latest.rate:.1f} clicks/s   p50 {_format_ms(latest.p50)}   "
+                         f"p95 {_format_ms(latest.p95)}   p99 {_format_ms(latest.p99)}   "
+                         f"missed {sum(b.missed for b in buckets)}")
+        else:
+            cr.show_text("Not clicking")
+
+        top = HEADER_HEIGHT
+        graph_height = height - top
+        if graph_height <= 0:
+            return
+        bar_width = width / HISTORY
+        target = 1.0 / self.clicker.interval
+        max_rate = max([target] + [b.rate for b in buckets]) * 1.1
+        max_latency = max([b.p95 for b in buckets] + [1e-9])
+
+        # Baseline
+        cr.set_source_rgba(*fg, 0.2)
+        cr.rectangle(0, height - 1, width, 1)
+        cr.fill()
+
+        # Achieved clicks/s, newest on the right
+        first_x = width - len(buckets) * bar_width
+        cr.set_source_rgba(*fg, 0.35)
+        for i, bucket in enumerate(buckets):
+            bar_height = graph_height * bucket.rate / max_rate
+            cr.rectangle(first_x + i * bar_width + 1, height - bar_height,
+                         bar_width - 2, bar_height)
+        cr.fill()
+
+        # Missed deadlines
+        cr.set_source_rgb(*MISSED_COLOR)
+        for i, bucket in enumerate(buckets):
+            if bucket.missed:
+                cr.rectangle(first_x + i * bar_width + 1, height - 4, bar_width - 2, 4)
+        cr.fill()
+
+        # Configured rate
+        cr.set_source_rgba(*fg, 0.6)
+        cr.set_line_width(1)
+        cr.set_dash([4, 4])
+        y = height - graph_height * target / max_rate
+        cr.move_to(0, y)
+        cr.line_to(width, y)
+        cr.stroke()
+        cr.set_dash([])
+
+        # p95 latency, on its own scale
+        if buckets:
+            cr.set_source_rgb(*LATENCY_COLOR)
+            cr.set_line_width(1.5)
+            for i, bucket in enumerate(buckets):
+                x = first_x + (i + 0.5) * bar_width
+                y = height - graph_height * bucket.p95 / max_latency
+                if i == 0:
+                    cr.move_to(x, y)
+                else:
+                    cr.line_to(x, y)
+            cr.stroke()
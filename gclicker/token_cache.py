@@ -0,0 +1,150 @@
+"""Cache of RemoteDesktop portal restore tokens.
+
+A restore token lets the portal bring back a session without asking the
+user again. It only works with the compositor that issued it and for the
+device types it was issued for, and the portal replaces it every time it
+is used. Tokens are therefore kept per (portal identity, device types),
+with the time each was last used successfully, in
+$XDG_CACHE_HOME/gclicker/restore_tokens.json.
+"""
+
+import json
+import os
+import time
+from pathlib import Path
+
+
+# Device types for SelectDevices (a bitmask)
+DEVICE_KEYBOARD = 1
+DEVICE_POINTER = 2
+DEVICE_TOUCHSCREEN = 4
+
+# Tokens not used for this long are dropped, in seconds
+TOKEN_MAX_AGE = 180 * 24 * 3600
+
+# Longest token accepted from the cache file
+MAX_TOKEN_LENGTH = 256
+
+
+def portal_identity():
+    """Identify the desktop whose portal issues the tokens (tokens do not carry over)."""
+    desktop = os.environ.get('XDG_CURRENT_DESKTOP') or 'unknown'
+    session_type = os.environ.get('XDG_SESSION_TYPE') or 'unknown'
+    return f"{desktop.lower()}:{session_type}"
+
+
+def _is_valid_token(token):
+    """Check that a cached token is something the portal could have issued."""
+    return (isinstance(token, str) and 0 < len(token) <= MAX_TOKEN_LENGTH
+            and token.isprintable() and not any(c.isspace() for c in token))
+
+
+class RestoreTokenCache:
+    """Restore tokens by portal identity and device types."""
+
+    def __init__(self, path=None):
+        """
+        Initialize the cache. Nothing is read until a token is needed.
+
+        Args:
+            path: Cache file (default: $XDG_CACHE_HOME/gclicker/restore_tokens.json)
+        """
+        if path is None:
+            cache_dir = Path(os.environ.get('XDG_CACHE_HOME', Path.home() / '.cache'))
+            path = cache_dir / 'gclicker' / 'restore_tokens.json'
+        self.path = Path(path)
+        self.identity = portal_identity()
+        self._entries = None
+
+    @staticmethod
+    def _key(identity, device_types):
+        return f"{identity}/{device_types}"
+
+    def _read(self):
+        """Read the valid, unexpired entries of the cache file."""
+        try:
+            with open(self.path, 'r') as f:
+                data = json.load(f)
+        except FileNotFoundError:
+            return {}
+        except (OSError, ValueError) as e:
+            print(f"Warning: Could not read restore tokens: {e}")
+            return {}
+
+        entries = {}
+        oldest = time.time() - TOKEN_MAX_AGE
+        if isinstance(data, dict):
+            for key, entry in data.items():
+                if (isinstance(entry, dict) and _is_valid_token(entry.get('token'))
+                        and isinstance(entry.get('last_used'), (int, float))
+                        and entry['last_used'] >= oldest):
+                    entries[key] = entry
+        return entries
+
+    def _migrate_legacy(self):
+        """Import the single token older versions kept in portal_restore_token."""
+        legacy = self.path.with_name('portal_restore_token')
+        try:
+            token = legacy.read_text().strip()
+        except OSError:
+            return
+        if _is_valid_token(token):
+            # Older versions only ever asked for a pointer
+            self.store(token, DEVICE_POINTER)
+        try:
+            legacy.unlink()
+        except OSError:
+            pass
+
+    @property
+    def entries(self):
+        """Cached entries, read from disk on first use."""
+        if self._entries is None:
+            self._entries = self._read()
+            if not self._entries:
+                self._migrate_legacy()
+        return self._entries
+
+    def get(self, device_types):
+        """Get the token for device_types on this desktop, or None."""
+        entry = self.entries.get(self._key(self.identity, device_types))
+        return entry['token'] if entry else None
+
+    def store(self, token, device_types, portal_version=0):
+        """Record a token the portal issued, marking it as just used."""
+        if not _is_valid_token(token):
+            return
+        self._update(self._key(self.identity, device_types), {
+            'token': token,
+            'last_used': time.time(),
+            'portal_version': portal_version,
+        })
+
+    def invalidate(self, device_types):
+        """Forget the token for device_types after the portal rejected it."""
+        key = self._key(self.identity, device_types)
+        if key in self.entries:
+            self._update(key, None)
+
+    def _update(self, key, entry):
+        """Change one entry, merging with what other processes wrote meanwhile."""
+        entries = self._read()
+        if entry is None:
+            entries.pop(key, None)
+        else:
+            entries[key] = entry
+        self._entries = entries
+
+        temp_path = self.path.with_name(f".{self.path.name}.{os.getpid()}.tmp")
+        try:
+            self.path.parent.mkdir(parents=True, exist_ok=True)
+            fd = os.open(temp_path, os.O_WRONLY | os.O_CREAT | os.O_TRUNC, 0o600)
+            with os.fdopen(fd, 'w') as f:
+                json.dump(entries, f, indent=2)
+            os.replace(temp_path, self.path)
+        except OSError as e:
+            print(f"Warning: Could not save restore token: {e}")
+            try:
+                temp_path.unlink()
+            except OSError:
+                pass
@@ -1,11 +1,17 @@
 """Wayland portal-based clicking functionality."""
 
-import threading
 import time
 import random
 import string
-import os
-from pathlib import Path
+
+from gclicker.backends import (BTN_LEFT, CAP_BUTTON, CAP_KEYBOARD, CAP_MOTION, CAP_PIPELINED,
+                               UnsupportedEvent,
+                                ClickBackend)
+from gclicker.eis import EisClient, EisError
+from gclicker.engine import ClickEngine
+from gclicker.recovery import ErrorLog, backoff_delay
+from gclicker.scheduler import DeadlineScheduler
+from gclicker.token_cache import DEVICE_KEYBOARD, DEVICE_POINTER, RestoreTokenCache
 
 try:
     from gi.repository import GLib, Gio
@@ -14,379 +20,871 @@ except ImportError:
     PORTAL_AVAILABLE = False
 
 
-class WaylandPortalClicker:
-    """Auto-clicker using Wayland RemoteDesktop portal."""
+# First RemoteDesktop portal version with ConnectToEIS
+EIS_MIN_PORTAL_VERSION = 2
+
+# Request Response codes
+RESPONSE_SUCCESS = 0
+RESPONSE_CANCELLED = 1
+
+
+class PortalBackend(ClickBackend):
+    """Click backend using the Wayland RemoteDesktop portal."""
 
-    def __init__(self, interval=0.1):
+    name = 'portal'
+
+    # Dispatch modes for NotifyPointerButton
+    DISPATCH_SYNC = 'sync'    # Block on the reply to every press and release
+    DISPATCH_ASYNC = 'async'  # Pipeline calls and handle replies in callbacks
+    DISPATCH_MODES = (DISPATCH_SYNC, DISPATCH_ASYNC)
+
+    # Timeout for pipelined calls, so a stuck portal frees its window slot
+    ASYNC_CALL_TIMEOUT_MS = 5000
+
+    def __init__(self, dispatch=DISPATCH_SYNC, max_in_flight=4, use_eis=False, keep_alive=True,
+                 device_types=DEVICE_POINTER):
         """
-        Initialize the Wayland portal-based auto-clicker.
+        Initialize the Wayland portal backend.
 
         Args:
-            interval: Time between clicks in seconds (default 0.1s = 100ms)
+            dispatch: 'sync' to wait for each portal reply, 'async' to pipeline them
+            max_in_flight: Most press/release pairs awaiting replies in async mode
+            use_eis: Send clicks over a ConnectToEIS socket instead of portal calls
+            keep_alive: Restore the session in the background when the portal
+                closes it (needs a restore token and a running default main loop)
+            device_types: SelectDevices device types bitmask (see gclicker.token_cache)
         """
         if not PORTAL_AVAILABLE:
             raise RuntimeError("GLib and Gio are required for Wayland portal support")
-
-        self.interval = interval
-        self.running = False
-        self._thread = None
-        self._stop_event = threading.Event()
+        if dispatch not in self.DISPATCH_MODES:
+            raise ValueError(f"Unknown dispatch mode: {dispatch}")
+
+        # Async dispatch state (only touched from the click thread)
+        self.dispatch = dispatch
+        self.max_in_flight = max(1, max_in_flight)
+        self.errors = 0
+        self._in_flight = 0
+        self._interrupted = False
+        self._press_skipped = False
+        self._private_context = GLib.MainContext.new() if dispatch == self.DISPATCH_ASYNC else None
+        self._dispatch_context = self._private_context
+
+        # Prebuilt NotifyPointerButton parameters, keyed by (session handle, button),
+        # and NotifyKeyboardKeycode ones, keyed by (session handle, 'key', keycode)
+        self._click_params = {}
+
+        # libei connection, set up after the session starts if use_eis is set
+        self.use_eis = use_eis
+        self._eis = None
+        self._eis_connected = False
+        self._eis_broken = False  # The session connected to EIS but the handshake failed
 
         # Portal state
         self._portal = None
         self._session_handle = None
         self._ready = False
         self._setup_error = None
-        self._main_loop = None
-        self._restore_token = None
-
-        # Load saved restore token
-        self._load_restore_token()
-
-    def set_interval(self, interval):
-        """Set the click interval in seconds."""
-        self.interval = max(0.001, interval)
+        self._setup_callbacks = None  # Pending setup_async() callbacks while setting up
+        self._setup_timeout = None
+        self._setup_subscriptions = []
+        self._request_tokens = {}
+        self._pending_session_path = None
+        self._sent_restore_token = False  # This setup attempt asked to restore a session
+        self._token_retried = False
+        self._interactive_setup = False
+
+        # Restore tokens are kept per desktop and device types
+        self.device_types = device_types
+        self._tokens = RestoreTokenCache()
+        self._restore_token = self._tokens.get(device_types)
+
+        # Closed / NameOwnerChanged subscriptions for the running session
+        self.keep_alive = keep_alive
+        self._session_subscriptions = []
+        self._restore_source = None   # Pending background restore
+        self._restore_attempts = 0    # Failed background restores in a row
+        self._error_log = ErrorLog('Error clicking')
+
+    @property
+    def capabilities(self):
+        """
+        Pipelined unless every call waits for its reply; keys if SelectDevices
+        asked for them. Motion and keys go through Notify* methods, which the
+        portal refuses on a session connected to EIS.
+        """
+        capabilities = {CAP_BUTTON}
+        if self.dispatch == self.DISPATCH_ASYNC or self._eis:
+            capabilities.add(CAP_PIPELINED)
+        if not (self._eis or self._eis_broken):
+            capabilities.add(CAP_MOTION)
+            if self.device_types & DEVICE_KEYBOARD:
+                capabilities.add(CAP_KEYBOARD)
+        return frozenset(capabilities)
 
     def _generate_token(self):
         """Generate a random token for portal requests."""
         return ''.join(random.choices(string.ascii_letters + string.digits, k=16))
 
-    def _get_token_file(self):
-        """Get the path to the restore token file."""
-        cache_dir = Path(os.environ.get('XDG_CACHE_HOME', Path.home() / '.cache'))
-        gclicker_cache = cache_dir / 'gclicker'
-        gclicker_cache.mkdir(parents=True, exist_ok=True)
-        return gclicker_cache / 'portal_restore_token'
-
-    def _load_restore_token(self):
-        """Load the saved restore token."""
-        token_file = self._get_token_file()
-        if token_file.exists():
-            try:
-                self._restore_token = token_file.read_text().strip()
-            except:
-                pass
-
     def _save_restore_token(self, token):
-        """Save the restore token for next time."""
-        if token:
+        """Keep the portal's new restore token, recording that it was just used."""
+        self._restore_token = token
+        self._tokens.store(token, self.device_types, portal_version=self._get_portal_version())
+
+    def setup_async(self, callback):
+        """
+        Create or restore the portal session without blocking.
+
+        Every step is an asynchronous call on the calling thread's
+        thread-default main context, which must be running (or iterated)
+        for setup to progress.
+
+        Args:
+            callback: Called as callback(success, error) when setup finishes
+        """
+        self._start_setup(callback, interactive=True)
+
+    def _start_setup(self, callback, interactive):
+        """
+        Start setup_async(), or join the setup in progress.
+
+        Only interactive setups (the user asked to click) may fall back to
+        a new session, and so a permission dialog, when restoring fails.
+        """
+        if self._ready:
+            callback(True, None)
+            return
+
+        if self._setup_callbacks is not None:
+            # Setup already in progress, just wait for it
+            self._setup_callbacks.append(callback)
+            self._interactive_setup = self._interactive_setup or interactive
+            return
+
+        self._interactive_setup = interactive
+
+        if self._restore_token:
+            print("Restoring portal session...")
+        else:
+            print("Setting up Wayland portal session...")
+            print("A permission dialog will appear - please grant access")
+
+        self._setup_callbacks = [callback]
+        self._setup_error = None
+        self._token_retried = False
+
+        # Set a timeout to prevent hanging forever
+        self._setup_timeout = GLib.timeout_source_new_seconds(30)
+        self._setup_timeout.set_callback(self._on_setup_timeout)
+        self._setup_timeout.attach(GLib.MainContext.ref_thread_default())
+
+        # Connect to the RemoteDesktop portal
+        Gio.DBusProxy.new_for_bus(
+            Gio.BusType.SESSION,
+            Gio.DBusProxyFlags.NONE,
+            None,
+            'org.freedesktop.portal.Desktop',
+            '/org/freedesktop/portal/desktop',
+            'org.freedesktop.portal.RemoteDesktop',
+            None,
+            self._on_proxy_ready,
+            None
+        )
+
+    def prewarm(self):
+        """Restore the portal session in the background if we have a restore token."""
+        if self._ready or self._setup_callbacks is not None:
+            return
+        # Without a token setup would pop up a permission dialog unprompted
+        if self._restore_token:
+            self._start_setup(lambda success, error: None, interactive=False)
+
+    def setup(self):
+        """Create or restore the portal session, blocking until it is ready."""
+        if self._ready:
+            return True
+
+        done = []
+        if self._setup_callbacks is not None:
+            # Another thread's main context is driving setup
+            self._setup_callbacks.append(lambda success, error: done.append(success))
+            while not done:
+                time.sleep(0.01)
+            return done[0]
+
+        # Drive setup on a private context so this never competes with a
+        # main loop running elsewhere (e.g. the GUI's)
+        context = GLib.MainContext.new()
+        context.push_thread_default()
+        try:
+            self.setup_async(lambda success, error: done.append(success))
+            while not done:
+                context.iteration(True)
+        finally:
+            context.pop_thread_default()
+
+        return done[0]
+
+    def _finish_setup(self, error=None):
+        """End setup, reporting the result to everyone waiting for it."""
+        if self._setup_callbacks is None:
+            return
+
+        if error:
+            self._setup_error = error
+            self.last_error = error
+            self._ready = False
+            print(f"Portal setup failed: {error}")
+
+        if self._setup_timeout:
+            self._setup_timeout.destroy()
+            self._setup_timeout = None
+
+        if self._portal:
+            connection = self._portal.get_connection()
+            for subscription_id in self._setup_subscriptions:
+                connection.signal_unsubscribe(subscription_id)
+        self._setup_subscriptions = []
+
+        callbacks = self._setup_callbacks
+        self._setup_callbacks = None
+        for callback in callbacks:
+            callback(self._ready, self._setup_error)
+
+    def _on_setup_timeout(self, *args):
+        """Give up on a portal that never answers."""
+        self._setup_timeout = None
+        self._finish_setup("Timeout waiting for portal setup")
+        return False
+
+    def _call_setup_method(self, method, parameters, error_prefix):
+        """Call a portal method asynchronously; failures go to _setup_failed()."""
+        def on_reply(proxy, result, user_data):
             try:
-                token_file = self._get_token_file()
-                token_file.write_text(token)
+                proxy.call_finish(result)
             except Exception as e:
-                print(f"Warning: Could not save restore token: {e}")
+                self._setup_failed(f"{error_prefix}: {e}")
 
-    def _setup_portal_session(self):
-        """Set up the RemoteDesktop portal session."""
-        try:
-            # Connect to the RemoteDesktop portal
-            self._portal = Gio.DBusProxy.new_for_bus_sync(
-                Gio.BusType.SESSION,
-                Gio.DBusProxyFlags.NONE,
-                None,
-                'org.freedesktop.portal.Desktop',
-                '/org/freedesktop/portal/desktop',
-                'org.freedesktop.portal.RemoteDesktop',
-                None
-            )
+        self._portal.call(method, parameters, Gio.DBusCallFlags.NONE, -1, None, on_reply, None)
 
-            # Create a session
-            session_token = self._generate_token()
-            sender_name = self._portal.get_connection().get_unique_name()[1:].replace('.', '_')
-            session_path = f"/org/freedesktop/portal/desktop/session/{sender_name}/{session_token}"
+    def _setup_failed(self, error):
+        """
+        Handle a failed setup step.
 
-            handle_token = self._generate_token()
-            request_path = f"/org/freedesktop/portal/desktop/request/{sender_name}/{handle_token}"
-
-            options = {
-                'session_handle_token': GLib.Variant('s', session_token),
-                'handle_token': GLib.Variant('s', handle_token)
-            }
-
-            # Subscribe to CreateSession response on the specific request path
-            def on_create_session_response(connection, sender_name, object_path, interface_name,
-                                          signal_name, parameters, user_data):
-                response_code = parameters[0]
-                results = parameters[1]
-
-                if response_code == 0:  # Success
-                    self._session_handle = results.get('session_handle', session_path)
-                    # Now select devices (pointer)
-                    GLib.idle_add(self._select_devices)
-                else:
-                    self._setup_error = f"Session creation failed with code {response_code}"
-                    if self._main_loop:
-                        self._main_loop.quit()
-
-            self._portal.get_connection().signal_subscribe(
+        If the session was to be restored, the restore token is the likely
+        culprit (e.g. the portal forgot it, or another session used it up),
+        so drop it and start over once without it, in the same setup pass.
+        """
+        if self._setup_callbacks is None:
+            return
+        if not self._sent_restore_token or self._token_retried or not self._interactive_setup:
+            self._finish_setup(error)
+            return
+
+        print(f"Restoring the portal session failed ({error}), requesting a new one")
+        print("A permission dialog will appear - please grant access")
+        self._token_retried = True
+        self._tokens.invalidate(self.device_types)
+        self._restore_token = None
+
+        # Drop the half-set-up session and its Response subscriptions
+        connection = self._portal.get_connection()
+        for subscription_id in self._setup_subscriptions:
+            connection.signal_unsubscribe(subscription_id)
+        self._setup_subscriptions = []
+        if self._session_handle:
+            connection.call(
                 'org.freedesktop.portal.Desktop',
-                'org.freedesktop.portal.Request',
-                'Response',
-                request_path,  # Subscribe to this specific request path
+                self._session_handle,
+                'org.freedesktop.portal.Session',
+                'Close',
+                None,
                 None,
-                Gio.DBusSignalFlags.NONE,
-                on_create_session_response,
-                None
-            )
-
-            # Call CreateSession
-            self._portal.call_sync(
-                'CreateSession',
-                GLib.Variant('(a{sv})', (options,)),
                 Gio.DBusCallFlags.NONE,
                 -1,
+                None,
+                None,
                 None
             )
+            self._set_session_handle(None)
 
-        except Exception as e:
-            self._setup_error = f"Portal setup error: {e}"
-            if self._main_loop:
-                self._main_loop.quit()
+        self._create_session()
 
-    def _select_devices(self):
-        """Select input devices (pointer)."""
+    def _on_proxy_ready(self, source, result, user_data):
+        """Portal proxy ready: create the session."""
         try:
+            self._portal = Gio.DBusProxy.new_for_bus_finish(result)
+        except Exception as e:
+            self._finish_setup(f"Portal setup error: {e}")
+            return
+        self._create_session()
+
+    def _create_session(self):
+        """Subscribe to every request's Response, then create the session."""
+        self._sent_restore_token = False
+        connection = self._portal.get_connection()
+        sender_name = connection.get_unique_name()[1:].replace('.', '_')
+
+        session_token = self._generate_token()
+        self._pending_session_path = f"/org/freedesktop/portal/desktop/session/{sender_name}/{session_token}"
+
+        # Request paths are derived from tokens we choose, so all three
+        # Response subscriptions go out together, ahead of CreateSession.
+        # Each step then starts straight from the previous Response.
+        self._request_tokens = {}
+        steps = (
+            ('CreateSession', self._on_create_session_response),
+            ('SelectDevices', self._on_select_devices_response),
+            ('Start', self._on_start_response),
+        )
+        for method, handler in steps:
             handle_token = self._generate_token()
-            sender_name = self._portal.get_connection().get_unique_name()[1:].replace('.', '_')
-            request_path = f"/org/freedesktop/portal/desktop/request/{sender_name}/{handle_token}"
-
-            # Device types: KEYBOARD = 1, POINTER = 2, TOUCHSCREEN = 4
-            options = {
-                'types': GLib.Variant('u', 2),  # 2 = POINTER
-                'handle_token': GLib.Variant('s', handle_token),
-                'persist_mode': GLib.Variant('u', 2)  # 2 = persist until explicitly revoked
-            }
-
-            # Add restore token if we have one
-            if self._restore_token:
-                options['restore_token'] = GLib.Variant('s', self._restore_token)
-
-            # Subscribe to SelectDevices response
-            def on_select_devices_response(connection, sender_name, object_path, interface_name,
-                                          signal_name, parameters, user_data):
-                response_code = parameters[0]
-                results = parameters[1]
-
-                if response_code == 0:  # Success
-                    # Check for restore token here too
-                    if 'restore_token' in results:
-                        new_token = results['restore_token']
-                        self._save_restore_token(new_token)
-                        self._restore_token = new_token
-
-                    # Start the session (shows permission dialog)
-                    GLib.idle_add(self._start_session)
-                else:
-                    self._setup_error = f"Device selection failed with code {response_code}"
-                    if self._main_loop:
-                        self._main_loop.quit()
-
-            self._portal.get_connection().signal_subscribe(
+            self._request_tokens[method] = handle_token
+            self._setup_subscriptions.append(connection.signal_subscribe(
                 'org.freedesktop.portal.Desktop',
                 'org.freedesktop.portal.Request',
                 'Response',
-                request_path,  # Subscribe to this specific request path
+                f"/org/freedesktop/portal/desktop/request/{sender_name}/{handle_token}",
                 None,
                 Gio.DBusSignalFlags.NONE,
-                on_select_devices_response,
+                handler,
                 None
-            )
-
-            # Call SelectDevices
-            self._portal.call_sync(
-                'SelectDevices',
-                GLib.Variant('(oa{sv})', (self._session_handle, options)),
-                Gio.DBusCallFlags.NONE,
-                -1,
-                None
-            )
+            ))
+
+        options = {
+            'session_handle_token': GLib.Variant('s', session_token),
+            'handle_token': GLib.Variant('s', self._request_tokens['CreateSession'])
+        }
+        self._call_setup_method(
+            'CreateSession',
+            GLib.Variant('(a{sv})', (options,)),
+            "Portal setup error"
+        )
+
+    def _on_create_session_response(self, connection, sender_name, object_path, interface_name,
+                                    signal_name, parameters, user_data):
+        """Session created: select devices."""
+        response_code = parameters[0]
+        results = parameters[1]
+
+        if response_code != 0:
+            self._finish_setup(f"Session creation failed with code {response_code}")
+            return
 
-        except Exception as e:
-            self._setup_error = f"Device selection error: {e}"
-            if self._main_loop:
-                self._main_loop.quit()
+        self._set_session_handle(results.get('session_handle', self._pending_session_path))
+
+        options = {
+            'types': GLib.Variant('u', self.device_types),
+            'handle_token': GLib.Variant('s', self._request_tokens['SelectDevices']),
+            'persist_mode': GLib.Variant('u', 2)  # 2 = persist until explicitly revoked
+        }
+
+        # Add restore token if we have one
+        self._sent_restore_token = bool(self._restore_token)
+        if self._restore_token:
+            options['restore_token'] = GLib.Variant('s', self._restore_token)
+
+        self._call_setup_method(
+            'SelectDevices',
+            GLib.Variant('(oa{sv})', (self._session_handle, options)),
+            "Device selection error"
+        )
+
+    def _on_select_devices_response(self, connection, sender_name, object_path, interface_name,
+                                    signal_name, parameters, user_data):
+        """Devices selected: start the session (shows permission dialog)."""
+        response_code = parameters[0]
+        results = parameters[1]
+
+        if response_code == RESPONSE_CANCELLED:
+            self._finish_setup("Device selection cancelled")
+            return
+        if response_code != RESPONSE_SUCCESS:
+            self._setup_failed(f"Device selection failed with code {response_code}")
+            return
 
-        return False  # Don't repeat
+        # Check for restore token here too
+        if 'restore_token' in results:
+            self._save_restore_token(results['restore_token'])
+
+        options = {
+            'handle_token': GLib.Variant('s', self._request_tokens['Start'])
+        }
+        self._call_setup_method(
+            'Start',
+            GLib.Variant('(osa{sv})', (self._session_handle, '', options)),
+            "Session start error"
+        )
+
+    def _on_start_response(self, connection, sender_name, object_path, interface_name,
+                           signal_name, parameters, user_data):
+        """Session started (permission granted) or refused."""
+        response_code = parameters[0]
+        results = parameters[1]
+
+        if response_code == RESPONSE_CANCELLED:
+            self._finish_setup("Permission denied")
+            return
+        if response_code != RESPONSE_SUCCESS:
+            self._setup_failed(f"Session start failed with code {response_code}")
+            return
 
-    def _start_session(self):
-        """Start the portal session (shows permission dialog)."""
+        self._ready = True
+
+        # The portal issues a new token on every start; the old one is used up
+        if 'restore_token' in results:
+            self._save_restore_token(results['restore_token'])
+        elif self._restore_token:
+            self._save_restore_token(self._restore_token)
+
+        if self._restore_token:
+            print("Session restored - ready to click!")
+        else:
+            print("Permission granted - session ready!")
+
+        self._watch_session()
+
+        if self.use_eis:
+            self._connect_eis()
+        else:
+            self._finish_setup()
+
+    def _watch_session(self):
+        """Watch for the portal closing the session or leaving the bus."""
+        connection = self._portal.get_connection()
+        watches = (
+            ('org.freedesktop.portal.Desktop', 'org.freedesktop.portal.Session', 'Closed',
+             self._session_handle, None),
+            ('org.freedesktop.DBus', 'org.freedesktop.DBus', 'NameOwnerChanged',
+             '/org/freedesktop/DBus', 'org.freedesktop.portal.Desktop'),
+        )
+
+        # These outlive setup(), whose private context is no longer iterated
+        # once it returns, so deliver them on the global default context
+        # unless another thread's main loop owns it
+        context = GLib.MainContext.default()
+        acquired = context.acquire()
+        if acquired:
+            context.push_thread_default()
         try:
-            handle_token = self._generate_token()
-            sender_name = self._portal.get_connection().get_unique_name()[1:].replace('.', '_')
-            request_path = f"/org/freedesktop/portal/desktop/request/{sender_name}/{handle_token}"
-
-            options = {
-                'handle_token': GLib.Variant('s', handle_token)
-            }
-
-            # Subscribe to Start response
-            def on_start_response(connection, sender_name, object_path, interface_name,
-                                 signal_name, parameters, user_data):
-                response_code = parameters[0]
-                results = parameters[1]
-
-                if response_code == 0:  # Success - permission granted
-                    self._ready = True
-
-                    # Save restore token if provided
-                    if 'restore_token' in results:
-                        new_token = results['restore_token']
-                        self._save_restore_token(new_token)
-                        self._restore_token = new_token
-
-                    if self._restore_token:
-                        print("Session restored - ready to click!")
-                    else:
-                        print("Permission granted - session ready!")
-                else:
-                    self._setup_error = f"Session start failed with code {response_code} (permission denied?)"
-
-                # Either way, we're done with setup
-                if self._main_loop:
-                    self._main_loop.quit()
-
-            self._portal.get_connection().signal_subscribe(
+            for sender, interface, signal, path, arg0 in watches:
+                self._session_subscriptions.append(connection.signal_subscribe(
+                    sender,
+                    interface,
+                    signal,
+                    path,
+                    arg0,
+                    Gio.DBusSignalFlags.NONE,
+                    self._on_session_lost,
+                    None
+                ))
+        finally:
+            if acquired:
+                context.pop_thread_default()
+                context.release()
+
+    def _unwatch_session(self):
+        """Drop the subscriptions made by _watch_session()."""
+        if self._portal:
+            connection = self._portal.get_connection()
+            for subscription_id in self._session_subscriptions:
+                connection.signal_unsubscribe(subscription_id)
+        self._session_subscriptions = []
+
+    def _on_session_lost(self, connection, sender_name, object_path, interface_name,
+                         signal_name, parameters, user_data):
+        """The portal closed our session: forget it and restore a new one."""
+        if signal_name == 'NameOwnerChanged':
+            if parameters[2]:
+                return  # Name gained an owner, not lost one
+            print("Portal service went away - session lost")
+        else:
+            print("Portal closed the session")
+
+        self._drop_session()
+        # The click thread idles until the session is back
+        self._schedule_restore()
+
+    def _drop_session(self, close=False):
+        """Forget the current session, optionally asking the portal to close it."""
+        self._unwatch_session()
+        if self._eis:
+            self._eis.close()
+            self._eis = None
+            self._eis_connected = False
+        self._eis_broken = False
+        self._ready = False
+        if close and self._session_handle and self._portal:
+            self._portal.get_connection().call(
                 'org.freedesktop.portal.Desktop',
-                'org.freedesktop.portal.Request',
-                'Response',
-                request_path,  # Subscribe to this specific request path
+                self._session_handle,
+                'org.freedesktop.portal.Session',
+                'Close',
+                None,
                 None,
-                Gio.DBusSignalFlags.NONE,
-                on_start_response,
-                None
-            )
-
-            # Call Start - this shows the permission dialog
-            self._portal.call_sync(
-                'Start',
-                GLib.Variant('(osa{sv})', (self._session_handle, '', options)),
                 Gio.DBusCallFlags.NONE,
                 -1,
+                None,
+                None,
                 None
             )
+        self._set_session_handle(None)
 
-        except Exception as e:
-            self._setup_error = f"Session start error: {e}"
-            if self._main_loop:
-                self._main_loop.quit()
+    def _schedule_restore(self):
+        """Restore the session in the background, backing off while restores fail."""
+        if not self.keep_alive or not self._restore_token:
+            return
+        if self._setup_callbacks is not None or self._restore_source is not None:
+            return  # Already restoring
 
-        return False  # Don't repeat
+        delay = backoff_delay(self._restore_attempts - 1, base=1.0) if self._restore_attempts else 0
+        self._restore_source = GLib.timeout_add(int(delay * 1000), self._on_restore_timer)
 
-    def _click(self):
-        """Perform a single mouse click using the portal."""
-        if not self._ready or not self._portal:
+    def _on_restore_timer(self):
+        self._restore_source = None
+        self._start_setup(self._on_restore_done, interactive=False)
+        return GLib.SOURCE_REMOVE
+
+    def _on_restore_done(self, success, error):
+        if success:
+            self._restore_attempts = 0
+            return
+        self._restore_attempts += 1
+        if self._restore_token:
+            delay = backoff_delay(self._restore_attempts - 1, base=1.0)
+            print(f"Retrying in {delay:.0f}s")
+        self._schedule_restore()
+
+    def recover(self):
+        """Replace the session in the background: clicks failing usually means it is gone."""
+        if self.keep_alive:
+            # The session is only touched from the default main context
+            GLib.idle_add(self._on_recover)
+
+    def _on_recover(self):
+        if self._ready and self._setup_callbacks is None:
+            print("Portal session is not accepting clicks - restoring it")
+            self._drop_session(close=True)
+            self._schedule_restore()
+        return GLib.SOURCE_REMOVE
+
+    def _on_eis_failed(self):
+        """Replace a session whose ei handshake failed, whether or not keep_alive is set."""
+        if self._ready and self._setup_callbacks is None:
+            self._drop_session(close=True)
+            self._start_setup(self._on_restore_done, interactive=True)
+        return GLib.SOURCE_REMOVE
+
+    def _get_portal_version(self):
+        """Get the RemoteDesktop portal interface version (0 if unknown)."""
+        version = self._portal.get_cached_property('version')
+        return version.unpack() if version is not None else 0
+
+    def _connect_eis(self):
+        """Request a libei socket with ConnectToEIS, then finish setup."""
+        version = self._get_portal_version()
+        if version < EIS_MIN_PORTAL_VERSION:
+            print(f"RemoteDesktop portal version {version} has no ConnectToEIS, "
+                  "using NotifyPointerButton")
+            self._finish_setup()
             return
 
+        def on_reply(proxy, result, user_data):
+            try:
+                ret, fd_list = proxy.call_with_unix_fd_list_finish(result)
+                # The ei handshake runs on the click thread before the first click
+                self._eis = EisClient(fd_list.get(ret[0]))
+            except Exception as e:
+                print(f"EIS connection failed, using NotifyPointerButton: {e}")
+            self._finish_setup()
+
+        self._portal.call_with_unix_fd_list(
+            'ConnectToEIS',
+            GLib.Variant('(oa{sv})', (self._session_handle, {})),
+            Gio.DBusCallFlags.NONE,
+            -1,
+            None,
+            None,
+            on_reply,
+            None
+        )
+
+    def _ensure_eis(self):
+        """
+        Complete the ei handshake.
+
+        The portal rejects Notify* calls on a session that has connected to
+        EIS, so if the handshake fails the session is replaced by one that
+        uses NotifyPointerButton instead.
+
+        Raises:
+            EisError: If the handshake fails
+        """
+        eis = self._eis
+        if self._eis_connected:
+            return eis
+
         try:
-            # Button code: 0x110 = BTN_LEFT (272 in decimal)
-            # State: 1 = pressed, 0 = released
-            # The signature is (oa{sv}iu): object path, options dict, button, state
+            eis.connect()
+            self._eis_connected = True
+            print("Connected to EIS - sending clicks over libei")
+            return eis
+        except EisError as e:
+            print(f"EIS connection failed, starting a new session without it: {e}")
+            eis.close()
+            self._eis = None
+            self._eis_broken = True
+            self.use_eis = False
+            # The session is only touched from the default main context
+            GLib.idle_add(self._on_eis_failed)
+            raise
+
+    def _set_session_handle(self, session_handle):
+        """Switch to a new portal session, dropping parameters built for the old one."""
+        self._session_handle = session_handle
+        self._click_params.clear()
+
+    def _get_click_params(self, button=BTN_LEFT):
+        """
+        Get the prebuilt press and release parameters for a button.
 
-            options = {}  # Empty options dict
+        GLib.Variant is immutable, so the same parameter tuples are reused for
+        every click in a session instead of being rebuilt each time.
 
-            # Press button
-            self._portal.call_sync(
-                'NotifyPointerButton',
-                GLib.Variant('(oa{sv}iu)', (self._session_handle, options, 0x110, 1)),
-                Gio.DBusCallFlags.NONE,
-                -1,
-                None
+        Returns:
+            Tuple of (press, release) GLib.Variant parameters
+        """
+        key = (self._session_handle, button)
+        params = self._click_params.get(key)
+        if params is None:
+            # The signature is (oa{sv}iu): object path, options dict, button, state
+            # State: 1 = pressed, 0 = released
+            params = (
+                GLib.Variant('(oa{sv}iu)', (self._session_handle, {}, button, 1)),
+                GLib.Variant('(oa{sv}iu)', (self._session_handle, {}, button, 0)),
             )
+            self._click_params[key] = params
+        return params
+
+    def is_ready(self):
+        """Check if the portal session has been started."""
+        return self._ready and self._portal is not None
+
+    def press(self, button=BTN_LEFT):
+        """Press a button."""
+        self._notify_button(button, 0)
+
+    def release(self, button=BTN_LEFT):
+        """Release a button."""
+        self._notify_button(button, 1)
+
+    def move(self, dx, dy):
+        """Move the pointer (NotifyPointerMotion)."""
+        self._notify('NotifyPointerMotion',
+                     GLib.Variant('(oa{sv}dd)', (self._session_handle, {}, dx, dy)))
+
+    def scroll(self, dx, dy):
+        """Scroll (NotifyPointerAxis), as one finished scroll motion."""
+        options = {'finish': GLib.Variant('b', True)}
+        self._notify('NotifyPointerAxis',
+                     GLib.Variant('(oa{sv}dd)', (self._session_handle, options, dx, dy)))
+
+    def key(self, keycode, pressed):
+        """Press or release a key (NotifyKeyboardKeycode); needs DEVICE_KEYBOARD."""
+        key = (self._session_handle, 'key', keycode)
+        params = self._click_params.get(key)
+        if params is None:
+            # State: 1 = pressed, 0 = released, as for buttons
+            params = (
+                GLib.Variant('(oa{sv}iu)', (self._session_handle, {}, keycode, 1)),
+                GLib.Variant('(oa{sv}iu)', (self._session_handle, {}, keycode, 0)),
+            )
+            self._click_params[key] = params
+        self._notify('NotifyKeyboardKeycode', params[0 if pressed else 1])
 
-            # Small delay
-            time.sleep(0.001)
+    def _notify(self, method, params):
+        """
+        Call a Notify* method other than NotifyPointerButton, pipelined in async mode.
 
-            # Release button
-            self._portal.call_sync(
-                'NotifyPointerButton',
-                GLib.Variant('(oa{sv}iu)', (self._session_handle, options, 0x110, 0)),
+        Raises:
+            UnsupportedEvent: If the session sends clicks over EIS, where the
+                portal rejects Notify* calls
+        """
+        if self._eis or self._eis_broken:
+            raise UnsupportedEvent(f"{method} is not available on a session connected to EIS")
+        if self.dispatch != self.DISPATCH_ASYNC:
+            self._portal.call_sync(method, params, Gio.DBusCallFlags.NONE, -1, None)
+            return
+
+        context = self._dispatch_context
+        while context.pending():
+            context.iteration(False)
+        # Shares the window with clicks, each call holding one slot
+        while self._in_flight >= self.max_in_flight:
+            if self._interrupted:
+                return
+            context.iteration(True)
+        self._in_flight += 1
+
+        context.push_thread_default()
+        try:
+            self._portal.call(
+                method,
+                params,
                 Gio.DBusCallFlags.NONE,
-                -1,
+                self.ASYNC_CALL_TIMEOUT_MS,
+                None,
+                self._on_release_reply,
                 None
             )
+        except Exception:
+            self._in_flight -= 1
+            raise
+        finally:
+            context.pop_thread_default()
 
-        except Exception as e:
-            print(f"Error clicking: {e}", flush=True)
+    def _notify_button(self, button, index):
+        """
+        Send the press (index 0) or release (index 1) of a button.
 
-    def _click_loop(self):
-        """Main clicking loop."""
-        while not self._stop_event.is_set():
-            self._click()
-            time.sleep(self.interval)
+        Raises:
+            EisError: If the EIS device is paused or the connection failed
+        """
+        if self._eis_broken:
+            raise EisError("EIS handshake failed, waiting for a new portal session")
+        eis = self._eis and self._ensure_eis()
+        if eis:
+            # Answer pings and pick up pause/resume before sending
+            eis.process_events()
+            if not eis.is_ready():
+                raise EisError("EIS device is paused")
+            eis.queue_button(button, index == 0)
+            eis.flush()
+            return
 
-    def start(self):
-        """Start auto-clicking."""
-        if self.running:
-            return True
+        params = self._get_click_params(button)[index]
 
-        # Set up portal session if not ready
-        if not self._ready:
-            if self._restore_token:
-                print("Restoring portal session...")
-            else:
-                print("Setting up Wayland portal session...")
-                print("A permission dialog will appear - please grant access")
-
-            # Create and run the main loop in this thread
-            self._main_loop = GLib.MainLoop()
-
-            # Start the setup process
-            GLib.idle_add(self._setup_portal_session)
-
-            # Set a timeout to prevent hanging forever
-            def timeout_handler():
-                if not self._ready and not self._setup_error:
-                    self._setup_error = "Timeout waiting for portal setup"
-                if self._main_loop:
-                    self._main_loop.quit()
-                return False
-
-            GLib.timeout_add_seconds(30, timeout_handler)
-
-            # Run the main loop (this blocks until setup completes or timeout)
-            self._main_loop.run()
-            self._main_loop = None
-
-            if self._setup_error:
-                print(f"Portal setup failed: {self._setup_error}")
-                return False
-
-            if not self._ready:
-                print("Portal setup failed: Unknown error")
-                return False
-
-        # Start clicking
-        self.running = True
-        self._stop_event.clear()
-        self._thread = threading.Thread(target=self._click_loop, daemon=True)
-        self._thread.start()
-        return True
-
-    def stop(self):
-        """Stop auto-clicking."""
-        if not self.running:
+        if self.dispatch == self.DISPATCH_ASYNC:
+            self._notify_button_async(params, index)
             return
 
-        self.running = False
-        self._stop_event.set()
-        if self._thread:
-            self._thread.join(timeout=1.0)
-        self._thread = None
+        self._portal.call_sync(
+            'NotifyPointerButton',
+            params,
+            Gio.DBusCallFlags.NONE,
+            -1,
+            None
+        )
+
+    def _notify_button_async(self, params, index):
+        """Queue a NotifyPointerButton call without waiting for the reply."""
+        context = self._dispatch_context
+
+        # Handle replies that have already arrived
+        while context.pending():
+            context.iteration(False)
+
+        if index == 0:
+            # Back-pressure: wait for replies while the window is full
+            while self._in_flight >= self.max_in_flight:
+                if self._interrupted:
+                    self._press_skipped = True
+                    return
+                context.iteration(True)
+            self._in_flight += 1
+            callback = self._on_press_reply
+        elif self._press_skipped:
+            # The matching press was never sent
+            self._press_skipped = False
+            return
+        else:
+            callback = self._on_release_reply
 
-    def is_running(self):
-        """Check if auto-clicker is running."""
-        return self.running
+        # Completion callbacks run on the thread-default context of the
+        # calling thread, so make the private context the default while calling
+        context.push_thread_default()
+        try:
+            self._portal.call(
+                'NotifyPointerButton',
+                params,
+                Gio.DBusCallFlags.NONE,
+                self.ASYNC_CALL_TIMEOUT_MS,
+                None,
+                callback,
+                None
+            )
+        except Exception:
+            if index == 0:
+                self._in_flight -= 1
+            raise
+        finally:
+            context.pop_thread_default()
+
+    def _on_press_reply(self, proxy, result, user_data):
+        """Count errors reported for a pipelined press."""
+        try:
+            proxy.call_finish(result)
+        except Exception as e:
+            self.errors += 1
+            self.last_error = str(e)
+            self._error_log.report(self.last_error)
 
-    def cleanup(self):
+    def _on_release_reply(self, proxy, result, user_data):
+        """Free the window slot held by a pipelined click or other event."""
+        self._in_flight -= 1
+        try:
+            proxy.call_finish(result)
+        except Exception as e:
+            self.errors += 1
+            self.last_error = str(e)
+            self._error_log.report(self.last_error)
+
+    def set_dispatch_context(self, context):
+        """Handle pipelined replies on the engine's main context instead of a private one."""
+        if self.dispatch == self.DISPATCH_ASYNC:
+            self._dispatch_context = context or self._private_context
+
+    def flush(self):
+        """Give outstanding pipelined calls a moment to complete."""
+        context = self._dispatch_context
+        if context:
+            deadline = time.monotonic() + 0.5
+            while self._in_flight > 0 and time.monotonic() < deadline:
+                if not context.iteration(False):
+                    time.sleep(0.001)
+        self._interrupted = False
+
+    def interrupt(self):
+        """Wake the click thread if it is blocked waiting for replies."""
+        context = self._dispatch_context
+        if context:
+            self._interrupted = True
+            context.wakeup()
+
+    def close(self):
         """Clean up portal resources."""
-        self.stop()
+        if self._restore_source is not None:
+            GLib.source_remove(self._restore_source)
+            self._restore_source = None
+        self._error_log.flush()
+
+        if self._eis:
+            self._eis.close()
+            self._eis = None
+            self._eis_connected = False
+
+        # Our own Close must not look like the portal dropping the session
+        self._unwatch_session()
 
         if self._session_handle and self._portal:
             try:
                 # Close the session
-                self._portal.call_sync(
+                self._portal.get_connection().call_sync(
+                    'org.freedesktop.portal.Desktop',
+                    self._session_handle,
+                    'org.freedesktop.portal.Session',
                     'Close',
-                    GLib.Variant('(o)', (self._session_handle,)),
+                    None,
+                    None,
                     Gio.DBusCallFlags.NONE,
                     -1,
                     None
@@ -395,5 +893,24 @@ class WaylandPortalClicker:
                 pass
 
         self._portal = None
-        self._session_handle = None
+        self._set_session_handle(None)
         self._ready = False
+
+
+class WaylandPortalClicker(ClickEngine):
+    """Auto-clicker using Wayland RemoteDesktop portal."""
+
+    def __init__(self, interval=0.1, missed_policy=DeadlineScheduler.SKIP,
+                 dispatch=PortalBackend.DISPATCH_SYNC, max_in_flight=4, use_eis=False):
+        """
+        Initialize the Wayland portal-based auto-clicker.
+
+        Args:
+            interval: Time between clicks in seconds (default 0.1s = 100ms)
+            missed_policy: How to handle missed click deadlines ('skip' or 'catch-up')
+            dispatch: 'sync' to wait for each portal reply, 'async' to pipeline them
+            max_in_flight: Most press/release pairs awaiting replies in async mode
+            use_eis: Send clicks over a ConnectToEIS socket instead of portal calls
+        """
+        backend = PortalBackend(dispatch=dispatch, max_in_flight=max_in_flight, use_eis=use_eis)
+        super().__init__(interval, backend, missed_policy=missed_policy)
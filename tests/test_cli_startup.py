@@ -0,0 +1,134 @@
+"""Cold-start checks for gclicker-cli, the hotkey path.
+
+Commands that only talk to a running GUI or daemon must not load the
+clicker, the portal backend or GTK. GCLICKER_MAX_IMPORT_MS overrides the
+import time budget on slow machines.
+"""
+
+import json
+import os
+import shutil
+import subprocess
+import sys
+import tempfile
+import time
+
+import pytest
+
+from bench_click_path import ROOT, start_private_bus, wait_for_name
+
+
+# Median time `import gclicker.cli` may add to a bare interpreter start
+MAX_IMPORT_MS = float(os.environ.get('GCLICKER_MAX_IMPORT_MS', 100))
+
+# Modules the control commands must never load
+HEAVY_MODULES = (
+    'gclicker.engine',
+    'gclicker.clicker',
+    'gclicker.wayland_clicker',
+    'gclicker.jobs',
+    'gclicker.macro',
+    'gclicker.gui',
+    'gclicker.dbus_service',
+    'gi.repository.Gtk',
+    'gi.repository.Adw',
+)
+
+# Runs gclicker-cli with the given arguments and prints the loaded modules
+# to stderr as JSON when it exits
+RUN_CLI = '''
+import atexit, json, sys
+atexit.register(lambda: print(json.dumps(sorted(sys.modules)), file=sys.stderr))
+sys.argv = ['gclicker-cli'] + sys.argv[1:]
+from gclicker.cli import main_cli
+main_cli()
+'''
+
+
+def fresh_env(tmpdir, **extra):
+    env = os.environ.copy()
+    env['XDG_RUNTIME_DIR'] = tmpdir
+    env['XDG_CONFIG_HOME'] = os.path.join(tmpdir, 'config')
+    env['XDG_CACHE_HOME'] = os.path.join(tmpdir, 'cache')
+    env['PYTHONPATH'] = ROOT
+    env.update(extra)
+    return env
+
+
+def loaded_modules(args, env):
+    """Run gclicker-cli in a fresh interpreter and return the modules it loaded."""
+    result = subprocess.run([sys.executable, '-c', RUN_CLI] + args, env=env, cwd=ROOT,
+                            stdout=subprocess.DEVNULL, stderr=subprocess.PIPE, text=True,
+                            timeout=30)
+    return set(json.loads(result.stderr.strip().splitlines()[-1]))
+
+
+def median_ms(args, env, runs=15):
+    times = []
+    for _ in range(runs):
+        started = time.perf_counter()
+        subprocess.run(args, env=env, cwd=ROOT, stdout=subprocess.DEVNULL, check=True)
+        times.append((time.perf_counter() - started) * 1000)
+    return sorted(times)[runs // 2]
+
+
+@pytest.fixture
+def tmpdir():
+    path = tempfile.mkdtemp(prefix='gclicker-test-')
+    yield path
+    shutil.rmtree(path, ignore_errors=True)
+
+
+def test_import_loads_no_heavy_modules(tmpdir):
+    code = 'import json, sys; import gclicker.cli; print(json.dumps(sorted(sys.modules)))'
+    result = subprocess.run([sys.executable, '-c', code], env=fresh_env(tmpdir), cwd=ROOT,
+                            check=True, stdout=subprocess.PIPE, text=True)
+    modules = set(json.loads(result.stdout))
+    assert not modules & set(HEAVY_MODULES)
+    assert 'gi' not in modules
+
+
+def test_import_time_budget(tmpdir):
+    env = fresh_env(tmpdir)
+    bare = median_ms([sys.executable, '-c', 'pass'], env)
+    cli = median_ms([sys.executable, '-c', 'import gclicker.cli'], env)
+    assert cli - bare <= MAX_IMPORT_MS, f"import gclicker.cli adds {cli - bare:.1f} ms"
+
+
+@pytest.fixture
+def daemon_env(tmpdir):
+    """A private session bus with a resident daemon on the null backend."""
+    pytest.importorskip('gi')
+    if shutil.which('dbus-daemon') is None:
+        pytest.skip("needs dbus-daemon")
+    bus, address = start_private_bus(tmpdir)
+    env = fresh_env(tmpdir, DBUS_SESSION_BUS_ADDRESS=address)
+    daemon = subprocess.Popen([sys.executable, '-m', 'gclicker.cli', '--daemon', '--backend',
+                               'null'], env=env, cwd=ROOT, stdout=subprocess.DEVNULL)
+    try:
+        from gi.repository import Gio
+        connection = Gio.DBusConnection.new_for_address_sync(
+            address,
+            Gio.DBusConnectionFlags.AUTHENTICATION_CLIENT |
+            Gio.DBusConnectionFlags.MESSAGE_BUS_CONNECTION,
+            None, None)
+        wait_for_name(connection, 'org.gclicker.Service')
+        yield env
+    finally:
+        for proc in (daemon, bus):
+            proc.terminate()
+            proc.wait()
+
+
+@pytest.mark.parametrize('command', [['--status'], ['--toggle'], ['--stats']])
+def test_control_commands_load_no_heavy_modules(daemon_env, command):
+    modules = loaded_modules(command, daemon_env)
+    assert 'gclicker.control' in modules
+    assert not modules & set(HEAVY_MODULES)
+
+
+def test_toggle_time_budget(daemon_env):
+    # An even number of runs leaves the daemon stopped
+    toggle = median_ms([sys.executable, '-m', 'gclicker.cli', '--toggle'], daemon_env, runs=16)
+    bare = median_ms([sys.executable, '-c', 'pass'], daemon_env)
+    assert toggle - bare <= MAX_IMPORT_MS + 100, f"--toggle took {toggle:.1f} ms"
@@ -0,0 +1,40 @@
+"""Tests for the shared-memory click ring."""
+
+import pytest
+
+from gclicker.click_ring import STATUS_ERROR, STATUS_OK, ClickRing, ClickRingReader, find_rings
+from gclicker.stats import ClickStats
+
+
+@pytest.fixture
+def ring(tmp_path, monkeypatch):
+    monkeypatch.setenv('XDG_RUNTIME_DIR', str(tmp_path))
+    ring = ClickRing(capacity=8)
+    yield ring
+    ring.close()
+
+
+def test_records_carry_job_ids(ring):
+    reader = ClickRingReader(find_rings()[0])
+    main, job = ClickStats(ring=ring), ClickStats(ring=ring, job=3)
+    main.record(1.0, 1.1, 1.2, 1.3)
+    job.record(2.0, 2.1, 2.2, 2.3)
+    job.record_error(3.0)
+
+    records, lost = reader.read()
+    assert lost == 0
+    assert [(r.number, r.job, r.status) for r in records] == [
+        (0, 0, STATUS_OK), (1, 3, STATUS_OK), (2, 3, STATUS_ERROR)]
+    assert records[1].press_ack == 2.2
+    reader.close()
+
+
+def test_reader_counts_overwritten_clicks(ring):
+    reader = ClickRingReader(find_rings()[0])
+    for number in range(20):
+        ring.write(float(number), 0.0, 0.0, 0.0)
+
+    records, lost = reader.read()
+    assert lost == 12
+    assert [r.number for r in records] == list(range(12, 20))
+    reader.close()
@@ -0,0 +1,118 @@
+"""Tests for the libei client against the stand-in EIS server."""
+
+import socket
+import struct
+import threading
+import time
+
+import pytest
+
+from fake_eis import EventLog, FakeEisServer
+from gclicker import eis
+from gclicker.backends import BTN_LEFT
+
+
+def wait_for(condition, timeout=2.0):
+    deadline = time.monotonic() + timeout
+    while not condition():
+        if time.monotonic() > deadline:
+            raise AssertionError("timed out")
+        time.sleep(0.001)
+
+
+@pytest.fixture
+def server():
+    server_sock, client_sock = socket.socketpair()
+    server = FakeEisServer(server_sock, EventLog())
+    thread = threading.Thread(target=server.serve, daemon=True)
+    thread.start()
+    server.client_fd = client_sock.detach()
+    yield server
+    thread.join(timeout=2.0)
+
+
+@pytest.fixture
+def client(server):
+    client = eis.connect_eis_fd(server.client_fd, timeout=2.0)
+    yield client
+    client.close()
+
+
+def requests_to(server, object_id):
+    return [(opcode, payload) for target, opcode, payload in server.requests
+            if target == object_id]
+
+
+def test_handshake(server, client):
+    assert client.is_ready()
+
+    handshake = requests_to(server, 0)
+    opcodes = [opcode for opcode, _ in handshake]
+    assert opcodes[0] == eis.HANDSHAKE_REQ_HANDSHAKE_VERSION
+    assert opcodes[-1] == eis.HANDSHAKE_REQ_FINISH
+    assert (eis.HANDSHAKE_REQ_CONTEXT_TYPE,
+            struct.pack('=I', eis.CONTEXT_TYPE_SENDER)) in handshake
+    assert (eis.HANDSHAKE_REQ_NAME, eis._pack_string('gclicker')) in handshake
+    announced = {eis._unpack_string(payload, 0)[0] for opcode, payload in handshake
+                 if opcode == eis.HANDSHAKE_REQ_INTERFACE_VERSION}
+    assert announced == set(eis.INTERFACE_VERSIONS)
+
+    bind = requests_to(server, FakeEisServer.SEAT_ID)
+    assert bind == [(eis.SEAT_REQ_BIND, struct.pack('=Q', FakeEisServer.BUTTON_MASK))]
+
+
+def test_button_framing(server, client):
+    client.queue_button(BTN_LEFT, True)
+    client.queue_button(BTN_LEFT, False)
+    client.flush()
+    wait_for(lambda: len(requests_to(server, FakeEisServer.DEVICE_ID)) >= 3)
+
+    events = [(button, state) for _, button, state in server._log.take()]
+    assert events == [(BTN_LEFT, eis.BUTTON_STATE_PRESSED), (BTN_LEFT, eis.BUTTON_STATE_RELEASED)]
+
+    # Emulation starts once, then every button event is followed by a frame
+    sequence = [(target, opcode) for target, opcode, _ in server.requests
+                if target in (FakeEisServer.DEVICE_ID, FakeEisServer.BUTTON_ID)]
+    assert sequence == [
+        (FakeEisServer.DEVICE_ID, eis.DEVICE_REQ_START_EMULATING),
+        (FakeEisServer.BUTTON_ID, eis.BUTTON_REQ_BUTTON),
+        (FakeEisServer.DEVICE_ID, eis.DEVICE_REQ_FRAME),
+        (FakeEisServer.BUTTON_ID, eis.BUTTON_REQ_BUTTON),
+        (FakeEisServer.DEVICE_ID, eis.DEVICE_REQ_FRAME),
+    ]
+
+
+def test_pause_and_resume(server, client):
+    client.queue_button(BTN_LEFT, True)
+    client.flush()
+
+    server.pause()
+    wait_for(lambda: (client.process_events(), not client.is_ready())[1])
+    with pytest.raises(eis.EisError):
+        client.queue_button(BTN_LEFT, False)
+
+    server.resume()
+    wait_for(lambda: (client.process_events(), client.is_ready())[1])
+    client.queue_button(BTN_LEFT, False)
+    client.flush()
+    wait_for(lambda: len(requests_to(server, FakeEisServer.BUTTON_ID)) == 2)
+
+    # Pausing ends emulation, so it is started again with the next sequence number
+    starts = [payload for opcode, payload in requests_to(server, FakeEisServer.DEVICE_ID)
+              if opcode == eis.DEVICE_REQ_START_EMULATING]
+    assert [struct.unpack('=II', payload)[1] for payload in starts] == [1, 2]
+
+
+def test_connection_closed(server, client):
+    server._sock.shutdown(socket.SHUT_RDWR)
+    with pytest.raises(eis.EisError):
+        wait_for(lambda: client.process_events() and False, timeout=0.5)
+
+
+def test_handshake_timeout():
+    server_sock, client_sock = socket.socketpair()
+    try:
+        with pytest.raises(eis.EisError):
+            eis.connect_eis_fd(client_sock.detach(), timeout=0.05)
+    finally:
+        server_sock.close()
@@ -0,0 +1,67 @@
+"""Tests for the JobEngine click thread, on the null backend."""
+
+import threading
+import time
+
+import pytest
+
+from gclicker.backends import BTN_LEFT, BTN_RIGHT
+from gclicker.engine import create_clicker
+
+
+def wait_for(condition, timeout=2.0):
+    deadline = time.monotonic() + timeout
+    while not condition():
+        if time.monotonic() > deadline:
+            raise AssertionError("timed out")
+        time.sleep(0.001)
+
+
+def click_threads():
+    return [thread for thread in threading.enumerate()
+            if getattr(thread, '_target', None) is not None
+            and thread._target.__name__ == '_click_loop']
+
+
+@pytest.fixture
+def engine():
+    engine = create_clicker(interval=0.01, backend='null', jobs=True)
+    engine.backend.setup()
+    yield engine
+    engine.cleanup()
+
+
+def test_thread_stops_when_jobs_finish(engine):
+    engine.add_job(BTN_RIGHT, 0.005, duration=0.05)
+    wait_for(lambda: engine._thread is None)
+    assert engine.backend.presses >= 5
+    assert not click_threads()
+
+    # And starts again for the next job
+    job_id = engine.add_job(BTN_RIGHT, 0.005, duration=0.02)
+    wait_for(lambda: engine.get_job(job_id)['clicks'] > 0)
+
+
+def test_no_second_thread_while_a_stop_is_stuck(engine):
+    unblock = threading.Event()
+    blocked = threading.Event()
+    press = engine.backend.press
+
+    def stuck_press(button=BTN_LEFT):
+        if button == BTN_LEFT:
+            blocked.set()
+            unblock.wait()  # Ignores interrupt(), like a hung portal call
+        press(button)
+
+    engine.backend.press = stuck_press
+    engine.start()
+    blocked.wait(1.0)
+    engine.stop()  # Times out joining the blocked thread
+    assert engine._thread is not None
+
+    job_id = engine.add_job(BTN_RIGHT, 0.005)
+    assert len(click_threads()) == 1
+
+    unblock.set()
+    wait_for(lambda: engine.get_job(job_id)['clicks'] > 0)
+    assert len(click_threads()) == 1
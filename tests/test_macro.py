@@ -0,0 +1,109 @@
+"""Tests for compiling and reading macros."""
+
+import time
+
+import pytest
+
+from gclicker.backends import BTN_LEFT, CAP_BUTTON, CAP_MOTION, UnsupportedEvent
+from gclicker.engine import create_clicker
+from gclicker.macro import (EVENT_BUTTON, EVENT_KEY, EVENT_MOTION, KEY_NAMES, MacroError,
+                            MacroReader, compile_macro)
+
+
+def compile_text(tmp_path, text):
+    source = tmp_path / 'macro.txt'
+    source.write_text(text)
+    path = tmp_path / 'macro.gcm'
+    compile_macro(source, path)
+    return path
+
+
+def test_round_trip(tmp_path):
+    path = compile_text(tmp_path, "0 press left\n+10ms move 5 -2\n+10ms release left\n"
+                                  "30ms tap a 5ms\n")
+    reader = MacroReader(path)
+    assert list(reader.events()) == [
+        (0, EVENT_BUTTON, BTN_LEFT, 1.0),
+        (10_000_000, EVENT_MOTION, 5.0, -2.0),
+        (20_000_000, EVENT_BUTTON, BTN_LEFT, 0.0),
+        (30_000_000, EVENT_KEY, KEY_NAMES['a'], 1.0),
+        (35_000_000, EVENT_KEY, KEY_NAMES['a'], 0.0),
+    ]
+    assert reader.duration == pytest.approx(0.035)
+    assert reader.needs_keyboard
+    reader.close()
+
+
+def test_click_release_comes_before_later_events(tmp_path):
+    path = compile_text(tmp_path, "0 click left 20ms\n10ms move 1 0\n30ms move 1 0\n")
+    reader = MacroReader(path)
+    assert [(offset, kind, b) for offset, kind, _, b in reader.events()] == [
+        (0, EVENT_BUTTON, 1.0),
+        (10_000_000, EVENT_MOTION, 0.0),
+        (20_000_000, EVENT_BUTTON, 0.0),
+        (30_000_000, EVENT_MOTION, 0.0),
+    ]
+    reader.close()
+
+
+@pytest.mark.parametrize('text, line', [
+    ("0 click left -5ms\n1 move 1 1\n", 1),
+    ("0 move 1 1\n0 tap a -1ms\n1 move 1 1\n", 2),
+    ("1 move 1 1\n0 move 1 1\n", 2),
+    ("0 jump 1\n", 1),
+])
+def test_errors_name_the_line(tmp_path, text, line):
+    with pytest.raises(MacroError, match=rf"macro\.txt:{line}:"):
+        compile_text(tmp_path, text)
+
+
+def test_rejects_other_files(tmp_path):
+    path = tmp_path / 'other.gcm'
+    path.write_bytes(b'\0' * 128)
+    with pytest.raises(MacroError):
+        MacroReader(path)
+
+
+def test_flags_record_event_kinds(tmp_path):
+    reader = MacroReader(compile_text(tmp_path, "0 move 1 1\n1 scroll 0 1\n"))
+    assert reader.required_capabilities == {CAP_MOTION}
+    reader.close()
+    reader = MacroReader(compile_text(tmp_path, "0 click left\n"))
+    assert reader.required_capabilities == {CAP_BUTTON}
+    reader.close()
+
+
+@pytest.fixture
+def engine():
+    engine = create_clicker(backend='null', jobs=True)
+    engine.backend.setup()
+    yield engine
+    engine.cleanup()
+
+
+def test_add_macro_rejects_unsupported_events(tmp_path, engine):
+    engine.backend.capabilities = frozenset({CAP_BUTTON})
+    path = compile_text(tmp_path, "0 click left\n10ms move 1 0\n")
+    with pytest.raises(ValueError, match='motion'):
+        engine.add_macro(path)
+    assert len(engine.get_jobs()) == 1
+
+
+def test_unsupported_event_stops_macro_without_recovery(tmp_path, engine):
+    def refuse(dx, dy):
+        raise UnsupportedEvent("no motion")
+
+    engine.backend.move = refuse
+    engine.backend.recover = lambda: pytest.fail("recover() called")
+    lines = ''.join(f"{i}ms move 1 0\n" for i in range(20))
+    job_id = engine.add_macro(compile_text(tmp_path, "0 press left\n" + lines))
+
+    deadline = time.monotonic() + 2.0
+    while engine.get_job(job_id)['active']:
+        assert time.monotonic() < deadline
+        time.sleep(0.005)
+    stats = engine.get_job_stats(job_id)
+    assert stats['errors'] == 1
+    assert engine._breaker.failures == 0
+    # The held button was released when the macro stopped
+    assert engine.backend.releases == 1
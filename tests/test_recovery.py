@@ -0,0 +1,106 @@
+"""Tests for the circuit breaker, back-off and rate-limited error log."""
+
+import pytest
+
+from gclicker import recovery
+from gclicker.recovery import MAX_BACKOFF, CircuitBreaker, ErrorLog, backoff_delay
+
+
+class FakeClock:
+    def __init__(self, now=100.0):
+        self.now = now
+
+    def monotonic(self):
+        return self.now
+
+
+@pytest.fixture
+def clock(monkeypatch):
+    clock = FakeClock()
+    monkeypatch.setattr(recovery, 'time', clock)
+    return clock
+
+
+def test_backoff_doubles_up_to_the_maximum():
+    assert [backoff_delay(attempt) for attempt in range(4)] == [0.5, 1.0, 2.0, 4.0]
+    assert backoff_delay(10) == MAX_BACKOFF
+    assert backoff_delay(10_000) == MAX_BACKOFF
+
+
+def test_breaker_opens_after_threshold_failures():
+    breaker = CircuitBreaker(threshold=3, base_delay=1.0)
+    assert breaker.record_failure(now=0.0) is None
+    assert breaker.record_failure(now=0.0) is None
+    assert breaker.allow(now=0.0)
+    assert breaker.record_failure(now=0.0) == 1.0
+    assert not breaker.allow(now=0.5)
+    assert breaker.allow(now=1.0)
+
+
+def test_failed_probe_reopens_with_longer_delay():
+    breaker = CircuitBreaker(threshold=2, base_delay=1.0, max_delay=5.0)
+    now = 0.0
+    delays = []
+    breaker.record_failure(now=now)
+    for _ in range(5):
+        delay = breaker.record_failure(now=now)
+        delays.append(delay)
+        now += delay
+        # Half-open: one probe is let through once the delay has passed
+        assert breaker.allow(now=now)
+    assert delays == [1.0, 2.0, 4.0, 5.0, 5.0]
+
+
+def test_success_closes_and_resets_backoff():
+    breaker = CircuitBreaker(threshold=1, base_delay=1.0)
+    assert breaker.record_failure(now=0.0) == 1.0
+    assert breaker.record_failure(now=1.0) == 2.0
+    assert breaker.record_success()
+    assert breaker.allow(now=1.0)
+    assert not breaker.record_success()  # Nothing to end
+    assert breaker.record_failure(now=2.0) == 1.0
+
+
+def test_breaker_uses_the_clock_by_default(clock):
+    breaker = CircuitBreaker(threshold=1, base_delay=2.0)
+    breaker.record_failure()
+    assert breaker.retry_at == 102.0
+    assert not breaker.allow()
+    clock.now = 102.0
+    assert breaker.allow()
+
+
+def test_error_log_summarizes_repeats(clock, capsys):
+    log = ErrorLog('Error clicking', interval=5.0)
+    log.report('portal gone')
+    for _ in range(9):
+        clock.now += 0.1
+        log.report('portal gone')
+    assert capsys.readouterr().out == "Error clicking: portal gone\n"
+
+    clock.now += 5.0
+    log.report('portal gone')
+    assert capsys.readouterr().out == "Error clicking: portal gone (repeated 10 times)\n"
+
+
+def test_error_log_new_message_flushes_repeats(clock, capsys):
+    log = ErrorLog('Error clicking')
+    log.report('a')
+    log.report('a')
+    log.report('b')
+    assert capsys.readouterr().out == (
+        "Error clicking: a\nError clicking: a (repeated 1 times)\nError clicking: b\n")
+
+    log.flush()
+    assert capsys.readouterr().out == ""
+    log.report('b')  # Printed again after flush()
+    assert capsys.readouterr().out == "Error clicking: b\n"
+
+
+def test_error_log_flush_prints_pending_summary(clock, capsys):
+    log = ErrorLog('Error')
+    log.report('x')
+    log.report('x')
+    capsys.readouterr()
+    log.flush()
+    assert capsys.readouterr().out == "Error: x (repeated 1 times)\n"
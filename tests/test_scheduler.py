@@ -0,0 +1,139 @@
+"""Tests for DeadlineScheduler, on a fake clock."""
+
+import pytest
+
+from gclicker import scheduler as scheduler_module
+from gclicker.engine import ClickEngine
+from gclicker.scheduler import MIN_INTERVAL, DeadlineScheduler
+
+
+class FakeClock:
+    """Stands in for the time module; every monotonic() call advances by step."""
+
+    def __init__(self, now=100.0, step=0.0):
+        self.now = now
+        self.step = step
+
+    def monotonic(self):
+        now = self.now
+        self.now += self.step
+        return now
+
+
+class FakeStopEvent:
+    """Records waits instead of sleeping, advancing the clock."""
+
+    def __init__(self, clock):
+        self.clock = clock
+        self.waits = []
+        self.spins = 0
+
+    def wait(self, timeout):
+        self.waits.append(timeout)
+        self.clock.now += timeout
+        return False
+
+    def is_set(self):
+        self.spins += 1
+        return False
+
+
+@pytest.fixture
+def clock(monkeypatch):
+    clock = FakeClock()
+    monkeypatch.setattr(scheduler_module, 'time', clock)
+    return clock
+
+
+def deadlines(scheduler, ticks_at):
+    """Tick at each given time and return the deadline each tick fired for."""
+    fired = []
+    for now in ticks_at:
+        scheduler.tick(now)
+        fired.append(scheduler.deadline)
+    return fired
+
+
+def test_deadlines_are_absolute(clock):
+    scheduler = DeadlineScheduler(0.1)
+    scheduler.reset(10.0)
+    # Firing a little late every time does not push later deadlines back
+    assert deadlines(scheduler, [10.02, 10.13, 10.21]) == pytest.approx([10.0, 10.1, 10.2])
+    assert scheduler.next_deadline == pytest.approx(10.3)
+    assert scheduler.lag == pytest.approx(0.01)
+    assert scheduler.max_lag == pytest.approx(0.03)
+    assert scheduler.missed == 0
+
+
+def test_skip_drops_missed_deadlines(clock):
+    scheduler = DeadlineScheduler(0.1, policy=DeadlineScheduler.SKIP)
+    scheduler.reset(10.0)
+    scheduler.tick(10.35)  # Deadlines 10.1, 10.2 and 10.3 have passed
+    assert scheduler.missed == 3
+    # The schedule resumes on its grid, not 0.1s after the late tick
+    assert scheduler.next_deadline == pytest.approx(10.4)
+
+
+def test_catch_up_fires_missed_deadlines_back_to_back(clock):
+    scheduler = DeadlineScheduler(0.1, policy=DeadlineScheduler.CATCH_UP)
+    scheduler.reset(10.0)
+    assert deadlines(scheduler, [10.35, 10.35, 10.35, 10.35]) == pytest.approx(
+        [10.0, 10.1, 10.2, 10.3])
+    assert scheduler.next_deadline == pytest.approx(10.4)
+    assert scheduler.missed == 0
+
+
+def test_catch_up_is_bounded(clock):
+    scheduler = DeadlineScheduler(0.1, policy=DeadlineScheduler.CATCH_UP, max_catch_up=5)
+    scheduler.reset(10.0)
+    scheduler.tick(12.05)  # 20 deadlines overdue after this one
+    assert scheduler.missed == 15
+    # Only the last max_catch_up overdue deadlines are fired
+    assert deadlines(scheduler, [12.05] * 5) == pytest.approx([11.6, 11.7, 11.8, 11.9, 12.0])
+    assert scheduler.next_deadline == pytest.approx(12.1)
+    assert scheduler.missed == 15
+
+
+def test_set_interval_keeps_phase_without_drift(clock):
+    scheduler = DeadlineScheduler(0.1)
+    scheduler.reset(10.0)
+    deadlines(scheduler, [10.0, 10.1])
+    scheduler.set_interval(0.05)
+    # The next deadline moves from 10.2 to 10.15, then keeps the new spacing
+    fired = deadlines(scheduler, [10.15 + 0.05 * i for i in range(1000)])
+    assert fired[0] == pytest.approx(10.15)
+    assert fired[-1] == pytest.approx(10.15 + 0.05 * 999)
+    assert scheduler.missed == 0
+
+
+def test_unknown_policy():
+    with pytest.raises(ValueError):
+        DeadlineScheduler(0.1, policy='later')
+
+
+def test_engine_clamps_to_min_interval():
+    engine = ClickEngine(interval=0.0)
+    assert engine.interval == MIN_INTERVAL
+    engine.set_interval(-1.0)
+    assert engine.interval == MIN_INTERVAL
+    assert engine._scheduler.interval == MIN_INTERVAL
+
+
+def test_sleep_until_spins_only_the_last_stretch(clock):
+    clock.step = 0.0001  # Each clock read in the spin loop takes 100us
+    scheduler = DeadlineScheduler(0.01, spin=0.0005)
+    stop = FakeStopEvent(clock)
+    assert scheduler.sleep_until(clock.now + 0.01, stop)
+
+    # One sleep up to 500us before the deadline, then about 5 spin iterations
+    assert len(stop.waits) == 1
+    assert stop.waits[0] == pytest.approx(0.0095, abs=0.0002)
+    assert 3 <= stop.spins <= 7
+
+
+def test_sleep_until_without_spin_only_sleeps(clock):
+    scheduler = DeadlineScheduler(0.01)
+    stop = FakeStopEvent(clock)
+    assert scheduler.sleep_until(clock.now + 0.01, stop)
+    assert stop.waits == [pytest.approx(0.01)]
+    assert stop.spins <= 1
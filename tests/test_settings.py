@@ -0,0 +1,122 @@
+"""Tests for Settings: debounced writes, merging saves and validation."""
+
+import json
+import os
+import time
+
+import pytest
+
+from gclicker import settings as settings_module
+from gclicker.settings import SCHEMA, Settings
+
+
+@pytest.fixture
+def config_home(tmp_path, monkeypatch):
+    monkeypatch.setenv('XDG_CONFIG_HOME', str(tmp_path))
+    monkeypatch.setattr(settings_module, 'SAVE_DELAY', 0.05)
+    return tmp_path
+
+
+def read_file(settings):
+    with open(settings.config_file) as f:
+        return json.load(f)
+
+
+def count_saves(settings, monkeypatch):
+    saves = []
+    save = settings.save
+
+    def counting_save():
+        saves.append(time.monotonic())
+        return save()
+
+    monkeypatch.setattr(settings, 'save', counting_save)
+    return saves
+
+
+def test_set_calls_are_written_once(config_home, monkeypatch):
+    settings = Settings()
+    saves = count_saves(settings, monkeypatch)
+    started = time.monotonic()
+    for i in range(10):
+        settings.set('spin', i / 10000)
+        time.sleep(0.01)  # Each set() pushes the write back again
+
+    time.sleep(0.2)
+    assert len(saves) == 1
+    # Written SAVE_DELAY after the last change, not after the first
+    assert saves[0] - started >= 0.1
+    assert read_file(settings) == {'spin': 0.0009}
+
+
+def test_flush_writes_now(config_home):
+    settings = Settings()
+    settings.set('backend', 'null')
+    settings.flush()
+    assert read_file(settings) == {'backend': 'null'}
+
+
+def test_save_keeps_keys_written_by_another_process(config_home):
+    first, second = Settings(), Settings()
+    second.set('backend', 'uinput')
+    second.flush()
+
+    # first has not reloaded, so its cache still has the old backend
+    first.set('interval', 0.25)
+    first.flush()
+
+    assert read_file(first) == {'backend': 'uinput', 'interval': 0.25}
+    assert first.get('backend') == 'portal'
+    assert first.reload() == {'backend'}
+    assert first.get('backend') == 'uinput'
+
+
+def test_reload_keeps_unsaved_changes(config_home, monkeypatch):
+    monkeypatch.setattr(settings_module, 'SAVE_DELAY', 60.0)
+    first, second = Settings(), Settings()
+    first.set('interval', 0.5)
+    second.set('interval', 0.2)
+    second.set('dispatch', 'async')
+    second.flush()
+
+    assert first.reload() == {'dispatch'}
+    assert first.get('interval') == 0.5
+    first.flush()
+    assert read_file(first)['interval'] == 0.5
+
+
+def test_invalid_values_fall_back_to_defaults(config_home, capsys):
+    os.makedirs(config_home / 'gclicker')
+    with open(config_home / 'gclicker' / 'settings.json', 'w') as f:
+        json.dump({'interval': -1, 'backend': 'x11', 'spin': 'fast', 'max_property_rate': 0,
+                   'dispatch': 'async', 'custom': [1, 2]}, f)
+
+    settings = Settings()
+    assert settings.get('interval') == SCHEMA['interval'].default
+    assert settings.get('backend') == SCHEMA['backend'].default
+    assert settings.get('spin') == SCHEMA['spin'].default
+    assert settings.get('max_property_rate') == SCHEMA['max_property_rate'].default
+    assert settings.get('dispatch') == 'async'
+    assert settings.get('custom') == [1, 2]
+    assert 'Ignoring setting interval' in capsys.readouterr().out
+
+
+def test_set_rejects_invalid_values(config_home):
+    settings = Settings()
+    with pytest.raises(ValueError):
+        settings.set('interval', 0.0)
+    with pytest.raises(ValueError):
+        settings.set('missed_policy', 'never')
+    with pytest.raises(ValueError):
+        settings.save_profile('bad', {'keep_alive': False})
+
+
+def test_unreadable_file_is_replaced_with_the_cache(config_home):
+    settings = Settings()
+    settings.config_dir.mkdir(parents=True, exist_ok=True)
+    settings.config_file.write_text('{not json')
+    settings.set('backend', 'null')
+    settings.flush()
+    data = read_file(settings)
+    assert data['backend'] == 'null'
+    assert data['interval'] == SCHEMA['interval'].default